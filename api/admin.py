@@ -1,11 +1,13 @@
 from django.contrib import admin
 from django.http import HttpResponseRedirect
+from django.shortcuts import get_object_or_404
 from django.urls import path, reverse
 from django.utils.html import format_html
 from django.contrib import messages
-import random
-import string
+from payments.paystack import PaystackError
+
 from .models import *
+from . import coupons, payouts
 
 class CouponAdmin(admin.ModelAdmin):
     list_display = ('coupon_code', 'package_info', 'status', 'used_by_info', 'created_at', 'copy_button')
@@ -73,7 +75,7 @@ class CouponAdmin(admin.ModelAdmin):
         """Helper method for admin actions"""
         try:
             package = Package.objects.get(package_type=package_type)
-            coupon = self._create_coupon(package)
+            coupon = self._create_coupon(package, request.user)
             
             message = format_html(
                 '✅ <strong>{} Coupon Generated!</strong><br>'
@@ -110,7 +112,7 @@ class CouponAdmin(admin.ModelAdmin):
     def _generate_coupon_view(self, request, package_type):
         try:
             package = Package.objects.get(package_type=package_type)
-            coupon = self._create_coupon(package)
+            coupon = self._create_coupon(package, request.user)
             
             message = format_html(
                 '✅ <strong>{} Coupon Generated!</strong><br>'
@@ -131,31 +133,8 @@ class CouponAdmin(admin.ModelAdmin):
         
         return HttpResponseRedirect(reverse('admin:api_coupon_changelist'))
     
-    def _create_coupon(self, package):
-        prefix_map = {
-            'pro': 'METAPRO',
-            'silver': 'METASIL'
-        }
-        prefix = prefix_map.get(package.package_type, 'META')
-        
-        # Generate unique coupon code
-        attempts = 0
-        while attempts < 10:
-            random_digits = ''.join(random.choices(string.digits, k=6))
-            coupon_code = f"{prefix}{random_digits}"
-            if not Coupon.objects.filter(coupon_code=coupon_code).exists():
-                break
-            attempts += 1
-        else:
-            import time
-            timestamp = str(int(time.time()))[-6:].zfill(6)
-            coupon_code = f"{prefix}{timestamp}"
-        
-        return Coupon.objects.create(
-            coupon_code=coupon_code,
-            package=package,
-            price_paid=package.price
-        )
+    def _create_coupon(self, package, operator=None):
+        return coupons.mint(package, 1, operator=operator).coupons.get()
 
     class Media:
         js = ('admin/js/coupon_copy.js',)
@@ -188,6 +167,7 @@ class UserProfileAdmin(admin.ModelAdmin):
 class PackageAdmin(admin.ModelAdmin):
     list_display = ('name', 'package_type', 'price_display', 'referral_bonus_display', 'daily_login_bonus_display')
     list_filter = ('package_type',)
+    actions = ['mint_1000_coupons']
     
     def price_display(self, obj):
         return f"₦{obj.price:.2f}"
@@ -200,6 +180,49 @@ class PackageAdmin(admin.ModelAdmin):
     def daily_login_bonus_display(self, obj):
         return f"₦{obj.daily_login_bonus:.2f}"
     daily_login_bonus_display.short_description = 'Daily Login Bonus'
+    
+    def mint_1000_coupons(self, request, queryset):
+        """Mint 1,000 coupons for one selected package and download them as CSV"""
+        if queryset.count() != 1:
+            self.message_user(request, '❌ Select exactly one package to mint coupons for', messages.ERROR)
+            return None
+        batch = coupons.mint(queryset.get(), 1000, operator=request.user)
+        return coupons.coupon_csv_response(batch)
+    mint_1000_coupons.short_description = "🎟️ Mint 1,000 coupons (CSV download)"
+
+# CouponBatchAdmin
+class CouponBatchAdmin(admin.ModelAdmin):
+    """Adding a batch mints its coupons; each batch's CSV can be downloaded again"""
+    list_display = ('id', 'package', 'quantity', 'created_at', 'created_by', 'download_link')
+    list_filter = ('package',)
+    list_select_related = ('package', 'created_by')
+    fields = ('package', 'quantity', 'created_at', 'created_by')
+    
+    def get_readonly_fields(self, request, obj=None):
+        if obj:
+            return ('package', 'quantity', 'created_at', 'created_by')
+        return ('created_at', 'created_by')
+    
+    def save_model(self, request, obj, form, change):
+        if change:
+            return
+        batch = coupons.mint(obj.package, obj.quantity, operator=request.user)
+        obj.pk, obj.created_at, obj.created_by = batch.pk, batch.created_at, batch.created_by
+    
+    def get_urls(self):
+        urls = super().get_urls()
+        custom_urls = [
+            path('<int:batch_id>/coupons.csv', self.admin_site.admin_view(self.coupon_file_view), name='coupon_batch_file'),
+        ]
+        return custom_urls + urls
+    
+    def coupon_file_view(self, request, batch_id):
+        batch = get_object_or_404(CouponBatch.objects.select_related('package'), pk=batch_id)
+        return coupons.coupon_csv_response(batch)
+    
+    def download_link(self, obj):
+        return format_html('<a href="{}">Coupons CSV</a>', reverse('admin:coupon_batch_file', args=[obj.pk]))
+    download_link.short_description = 'Coupons'
 
 # ContentSubmissionAdmin
 class ContentSubmissionAdmin(admin.ModelAdmin):
@@ -207,12 +230,25 @@ class ContentSubmissionAdmin(admin.ModelAdmin):
     list_filter = ('platform', 'status', 'submission_date')
     search_fields = ('user__username', 'description')
     readonly_fields = ('submission_date',)
+    actions = ['approve_submissions', 'mark_submissions_paid']
     
     def username(self, obj):
         return obj.user.username if obj.user else "No User"
     username.short_description = 'User'
     username.admin_order_field = 'user__username'
     
+    def approve_submissions(self, request, queryset):
+        """Approve the selected pending submissions in bulk"""
+        count = queryset.approve()
+        self.message_user(request, f'✅ Approved {count} pending submissions', messages.SUCCESS)
+    approve_submissions.short_description = "✅ Approve selected pending submissions"
+    
+    def mark_submissions_paid(self, request, queryset):
+        """Pay the selected approved submissions into their owners' wallets in bulk"""
+        count = queryset.mark_paid()
+        self.message_user(request, f'💰 Marked {count} approved submissions as paid', messages.SUCCESS)
+    mark_submissions_paid.short_description = "💰 Mark selected approved submissions as paid"
+    
     def status_badge(self, obj):
         status_colors = {
             'pending': '#ffc107',
@@ -289,10 +325,17 @@ class GameParticipationAdmin(admin.ModelAdmin):
 
 # TransactionAdmin
 class TransactionAdmin(admin.ModelAdmin):
-    list_display = ('username', 'amount_display', 'transaction_type_badge', 'date', 'description_short')
+    list_display = ('username', 'amount_display', 'wallet_amount', 'transaction_type_badge', 'date', 'description_short')
     list_filter = ('transaction_type', 'date')
     search_fields = ('user__username', 'description')
     
+    # The ledger is append-only; corrections are new transactions
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+    
     def username(self, obj):
         return obj.user.username if obj.user else "No User"
     username.short_description = 'User'
@@ -334,6 +377,63 @@ class WithdrawalRequestAdmin(admin.ModelAdmin):
     list_display = ('username', 'amount_display', 'bank_name', 'account_number', 'status_badge', 'created_at', 'priority_badge')
     list_filter = ('status', 'created_at')
     search_fields = ('user__username', 'bank_name', 'account_number')
+    actions = ['claim_payout_batch', 'claim_and_send_transfers']
+    
+    def formfield_for_dbfield(self, db_field, request, **kwargs):
+        formfield = super().formfield_for_dbfield(db_field, request, **kwargs)
+        if db_field.name == 'status':
+            formfield.help_text = (
+                'Processing sends the transfer through Paystack (when Paystack is configured). '
+                'Completed straight from Pending records a payout made outside Paystack; nothing is sent. '
+                'Failed refunds the amount to the wallet. Completed and Failed are final.'
+            )
+        return formfield
+    
+    def get_queryset(self, request):
+        # Priority comes from the joins, not two lookups per row
+        return super().get_queryset(request).select_related('user').with_priority()
+    
+    def get_urls(self):
+        urls = super().get_urls()
+        custom_urls = [
+            path('claim-next-batch/', self.admin_site.admin_view(self.claim_next_batch_view), name='claim_next_payout_batch'),
+        ]
+        return custom_urls + urls
+    
+    def claim_next_batch_view(self, request):
+        """Claim the next ?size= (default 100) pending withdrawals in priority order and download their payout file"""
+        try:
+            size = max(1, int(request.GET.get('size', 100)))
+        except ValueError:
+            size = 100
+        batch = payouts.claim_batch(size=size, operator=request.user)
+        if batch is None:
+            messages.info(request, 'No pending withdrawals to claim')
+            return HttpResponseRedirect(reverse('admin:api_withdrawalrequest_changelist'))
+        return payouts.payout_csv_response(batch)
+    
+    def claim_payout_batch(self, request, queryset):
+        """Claim the selected pending withdrawals as one batch and download its payout file"""
+        batch = payouts.claim_batch(size=queryset.count(), operator=request.user, withdrawals=queryset)
+        if batch is None:
+            self.message_user(request, 'None of the selected withdrawals are pending (or another operator claimed them)', messages.WARNING)
+            return None
+        return payouts.payout_csv_response(batch)
+    claim_payout_batch.short_description = "🏦 Claim selected pending withdrawals and export payout CSV"
+    
+    def claim_and_send_transfers(self, request, queryset):
+        """Claim the selected pending withdrawals as one batch and pay them through Paystack transfers"""
+        batch = payouts.claim_batch(size=queryset.count(), operator=request.user, withdrawals=queryset)
+        if batch is None:
+            self.message_user(request, 'None of the selected withdrawals are pending (or another operator claimed them)', messages.WARNING)
+            return
+        try:
+            sent = payouts.send_transfers(batch.withdrawals.all())
+        except PaystackError as e:
+            self.message_user(request, f'❌ Batch {batch.pk} claimed but Paystack failed: {e}. Resend with claim_payout_batch --resend {batch.pk}', messages.ERROR)
+            return
+        self.message_user(request, f'✅ Batch {batch.pk}: {sent} of {batch.withdrawal_count} transfers submitted to Paystack', messages.SUCCESS)
+    claim_and_send_transfers.short_description = "💸 Claim selected pending withdrawals and pay via Paystack"
     
     def username(self, obj):
         return obj.user.username if obj.user else "No User"
@@ -371,16 +471,88 @@ class WithdrawalRequestAdmin(admin.ModelAdmin):
             obj.priority
         )
     priority_badge.short_description = 'Priority'
+    priority_badge.admin_order_field = 'queue_priority'
+
+# PayoutBatchAdmin
+class PayoutBatchAdmin(admin.ModelAdmin):
+    list_display = ('id', 'created_at', 'created_by', 'withdrawal_count', 'total_display', 'download_link')
+    readonly_fields = ('created_at', 'created_by', 'withdrawal_count', 'total_amount')
+    list_select_related = ('created_by',)
+    
+    def get_urls(self):
+        urls = super().get_urls()
+        custom_urls = [
+            path('<int:batch_id>/payout-file/', self.admin_site.admin_view(self.payout_file_view), name='payout_batch_file'),
+        ]
+        return custom_urls + urls
+    
+    def payout_file_view(self, request, batch_id):
+        """Re-download a batch's payout file"""
+        batch = get_object_or_404(PayoutBatch, pk=batch_id)
+        return payouts.payout_csv_response(batch)
+    
+    def total_display(self, obj):
+        return f"₦{obj.total_amount:.2f}"
+    total_display.short_description = 'Total'
+    
+    def download_link(self, obj):
+        return format_html('<a href="{}">Payout CSV</a>', reverse('admin:payout_batch_file', args=[obj.pk]))
+    download_link.short_description = 'Payout file'
+
+# PaystackEventAdmin
+class PaystackEventAdmin(admin.ModelAdmin):
+    list_display = ('event_id', 'event', 'received_at', 'processed_at', 'attempts', 'error_short')
+    list_filter = ('event', 'processed_at')
+    search_fields = ('event_id',)
+    readonly_fields = ('event_id', 'event', 'payload', 'received_at', 'processed_at', 'attempts', 'error')
+    actions = ['retry_events']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def error_short(self, obj):
+        return obj.error[:60] + '...' if len(obj.error) > 60 else obj.error
+    error_short.short_description = 'Error'
+    
+    def retry_events(self, request, queryset):
+        """Put unprocessed events back on the worker's queue"""
+        updated = queryset.filter(processed_at__isnull=True).update(attempts=0, error='')
+        self.message_user(request, f'🔁 {updated} events queued for processing again')
+    retry_events.short_description = "Retry selected unprocessed events"
+
+# OutboxMessageAdmin
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ('id', 'topic', 'created_at', 'processed_at', 'attempts', 'error_short')
+    list_filter = ('topic', 'processed_at')
+    readonly_fields = ('topic', 'payload', 'created_at', 'processed_at', 'attempts', 'error')
+    actions = ['retry_messages']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def error_short(self, obj):
+        return obj.error[:60] + '...' if len(obj.error) > 60 else obj.error
+    error_short.short_description = 'Error'
+    
+    def retry_messages(self, request, queryset):
+        """Put unprocessed messages back on the worker's queue"""
+        updated = queryset.filter(processed_at__isnull=True).update(attempts=0, error='')
+        self.message_user(request, f'🔁 {updated} outbox messages queued for processing again')
+    retry_messages.short_description = "Retry selected unprocessed messages"
 
 # Register all models with their admin classes
 admin.site.register(Package, PackageAdmin)
 admin.site.register(Coupon, CouponAdmin)
+admin.site.register(CouponBatch, CouponBatchAdmin)
 admin.site.register(UserProfile, UserProfileAdmin)
 admin.site.register(ContentSubmission, ContentSubmissionAdmin)
 admin.site.register(Referral, ReferralAdmin)
 admin.site.register(GameParticipation, GameParticipationAdmin)
 admin.site.register(Transaction, TransactionAdmin)
 admin.site.register(WithdrawalRequest, WithdrawalRequestAdmin)
+admin.site.register(PayoutBatch, PayoutBatchAdmin)
+admin.site.register(PaystackEvent, PaystackEventAdmin)
+admin.site.register(OutboxMessage, OutboxMessageAdmin)
 
 # Admin site customization
 admin.site.site_header = "🎯 META_SHARK Admin"
@@ -3,4 +3,7 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
-    verbose_name = 'META_SHARK ADMIN'  # Add this line
\ No newline at end of file
+    verbose_name = 'META_SHARK ADMIN'  # Add this line
+    
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,111 @@
+"""Async versions of the endpoints that check a password, served by backend/asgi.py.
+
+Under ASGI every sync view runs on one shared thread, so a login's PBKDF2
+hash would hold up every other request in the process. These views do the
+hashing on api.hashing.pool and the database work through sync_to_async,
+and answer 503 straight away when the pool is full (see api/hashing.py).
+backend/urls_asgi.py routes the login and withdrawal URLs here; WSGI keeps
+the sync views in api/views.py.
+"""
+import logging
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.http import JsonResponse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+
+from . import hashing, idempotency, views
+from .log import AUDIT
+from .serializers import LoginSerializer
+
+logger = logging.getLogger(__name__)
+
+# Seconds a shed client is told to wait before retrying
+RETRY_AFTER = 1
+
+withdrawals = views.WithdrawalViewSet.as_view({'get': 'list', 'post': 'create'})
+
+
+def busy():
+    response = JsonResponse({'error': 'Server busy, please try again in a moment'}, status=503)
+    response['Retry-After'] = str(RETRY_AFTER)
+    return response
+
+
+class AsyncView(View):
+    """Plain async Django view; CSRF-exempt like DRF's APIView (these use token auth)"""
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        return csrf_exempt(super().as_view(**initkwargs))
+
+
+class LoginView(AsyncView):
+    async def post(self, request):
+        serializer = LoginSerializer(data=Request(request, parsers=views.LoginView().get_parsers()).data)
+        if not serializer.is_valid():
+            return JsonResponse(serializer.errors, status=400)
+
+        data = serializer.validated_data
+        user = await User.objects.filter(username=data['username']).afirst()
+        try:
+            valid = await hashing.check_password(user, data['password'])
+        except hashing.PoolBusy:
+            logger.warning('Login shed: hashing pool full', extra={'pending': hashing.pool.pending})
+            return busy()
+
+        if not valid or not user.is_active:
+            logger.info('Login failed', extra={'username': data['username'], **AUDIT})
+            return JsonResponse({'error': 'Invalid username or password'}, status=400)
+
+        payload = await sync_to_async(views.login_response_data)(
+            user, data.get('phone_number', ''), data.get('whatsapp_number', '')
+        )
+        logger.info('Login succeeded', extra={'user_id': user.id, **AUDIT})
+        return JsonResponse(payload)
+
+
+def withdrawal_credentials(request):
+    """(user, password) to check before the viewset runs, using its own authenticators and parsers.
+
+    The user is None when there is nothing to check here: anonymous requests,
+    and retries whose Idempotency-Key response is cached (the viewset replays
+    it without looking at the password, and a retry mustn't cost a hash).
+    """
+    viewset = views.WithdrawalViewSet()
+    # Read the body now so the viewset can parse it again afterwards
+    request.body
+    drf_request = Request(request, parsers=viewset.get_parsers(), authenticators=viewset.get_authenticators())
+    try:
+        user = drf_request.user
+    except APIException:
+        return None, None
+    if not user.is_authenticated or idempotency.has_stored_response(request, user.pk):
+        return None, None
+    return user, drf_request.data.get('password')
+
+
+class WithdrawalView(AsyncView):
+    """GET lists and POST creates, as WithdrawalViewSet does; POST checks the password here first"""
+
+    async def get(self, request, *args, **kwargs):
+        return await sync_to_async(withdrawals)(request, *args, **kwargs)
+
+    async def post(self, request, *args, **kwargs):
+        user, password = await sync_to_async(withdrawal_credentials)(request)
+        # Anonymous, a replay or no password: nothing to hash, the viewset answers as usual
+        if user is not None and password:
+            try:
+                valid = await hashing.check_password(user, str(password))
+            except hashing.PoolBusy:
+                logger.warning('Withdrawal shed: hashing pool full', extra={'user_id': user.id})
+                return busy()
+            if not valid:
+                return JsonResponse(
+                    {"error": "Invalid password. Please check your password and try again."}, status=400
+                )
+            request.password_checked = True
+        return await sync_to_async(withdrawals)(request, *args, **kwargs)
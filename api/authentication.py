@@ -1,7 +1,9 @@
 import jwt
 from django.conf import settings
+from django.core.cache import cache
 from rest_framework import authentication, exceptions
 from django.contrib.auth.models import User
+from .cache import auth_user_key
 
 class JWTAuthentication(authentication.BaseAuthentication):
     def authenticate(self, request):
@@ -16,17 +18,40 @@ class JWTAuthentication(authentication.BaseAuthentication):
                 return None
             
             payload = jwt.decode(token, settings.SECRET_KEY, algorithms=['HS256'])
-            user = User.objects.get(id=payload['user_id'])
+            user = self.get_user(payload)
             return (user, token)
             
         except jwt.ExpiredSignatureError:
             raise exceptions.AuthenticationFailed('Token expired')
         except jwt.InvalidTokenError:
             raise exceptions.AuthenticationFailed('Invalid token')
+        except exceptions.AuthenticationFailed:
+            raise
         except User.DoesNotExist:
             raise exceptions.AuthenticationFailed('User not found')
         except Exception:
             return None
+    
+    def get_user(self, payload):
+        return User.objects.get(id=payload['user_id'])
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication that caches the user + profile + package bundle.
+
+    The bundle is keyed by user id, lives for AUTH_USER_CACHE_TIMEOUT seconds
+    and is dropped whenever the User or UserProfile is saved (see signals.py),
+    so warm requests run no auth-related queries. Inactive users are refused,
+    as simplejwt's JWTAuthentication does.
+    """
+    def get_user(self, payload):
+        key = auth_user_key(payload['user_id'])
+        user = cache.get(key)
+        if user is None:
+            user = User.objects.select_related('userprofile__package').get(id=payload['user_id'])
+            cache.set(key, user, settings.AUTH_USER_CACHE_TIMEOUT)
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed('User is inactive')
+        return user
 
 def create_jwt_token(user):
     payload = {
@@ -0,0 +1,72 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.response import Response
+
+# Views whose payload is cached per user and dropped on any wallet/ledger write
+CACHED_VIEWS = ('dashboard', 'wallet', 'profile')
+
+STATS_KEY = 'user_cache:stats:{}'
+
+
+def cache_key(name, user_id):
+    return f'user_cache:{name}:{user_id}'
+
+
+def auth_user_key(user_id):
+    return f'auth_user:{user_id}'
+
+
+def _count(stat):
+    key = STATS_KEY.format(stat)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Counter not created yet (or evicted)
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def get_stats():
+    """Hit/miss/invalidation counters shared by every worker using this cache"""
+    stats = {stat: cache.get(STATS_KEY.format(stat), 0) for stat in ('hits', 'misses', 'invalidations')}
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+    return stats
+
+
+def cached_user_response(name, user, build):
+    """Return the cached payload for ``name`` or build, cache and return it.
+
+    ``build`` must return a Response; only 200 responses are cached.
+    """
+    key = cache_key(name, user.pk)
+    data = cache.get(key)
+    if data is not None:
+        _count('hits')
+        response = Response(data)
+        response['X-Cache'] = 'HIT'
+        return response
+    
+    _count('misses')
+    response = build()
+    if response.status_code == 200:
+        cache.set(key, response.data, settings.USER_CACHE_TIMEOUT)
+    response['X-Cache'] = 'MISS'
+    return response
+
+
+def invalidate_user(user_id):
+    """Drop every cached payload for a user, now and again once the write commits"""
+    keys = [cache_key(name, user_id) for name in CACHED_VIEWS]
+    cache.delete_many(keys)
+    _count('invalidations')
+    # A read between now and commit would re-cache the old state
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def invalidate_auth_user(user_id):
+    """Drop the cached authentication bundle (user + profile + package)"""
+    key = auth_user_key(user_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
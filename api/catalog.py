@@ -0,0 +1,75 @@
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+VERSION_KEY = 'package_catalog:version'
+
+# How often (seconds) a process re-checks the shared version number
+CHECK_INTERVAL = 1.0
+
+
+class PackageCatalog:
+    """Process-wide copy of the serialized Package rows.
+
+    There are only a handful of packages, so every process keeps them all in
+    memory and re-reads them only when the shared version number (bumped on
+    any Package save/delete) moves.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._packages = None
+        self._version = None
+        self._checked_at = 0.0
+    
+    def _shared_version(self):
+        version = cache.get(VERSION_KEY)
+        if version is None:
+            cache.add(VERSION_KEY, 1, timeout=None)
+            version = cache.get(VERSION_KEY, 1)
+        return version
+    
+    def _ensure_fresh(self):
+        now = time.monotonic()
+        if self._packages is not None and now - self._checked_at < CHECK_INTERVAL:
+            return self._packages
+        
+        with self._lock:
+            version = self._shared_version()
+            if self._packages is None or version != self._version:
+                from .models import Package
+                from .serializers import PackageSerializer
+                self._packages = {
+                    package.pk: dict(PackageSerializer(package).data)
+                    for package in Package.objects.all()
+                }
+                self._version = version
+            self._checked_at = now
+            return self._packages
+    
+    def get(self, package_id):
+        """Serialized package (same shape as PackageSerializer) or None"""
+        if package_id is None:
+            return None
+        package = self._ensure_fresh().get(package_id)
+        return dict(package) if package is not None else None
+    
+    def all(self):
+        return [dict(package) for package in self._ensure_fresh().values()]
+    
+    def invalidate(self):
+        """Drop this process's copy and make every other process reload too"""
+        self._packages = None
+        self._bump_version()
+        transaction.on_commit(self._bump_version)
+    
+    def _bump_version(self):
+        self._packages = None
+        try:
+            cache.incr(VERSION_KEY)
+        except ValueError:
+            cache.add(VERSION_KEY, 1, timeout=None)
+
+
+package_catalog = PackageCatalog()
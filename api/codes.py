@@ -0,0 +1,98 @@
+"""Short, typeable codes handed to users.
+
+Referral codes are derived from the user id instead of drawn at random: the
+id goes through a keyed Feistel permutation (so consecutive sign-ups don't
+get consecutive-looking codes) and is written in Crockford base32, which
+has no I/L/O/U to misread. A permutation of a unique id is itself unique,
+so allocation needs no lookups and no retries at any scale, and the code
+decodes back to the user id.
+
+    MS + 6 characters  for user ids below 2**30
+    MS + 8 characters  up to 2**40
+
+Legacy codes (META + 4 digits) can't clash: no new code starts with ME.
+
+Coupon codes are random_code() behind a package prefix; see api/coupons.py.
+"""
+import secrets
+
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+_DECODE = {char: value for value, char in enumerate(ALPHABET)}
+_DECODE.update({'O': 0, 'I': 1, 'L': 1})
+
+REFERRAL_PREFIX = 'MS'
+
+# Changing these keys would re-map ids onto codes already handed out: never edit them
+_ROUND_KEYS = (0x2C1B3C6D, 0x297A2D39, 0x6B1E3F85, 0x1F3D5B79)
+
+# (characters, bits) per code width, shortest first
+_WIDTHS = ((6, 30), (8, 40))
+
+
+def _round(half, key, bits):
+    mixed = (half * 0x9E3779B1 + key) & 0xFFFFFFFF
+    mixed ^= mixed >> 15
+    mixed = (mixed * 0x85EBCA77) & 0xFFFFFFFF
+    mixed ^= mixed >> 13
+    return mixed & ((1 << bits) - 1)
+
+
+def _permute(value, bits, keys):
+    half = bits // 2
+    mask = (1 << half) - 1
+    left, right = value >> half, value & mask
+    for key in keys:
+        left, right = right, left ^ _round(right, key, half)
+    return (left << half) | right
+
+
+def _unpermute(value, bits, keys):
+    half = bits // 2
+    mask = (1 << half) - 1
+    left, right = value >> half, value & mask
+    for key in reversed(keys):
+        left, right = right ^ _round(left, key, half), left
+    return (left << half) | right
+
+
+def _encode(value, length):
+    chars = []
+    for _ in range(length):
+        value, digit = divmod(value, 32)
+        chars.append(ALPHABET[digit])
+    return ''.join(reversed(chars))
+
+
+def random_code(length):
+    """``length`` random base32 characters (5 bits of entropy each)"""
+    return _encode(secrets.randbits(5 * length), length)
+
+
+def referral_code(user_id):
+    """The referral code for a user id: unique per id, no database access needed"""
+    for length, bits in _WIDTHS:
+        if user_id < 1 << bits:
+            return REFERRAL_PREFIX + _encode(_permute(user_id, bits, _ROUND_KEYS), length)
+    raise ValueError(f'User id {user_id} is too large for a referral code')
+
+
+def normalize(code):
+    """Codes as users type them: any case, with stray spaces or dashes"""
+    return (code or '').strip().upper().replace('-', '').replace(' ', '')
+
+
+def referral_code_user_id(code):
+    """User id a (new-style) referral code was derived from, or None"""
+    code = normalize(code)
+    if not code.startswith(REFERRAL_PREFIX):
+        return None
+    body = code[len(REFERRAL_PREFIX):]
+    for length, bits in _WIDTHS:
+        if len(body) == length:
+            value = 0
+            for char in body:
+                if char not in _DECODE:
+                    return None
+                value = value * 32 + _DECODE[char]
+            return _unpermute(value, bits, _ROUND_KEYS)
+    return None
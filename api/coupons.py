@@ -0,0 +1,253 @@
+"""Coupon minting, redemption and the code filter in front of validation.
+
+mint() generates the batch's codes in memory and inserts them with
+bulk_create(ignore_conflicts=True): a code that happens to exist already is
+silently skipped, counted as a shortfall and topped up in the next round.
+With 50 random bits per code a round almost never comes up short, so a
+batch costs one INSERT per 5,000 coupons plus a count per round.
+
+redeem() claims a coupon with one conditional UPDATE, so of two sign-ups
+racing for the same code exactly one gets it.
+
+coupon_filter is a per-process Bloom filter of every coupon code; the
+public validate endpoints ask it first, so guessed codes are turned away
+without a database query. New coupons are added to it as they are minted,
+and other processes read only the new rows; the full rebuild runs in a
+background thread.
+"""
+import csv
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from .codes import random_code
+from .models import Coupon, CouponBatch
+from .streaming import Echo
+
+# Random characters after the package prefix (10 x 5 = 50 bits)
+CODE_LENGTH = 10
+
+PREFIXES = {
+    'pro': 'METAPRO',
+    'silver': 'METASIL',
+}
+
+# Top-up rounds before giving up (each round fills every shortfall of the last)
+MAX_ROUNDS = 5
+
+COUPON_CSV_COLUMNS = ['coupon_code', 'package', 'price', 'batch', 'created_at']
+
+FILTER_VERSION_KEY = 'coupon_filter:version'
+
+# How often (seconds) a process re-checks the shared filter version
+CHECK_INTERVAL = 1.0
+
+
+class CouponUnavailable(Exception):
+    """The coupon was redeemed by someone else first"""
+    pass
+
+
+def coupon_prefix(package):
+    return PREFIXES.get(package.package_type, 'META')
+
+
+def mint(package, quantity, operator=None, batch_size=5000):
+    """Create a CouponBatch of ``quantity`` new, unused coupons for ``package``"""
+    if not 1 <= quantity <= CouponBatch.MAX_QUANTITY:
+        raise ValueError(f'Quantity must be between 1 and {CouponBatch.MAX_QUANTITY}')
+
+    prefix = coupon_prefix(package)
+    with transaction.atomic():
+        batch = CouponBatch.objects.create(package=package, quantity=quantity, created_by=operator)
+        minted = 0
+        for _ in range(MAX_ROUNDS):
+            codes = set()
+            while len(codes) < quantity - minted:
+                codes.add(prefix + random_code(CODE_LENGTH))
+            Coupon.objects.bulk_create(
+                [Coupon(coupon_code=code, package=package, batch=batch, price_paid=package.price) for code in codes],
+                batch_size=batch_size,
+                ignore_conflicts=True
+            )
+            minted = batch.coupons.count()
+            if minted == quantity:
+                coupon_filter.added(batch.coupons.order_by('pk').values_list('pk', 'coupon_code'))
+                return batch
+        raise RuntimeError(f'Could only mint {minted} of {quantity} unique coupon codes')
+
+
+def coupon_rows(batch):
+    """The batch's coupons as CSV lines, read from the database in chunks"""
+    writer = csv.writer(Echo())
+    yield writer.writerow(COUPON_CSV_COLUMNS)
+    package = batch.package
+    coupons = batch.coupons.order_by('id').values_list('coupon_code', 'created_at')
+    for coupon_code, created_at in coupons.iterator(chunk_size=2000):
+        yield writer.writerow([coupon_code, package.package_type, package.price, batch.pk, created_at.isoformat()])
+
+
+def coupon_csv_response(batch):
+    response = StreamingHttpResponse(coupon_rows(batch), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="coupon-batch-{batch.pk}-{batch.package.package_type}.csv"'
+    return response
+
+
+def redeem(coupon, user):
+    """Mark ``coupon`` used by ``user`` if it is still unused, in one UPDATE.
+
+    Raises CouponUnavailable when another redemption got there first; call it
+    inside the transaction creating the account so that one rolls back too.
+    """
+    now = timezone.now()
+    if not Coupon.objects.filter(pk=coupon.pk, is_used=False).update(is_used=True, used_by=user, used_at=now):
+        raise CouponUnavailable(coupon.coupon_code)
+    coupon.is_used, coupon.used_by, coupon.used_at = True, user, now
+
+
+class BloomFilter:
+    """Set membership in about 10 bits per item: never a false negative, ~1% false positives at capacity"""
+
+    def __init__(self, capacity, error_rate=0.01):
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        first, step = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return [(first + n * step) % self.size for n in range(self.hashes)]
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+
+class CouponCodeFilter:
+    """Process-wide Bloom filter of every coupon code.
+
+    A code the filter hasn't seen can't be a coupon. Codes are never removed
+    (a Bloom filter can't forget), so redeemed ones still pass and are turned
+    away by the database lookup that follows.
+
+    Only a process's first check scans the whole table. New coupons are added
+    by the process that creates them, which also bumps a shared version
+    number and publishes the lowest new coupon id under it; other processes
+    then read just the rows from that id on. Every COUPON_FILTER_MAX_AGE
+    seconds the filter is rebuilt from scratch in a background thread (in
+    case a version was missed, e.g. with a per-process cache backend) while
+    requests keep using the current one.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._filter = None
+        self._version = None
+        self._max_id = 0
+        self._checked_at = 0.0
+        self._built_at = 0.0
+        self._count = 0
+        self._rebuilder = None
+
+    def _build(self):
+        """(filter, highest coupon id) from every coupon"""
+        bloom = BloomFilter(max(settings.COUPON_FILTER_CAPACITY, self._count * 2))
+        count = max_id = 0
+        for pk, code in Coupon.objects.order_by().values_list('pk', 'coupon_code').iterator(chunk_size=10000):
+            bloom.add(code)
+            count += 1
+            max_id = max(max_id, pk)
+        self._count = count
+        return bloom, max_id
+
+    def _add(self, bloom, rows):
+        for pk, code in rows:
+            bloom.add(code)
+            self._max_id = max(self._max_id, pk)
+
+    def _catch_up(self, version):
+        """Add the coupons created since self._version; False if some version's first id is gone from the cache"""
+        # No version when the filter was built, or a lower one now: the cache was reset and counts from 1 again
+        seen = self._version if self._version is not None and self._version < version else 0
+        versions = range(seen + 1, version + 1)
+        first_ids = cache.get_many([f'{FILTER_VERSION_KEY}:{number}' for number in versions])
+        # A concurrent mint may commit lower ids after higher ones: start from the lowest published id
+        since = min([self._max_id + 1, *first_ids.values()])
+        self._add(self._filter, Coupon.objects.filter(pk__gte=since).values_list('pk', 'coupon_code'))
+        return len(first_ids) == len(versions)
+
+    def _rebuild(self):
+        try:
+            # The version before the scan: anything minted during it is caught up afterwards
+            version = cache.get(FILTER_VERSION_KEY)
+            bloom, max_id = self._build()
+            with self._lock:
+                self._filter, self._max_id, self._built_at = bloom, max_id, time.monotonic()
+                self._version = version if version is not None else self._version
+                self._checked_at = 0.0
+        finally:
+            connection.close()
+            self._rebuilder = None
+
+    def _rebuild_in_background(self):
+        if self._rebuilder is None:
+            self._rebuilder = threading.Thread(target=self._rebuild, name='coupon-filter', daemon=True)
+            self._rebuilder.start()
+
+    def _ensure_fresh(self):
+        now = time.monotonic()
+        if self._filter is not None and now - self._checked_at < CHECK_INTERVAL:
+            return self._filter
+
+        with self._lock:
+            version = cache.get(FILTER_VERSION_KEY)
+            if self._filter is None:
+                self._filter, self._max_id = self._build()
+                self._built_at = now
+            # A missing version (cache cleared or evicted) isn't a mint; keep the filter
+            elif version is not None and version != self._version:
+                if not self._catch_up(version):
+                    self._rebuild_in_background()
+            if now - self._built_at > settings.COUPON_FILTER_MAX_AGE:
+                self._rebuild_in_background()
+            if version is not None:
+                self._version = version
+            self._checked_at = now
+            return self._filter
+
+    def might_contain(self, code):
+        """False only if ``code`` is certainly not a coupon"""
+        return bool(code) and isinstance(code, str) and code in self._ensure_fresh()
+
+    def added(self, rows):
+        """Add new coupons, given as (pk, coupon_code) rows, here and in every other process, now and once they commit"""
+        rows = list(rows)
+        if rows:
+            self._publish(rows)
+            transaction.on_commit(lambda: self._publish(rows))
+
+    def _publish(self, rows):
+        try:
+            version = cache.incr(FILTER_VERSION_KEY)
+        except ValueError:
+            cache.add(FILTER_VERSION_KEY, 1, timeout=None)
+            version = cache.get(FILTER_VERSION_KEY, 1)
+        cache.set(f'{FILTER_VERSION_KEY}:{version}', min(pk for pk, _ in rows), timeout=settings.COUPON_FILTER_MAX_AGE)
+        with self._lock:
+            if self._filter is not None:
+                self._add(self._filter, rows)
+                # Nobody else minted in between: this process is up to date without reading anything
+                if self._version == version - 1:
+                    self._version = version
+
+
+coupon_filter = CouponCodeFilter()
@@ -0,0 +1,106 @@
+"""Password checks off the event loop, for the async views in api/async_views.py.
+
+A PBKDF2 check is a few hundred milliseconds of CPU. In a sync worker that
+is the whole worker; under ASGI, Django runs sync code on one shared thread,
+so it would be every request in the process. HashingPool runs the hashing
+on a small thread pool instead (hashlib releases the GIL while it hashes)
+and bounds how much may wait for it: once HASHING_POOL_WORKERS hashes are
+running and HASHING_POOL_QUEUE more are waiting, further checks raise
+PoolBusy straight away and the view answers 503, rather than letting a
+login spike queue up behind itself.
+
+check_password() also upgrades stored hashes: a password that verifies
+against anything but settings.PASSWORD_HASHER (or its current work factor)
+is re-hashed, in the pool too, and saved, just as User.check_password does.
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password as check_encoded, get_hasher, identify_hasher, make_password
+
+
+class PoolBusy(Exception):
+    """Every worker is hashing and the queue is full; try again shortly"""
+    pass
+
+
+def needs_rehash(encoded):
+    """True if ``encoded`` wasn't made by the preferred hasher at its current settings"""
+    preferred = get_hasher()
+    try:
+        hasher = identify_hasher(encoded)
+    except ValueError:
+        return False
+    return hasher.algorithm != preferred.algorithm or preferred.must_update(encoded)
+
+
+def verify(password, encoded):
+    """(valid, new encoded password or None): the blocking part of check_password()"""
+    if encoded is None:
+        # Unknown user: hash anyway so the response takes as long as a wrong password
+        make_password(password)
+        return False, None
+    valid = check_encoded(password, encoded)
+    return valid, make_password(password) if valid and needs_rehash(encoded) else None
+
+
+class HashingPool:
+    def __init__(self, workers=None, queue=None):
+        self._workers = workers
+        self._queue = queue
+        self._lock = threading.Lock()
+        self._executor = None
+        self.pending = 0
+
+    @property
+    def workers(self):
+        return self._workers or settings.HASHING_POOL_WORKERS
+
+    @property
+    def capacity(self):
+        """Hashes running plus hashes waiting before new ones are turned away"""
+        return self.workers + (self._queue if self._queue is not None else settings.HASHING_POOL_QUEUE)
+
+    def _release(self, future):
+        with self._lock:
+            self.pending -= 1
+
+    def submit(self, func, *args):
+        """concurrent.futures.Future for ``func(*args)``; raises PoolBusy when at capacity"""
+        with self._lock:
+            if self.pending >= self.capacity:
+                raise PoolBusy()
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='hashing')
+            self.pending += 1
+        # Released when the hash finishes, not when the caller stops waiting (e.g. a client hang-up)
+        future = self._executor.submit(func, *args)
+        future.add_done_callback(self._release)
+        return future
+
+    async def run(self, func, *args):
+        return await asyncio.wrap_future(self.submit(func, *args))
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+pool = HashingPool()
+
+
+async def check_password(user, password):
+    """user.check_password() for async views: hashes on the pool, may raise PoolBusy.
+
+    ``user`` may be None (unknown username); that still costs one hash.
+    """
+    encoded = user.password if user is not None and user.has_usable_password() else None
+    valid, rehashed = await pool.run(verify, password, encoded)
+    if rehashed:
+        user.password = rehashed
+        await user.asave(update_fields=['password'])
+    return valid
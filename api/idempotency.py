@@ -0,0 +1,93 @@
+"""Idempotency-Key support for POST endpoints that move money.
+
+A client that retries with the same ``Idempotency-Key`` header gets the
+first response back instead of running the view again. The response is
+stored in an IdempotencyKey row written in the same transaction as the
+view's own writes, so a retry can never repeat a ledger posting, and in
+the cache, so a retry storm costs one cache read per retry.
+"""
+import functools
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+
+
+def response_key(user_id, key):
+    return f'idempotency:{user_id}:{hashlib.sha256(key.encode()).hexdigest()}'
+
+
+def has_stored_response(request, user_id):
+    """True if the request's key already has a response in the cache: the view will only replay it"""
+    key = request.headers.get(HEADER, '').strip()
+    return bool(key) and len(key) <= 255 and cache.get(response_key(user_id, key)) is not None
+
+
+def _replay(stored, request_hash):
+    status_code, data, stored_hash = stored
+    if stored_hash != request_hash:
+        return Response(
+            {'error': f'{HEADER} was already used for a different request'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+    response = Response(data, status=status_code)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(view):
+    """Decorate a view method (self, request, ...) to honour the Idempotency-Key header.
+
+    Requests without the header run as before. 5xx responses aren't stored,
+    so those can be retried with the same key.
+    """
+    @functools.wraps(view)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER, '').strip()
+        if not key or not request.user.is_authenticated:
+            return view(self, request, *args, **kwargs)
+        if len(key) > 255:
+            return Response({'error': f'{HEADER} must be at most 255 characters'}, status=status.HTTP_400_BAD_REQUEST)
+
+        user = request.user
+        request_hash = hashlib.sha256(request.body).hexdigest()
+        cache_key = response_key(user.pk, key)
+        stored = cache.get(cache_key)
+        if stored is not None:
+            return _replay(stored, request_hash)
+
+        # Cache miss: evicted, or answered by another process
+        record = IdempotencyKey.objects.filter(user=user, key=key).first()
+        if record is None:
+            try:
+                with transaction.atomic():
+                    response = view(self, request, *args, **kwargs)
+                    # Don't pin a server error, or a response whose transaction is already doomed
+                    if response.status_code >= 500 or transaction.get_connection().needs_rollback:
+                        return response
+                    record = IdempotencyKey.objects.create(
+                        user=user, key=key, request_hash=request_hash,
+                        status_code=response.status_code, response=response.data
+                    )
+            except IntegrityError:
+                # A concurrent request with the same key committed first; this
+                # one's writes were rolled back with the failed INSERT
+                record = IdempotencyKey.objects.filter(user=user, key=key).first()
+                if record is None:
+                    raise
+            else:
+                cache.set(cache_key, (record.status_code, response.data, request_hash), settings.IDEMPOTENCY_KEY_TIMEOUT)
+                return response
+
+        stored = (record.status_code, record.response, record.request_hash)
+        cache.set(cache_key, stored, settings.IDEMPOTENCY_KEY_TIMEOUT)
+        return _replay(stored, request_hash)
+
+    return wrapper
@@ -0,0 +1,140 @@
+"""Wallet ledger: the one place that moves money on a UserProfile.
+
+Every balance change is a single ``UPDATE api_userprofile SET wallet_balance =
+wallet_balance + %s ...`` so concurrent requests can't lose each other's
+updates, and money movements write their Transaction row in the same
+database transaction.
+
+Transaction rows are append-only and are the source of truth; the profile
+columns are a running copy for cheap guards. ``balances()`` reads the ledger
+itself via BalanceSnapshot (see the compact_ledger command).
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F, Q
+
+from .cache import invalidate_auth_user, invalidate_user
+from .models import BalanceSnapshot, Transaction, UserEarningsSummary, UserProfile, add_grouped_deltas
+
+
+class LedgerError(Exception):
+    pass
+
+class InsufficientFunds(LedgerError):
+    """The wallet didn't cover the debit; ``available`` is the profile balance the guard saw"""
+    def __init__(self, available=None):
+        super().__init__(available)
+        self.available = available
+
+class ConditionFailed(LedgerError):
+    """The profile row did not match the guard passed as ``condition``"""
+    pass
+
+
+def _user_id(user):
+    return getattr(user, 'pk', user)
+
+
+def update_profile(user, wallet=0, earnings=0, increments=None, require_funds=False, condition=None, **values):
+    """Apply balance deltas, counter increments and plain field values in one UPDATE.
+
+    ``require_funds`` only lets the update through if the wallet covers a
+    negative ``wallet`` delta; ``condition`` is an extra Q the row must match.
+    """
+    user_id = _user_id(user)
+    updates = dict(values)
+    deltas = {'wallet_balance': wallet, 'total_earnings': earnings, **(increments or {})}
+    for field, delta in deltas.items():
+        if delta:
+            updates[field] = F(field) + delta
+    if not updates:
+        return
+
+    profiles = UserProfile.objects.filter(user_id=user_id)
+    if condition is not None:
+        profiles = profiles.filter(condition)
+    if require_funds and wallet < 0:
+        profiles = profiles.filter(wallet_balance__gte=-wallet)
+
+    if not profiles.update(**updates):
+        available = UserProfile.objects.filter(user_id=user_id).values_list('wallet_balance', flat=True).first()
+        if available is None:
+            raise UserProfile.DoesNotExist(f'No profile for user {user_id}')
+        if condition is not None and not UserProfile.objects.filter(Q(user_id=user_id) & condition).exists():
+            raise ConditionFailed()
+        raise InsufficientFunds(available)
+
+    # queryset.update() skips post_save, so drop cached copies here
+    invalidate_auth_user(user_id)
+    invalidate_user(user_id)
+
+
+def post(user, amount, transaction_type, description, wallet=True, earnings=True, **profile_updates):
+    """Write a Transaction row and apply its amount to the user's profile atomically.
+
+    ``wallet``/``earnings`` choose which balances the amount moves (content
+    approvals only count towards total earnings until paid). Extra keyword
+    arguments are passed to update_profile. Returns the Transaction.
+    """
+    wallet_amount = amount if wallet else 0
+    earnings_amount = amount if earnings else 0
+    # No savepoint: callers usually hold their own atomic block, and a failure
+    # here should roll all of it back anyway
+    with transaction.atomic(savepoint=False):
+        update_profile(user, wallet=wallet_amount, earnings=earnings_amount, **profile_updates)
+        entry = Transaction.objects.create(
+            user_id=_user_id(user),
+            amount=earnings_amount,
+            wallet_amount=wallet_amount,
+            transaction_type=transaction_type,
+            description=description
+        )
+        UserEarningsSummary.objects.record_transaction(_user_id(user), transaction_type, earnings_amount)
+    return entry
+
+
+def post_many(entries, increments=None, summary_increments=None, batch_size=500):
+    """Bulk post(): save unsaved Transaction rows and apply them to their users' profiles.
+
+    Profile deltas (plus optional ``increments``) and earnings summary deltas
+    (plus optional ``summary_increments``), both {user_id: {field: delta}},
+    are grouped per user and applied with one UPDATE per table and batch of
+    users; the rows go in with bulk_create. Returns the saved entries.
+    """
+    profile_deltas = defaultdict(lambda: defaultdict(int))
+    summary_deltas = defaultdict(lambda: defaultdict(int))
+    for user_id, deltas in (summary_increments or {}).items():
+        for field, delta in deltas.items():
+            summary_deltas[user_id][field] += delta
+    for entry in entries:
+        profile_deltas[entry.user_id]['wallet_balance'] += entry.wallet_amount
+        profile_deltas[entry.user_id]['total_earnings'] += entry.amount
+        field = UserEarningsSummary.TRANSACTION_FIELDS.get(entry.transaction_type)
+        if field:
+            summary_deltas[entry.user_id][field] += entry.amount
+    for user_id, deltas in (increments or {}).items():
+        for field, delta in deltas.items():
+            profile_deltas[user_id][field] += delta
+
+    with transaction.atomic(savepoint=False):
+        user_ids = add_grouped_deltas(UserProfile.objects.all(), profile_deltas, batch_size)
+        entries = Transaction.objects.bulk_create(entries, batch_size=batch_size)
+        UserEarningsSummary.objects.bump_many(summary_deltas)
+
+    for user_id in user_ids:
+        invalidate_auth_user(user_id)
+        invalidate_user(user_id)
+    return entries
+
+
+def balances(user):
+    """Ledger (wallet_balance, total_earnings): latest snapshot plus the transactions after it"""
+    return BalanceSnapshot.objects.balances(_user_id(user))
+
+
+def drift(user):
+    """Ledger balances minus the profile's running columns; (0, 0) when they agree"""
+    wallet, earned = balances(user)
+    profile = UserProfile.objects.filter(user_id=_user_id(user)).values_list('wallet_balance', 'total_earnings').get()
+    return wallet - profile[0], earned - profile[1]
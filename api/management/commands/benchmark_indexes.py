@@ -0,0 +1,164 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+from api.models import ContentSubmission, GameParticipation, Package, Referral, UserProfile, WithdrawalRequest
+
+# Models whose Meta.indexes serve the hot per-user filters
+INDEXED_MODELS = [ContentSubmission, GameParticipation, Referral, WithdrawalRequest]
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a large dataset inside a rolled-back transaction and print the query plan '
+        'and timing of each hot per-user query without and with the composite indexes'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--rows-per-user', type=int, default=25,
+                            help='Submissions, game plays and withdrawals created per user')
+        parser.add_argument('--repeat', type=int, default=50, help='Timed runs per query')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if not connection.features.can_rollback_ddl:
+            raise CommandError(
+                f'{connection.vendor} cannot roll back DDL; run this against a scratch SQLite or PostgreSQL database'
+            )
+
+        self.rng = random.Random(options['seed'])
+        try:
+            with transaction.atomic():
+                user = self.seed(options['users'], options['rows_per_user'])
+                self.analyze()
+
+                editor = connection.schema_editor()
+                self.set_indexes(editor, create=False)
+                before = self.measure(user, options['repeat'])
+                self.set_indexes(editor, create=True)
+                self.analyze()
+                after = self.measure(user, options['repeat'])
+
+                self.report(before, after)
+                raise Rollback
+        except Rollback:
+            self.stdout.write('Benchmark data rolled back')
+
+    def seed(self, user_count, rows_per_user):
+        self.stdout.write(f'Seeding {user_count} users x {rows_per_user} rows per table...')
+        started = time.perf_counter()
+        package = Package.objects.filter(package_type='pro').first() or Package.objects.create(
+            name='Pro Package', package_type='pro', price=10000, description='Benchmark package'
+        )
+
+        prefix = f'bench{int(time.time())}_'
+        User.objects.bulk_create(
+            [User(username=f'{prefix}{i}', password='!') for i in range(user_count)], batch_size=1000
+        )
+        users = list(User.objects.filter(username__startswith=prefix))
+        UserProfile.objects.bulk_create(
+            [UserProfile(user=user, package=package) for user in users], batch_size=1000
+        )
+
+        now = timezone.now()
+        platforms = [choice[0] for choice in ContentSubmission.PLATFORM_CHOICES]
+        statuses = [choice[0] for choice in ContentSubmission.STATUS_CHOICES]
+        games = [choice[0] for choice in GameParticipation.GAME_CHOICES]
+        withdrawal_statuses = [choice[0] for choice in WithdrawalRequest.STATUS_CHOICES]
+
+        submissions, plays, withdrawals, referrals = [], [], [], []
+        for index, user in enumerate(users):
+            for n in range(rows_per_user):
+                submissions.append(ContentSubmission(
+                    user=user, platform=self.rng.choice(platforms), status=self.rng.choice(statuses),
+                    video_url=f'https://example.com/{user.pk}/{n}', earnings=Decimal('500'),
+                ))
+                plays.append(GameParticipation(user=user, game_type=self.rng.choice(games), reward_earned=Decimal('300')))
+                withdrawals.append(WithdrawalRequest(
+                    user=user, amount=Decimal('1000'), bank_name='Bank', account_number='0000000000',
+                    account_name=user.username, status=self.rng.choice(withdrawal_statuses),
+                ))
+            if index:
+                referrals.append(Referral(
+                    referrer=users[self.rng.randrange(index)], referee=user,
+                    reward_earned=Decimal('4000'), is_paid=self.rng.random() < 0.5,
+                ))
+
+        # bulk_create skips the models' save() side effects, which is what we want here
+        ContentSubmission.objects.bulk_create(submissions, batch_size=2000)
+        GameParticipation.objects.bulk_create(plays, batch_size=2000)
+        WithdrawalRequest.objects.bulk_create(withdrawals, batch_size=2000)
+        Referral.objects.bulk_create(referrals, batch_size=2000)
+
+        # auto_now_add stamps every play "now"; spread them over the past days
+        for days_ago in range(rows_per_user):
+            GameParticipation.objects.filter(
+                pk__in=[play.pk for play in plays[days_ago::rows_per_user]]
+            ).update(participation_date=now - timedelta(days=days_ago))
+
+        self.stdout.write(f'Seeded in {time.perf_counter() - started:.1f}s')
+        return users[len(users) // 2]
+
+    def analyze(self):
+        if connection.vendor in ('sqlite', 'postgresql'):
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+    def set_indexes(self, editor, create):
+        with connection.cursor() as cursor:
+            for model in INDEXED_MODELS:
+                for index in model._meta.indexes:
+                    if create:
+                        cursor.execute(str(index.create_sql(model, editor)))
+                    else:
+                        cursor.execute(f'DROP INDEX {connection.ops.quote_name(index.name)}')
+
+    def hot_queries(self, user):
+        today_start = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+        return {
+            'GameViewSet.play once-per-day check': GameParticipation.objects.filter(
+                user=user, game_type='quiz',
+                participation_date__gte=today_start, participation_date__lt=today_start + timedelta(days=1),
+            ),
+            'ContentSubmission by user/status/platform': ContentSubmission.objects.filter(
+                user=user, status__in=['approved', 'paid'], platform='tiktok',
+            ),
+            'ContentSubmission list page': ContentSubmission.objects.filter(user=user).order_by('-submission_date')[:20],
+            'ReferralViewSet.stats pending earnings': Referral.objects.filter(referrer=user, is_paid=False),
+            'WithdrawalRequest by user/status': WithdrawalRequest.objects.filter(user=user, status='pending'),
+        }
+
+    def measure(self, user, repeat):
+        results = {}
+        for name, queryset in self.hot_queries(user).items():
+            if name.startswith('ReferralViewSet'):
+                run = lambda qs=queryset: qs.aggregate(total=Sum('reward_earned'))
+            else:
+                run = lambda qs=queryset: list(qs.all())
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                run()
+                timings.append((time.perf_counter() - started) * 1000)
+            results[name] = {'plan': queryset.explain(), 'median_ms': statistics.median(timings)}
+        return results
+
+    def report(self, before, after):
+        for name in before:
+            self.stdout.write(self.style.MIGRATE_HEADING(f'\n{name}'))
+            self.stdout.write(f"  without indexes: {before[name]['median_ms']:.3f} ms")
+            self.stdout.write('    ' + before[name]['plan'].replace('\n', '\n    '))
+            self.stdout.write(f"  with indexes:    {after[name]['median_ms']:.3f} ms")
+            self.stdout.write('    ' + after[name]['plan'].replace('\n', '\n    '))
@@ -0,0 +1,109 @@
+import asyncio
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+from api import hashing
+from api.models import UserProfile
+
+USERNAME = 'bench_login_user'
+PASSWORD = 'benchmark-pass-123'
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare logins/s for one sync (WSGI) worker, the sync LoginView under ASGI and the async '
+        'LoginView (api/async_views.py), with a cheap request probing responsiveness during the spike. '
+        'Writes one user and deletes it afterwards: run it against a scratch database'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=40, help='Logins per run')
+        parser.add_argument('--concurrency', type=int, default=20, help='Logins in flight at once on ASGI')
+        parser.add_argument('--hasher', default=settings.PASSWORD_HASHERS[0],
+                            help='Password hasher to benchmark (default: the preferred one from settings)')
+        parser.add_argument('--workers', type=int, help='Hashing pool threads (default: HASHING_POOL_WORKERS)')
+        parser.add_argument('--queue', type=int, help='Hashing pool queue depth (default: HASHING_POOL_QUEUE)')
+
+    def handle(self, *args, **options):
+        if User.objects.filter(username=USERNAME).exists():
+            raise CommandError(f'Leftover {USERNAME} from an earlier run; delete it first')
+
+        hashers = [options['hasher']] + [hasher for hasher in settings.PASSWORD_HASHERS if hasher != options['hasher']]
+        pool = {
+            'HASHING_POOL_WORKERS': options['workers'] or settings.HASHING_POOL_WORKERS,
+            'HASHING_POOL_QUEUE': options['queue'] if options['queue'] is not None else settings.HASHING_POOL_QUEUE,
+        }
+        with override_settings(PASSWORD_HASHERS=hashers, ALLOWED_HOSTS=['testserver'], **pool):
+            user = User.objects.create_user(USERNAME, '', PASSWORD)
+            UserProfile.objects.create(user=user)
+            try:
+                count = options['logins']
+                self.stdout.write(
+                    f'Hasher: {hashers[0].rsplit(".", 1)[-1]}, {count} logins, '
+                    f'{pool["HASHING_POOL_WORKERS"]} hashing threads + {pool["HASHING_POOL_QUEUE"]} queued'
+                )
+                self.report('WSGI, one sync worker', *self.sync_run(count))
+                with override_settings(ROOT_URLCONF='backend.urls'):
+                    self.report('ASGI, sync LoginView', *asyncio.run(self.async_run(count, options['concurrency'])))
+                with override_settings(ROOT_URLCONF='backend.urls_asgi'):
+                    self.report('ASGI, async LoginView', *asyncio.run(self.async_run(count, options['concurrency'])))
+            finally:
+                hashing.pool.shutdown()
+                user.delete()
+
+    def login_body(self):
+        return {'username': USERNAME, 'password': PASSWORD}
+
+    def sync_run(self, count):
+        # One worker serves requests one at a time: a request arriving mid-spike waits for all of it
+        client = Client()
+        started = time.perf_counter()
+        statuses = [client.post('/api/auth/login/', self.login_body(), content_type='application/json').status_code
+                    for _ in range(count)]
+        elapsed = time.perf_counter() - started
+        return statuses, elapsed, [elapsed * 1000 / 2]
+
+    async def async_run(self, count, concurrency):
+        client = AsyncClient()
+        slots = asyncio.Semaphore(concurrency)
+        probes, done = [], asyncio.Event()
+
+        async def login():
+            async with slots:
+                response = await client.post('/api/auth/login/', self.login_body(), content_type='application/json')
+                return response.status_code
+
+        async def probe():
+            # A cheap endpoint, hit every 50ms while the logins run
+            while not done.is_set():
+                started = time.perf_counter()
+                await client.get('/')
+                probes.append((time.perf_counter() - started) * 1000)
+                await asyncio.sleep(0.05)
+
+        prober = asyncio.create_task(probe())
+        started = time.perf_counter()
+        statuses = await asyncio.gather(*[login() for _ in range(count)])
+        elapsed = time.perf_counter() - started
+        done.set()
+        await prober
+        return statuses, elapsed, probes
+
+    def report(self, label, statuses, elapsed, probes):
+        ok = statuses.count(200)
+        self.stdout.write(
+            f'{label:<24} {ok / elapsed:7.1f} logins/s  {ok:4d} ok  {statuses.count(503):4d} shed (503)  '
+            f'probe p50 {statistics.median(probes):8.1f} ms  p95 {percentile(probes, 95):8.1f} ms'
+        )
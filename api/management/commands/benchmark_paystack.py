@@ -0,0 +1,75 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand
+from payments.fake_paystack import FakePaystack
+from payments.paystack import PaystackClient
+
+SECRET_KEY = 'sk_test_benchmark'
+
+
+class Command(BaseCommand):
+    help = (
+        'Start a local fake Paystack server and compare transfer throughput: a fresh connection per call, '
+        'the pooled client, and bulk submission'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--transfers', type=int, default=500)
+        parser.add_argument('--threads', type=int, default=8, help='Concurrent callers for the per-transfer runs')
+        parser.add_argument('--latency', type=float, default=0.002, help='Seconds the fake server adds to each response')
+
+    def handle(self, *args, **options):
+        server = FakePaystack(SECRET_KEY, latency=options['latency']).start()
+        try:
+            count, threads = options['transfers'], options['threads']
+            self.report('Fresh connection per call', count, server, lambda: self.unpooled(server, count, threads))
+            self.report(f'Pooled client ({threads} threads)', count, server, lambda: self.pooled(server, count, threads))
+            self.report('Pooled client, bulk transfers', count, server, lambda: self.bulk(server, count))
+        finally:
+            server.stop()
+
+    def transfers(self, run, count):
+        return [
+            {'amount': 100000, 'recipient': 'RCP_benchmark', 'reference': f'bench_{run}_{n:010d}', 'reason': 'Benchmark'}
+            for n in range(count)
+        ]
+
+    def unpooled(self, server, count, threads):
+        headers = {'Authorization': f'Bearer {SECRET_KEY}'}
+
+        def send(transfer):
+            # No session: every call opens (and closes) its own connection
+            response = requests.post(f'{server.url}/transfer', json=transfer, headers=headers, timeout=10)
+            response.raise_for_status()
+
+        with ThreadPoolExecutor(threads) as pool:
+            list(pool.map(send, self.transfers('unpooled', count)))
+
+    def pooled(self, server, count, threads):
+        client = PaystackClient(SECRET_KEY, base_url=server.url, pool_size=threads)
+        try:
+            with ThreadPoolExecutor(threads) as pool:
+                list(pool.map(lambda t: client.transfer(t['amount'], t['recipient'], t['reference'], t['reason']),
+                              self.transfers('pooled', count)))
+        finally:
+            client.close()
+
+    def bulk(self, server, count):
+        client = PaystackClient(SECRET_KEY, base_url=server.url)
+        try:
+            client.bulk_transfer(self.transfers('bulk', count))
+        finally:
+            client.close()
+
+    def report(self, label, count, server, run):
+        requests_before, connections_before = server.request_count, server.connections
+        started = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'{label:<36} {count / elapsed:9.1f} transfers/s  '
+            f'{server.request_count - requests_before:5d} HTTP calls  '
+            f'{server.connections - connections_before:5d} connections  ({elapsed:.2f}s)'
+        )
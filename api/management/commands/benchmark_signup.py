@@ -0,0 +1,107 @@
+import time
+from contextlib import nullcontext
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from api import coupons, outbox
+from api.codes import normalize
+from api.models import Coupon, OutboxMessage, Package, Referral, UserEarningsSummary, UserProfile
+from api.registration import referral_bonus, register
+
+USERNAME_PREFIX = 'bench_signup_'
+
+
+def pre_checked_signup(username, email, password, coupon_code, phone_number='', referral_code=''):
+    """Sign-up as it was before api/registration.py: an existence query per
+    unique field, separate coupon and referrer lookups, Referral.save()"""
+    if User.objects.filter(username=username).exists():
+        raise ValueError('Username already exists')
+    if User.objects.filter(email=email).exists():
+        raise ValueError('Email already exists')
+    coupon = Coupon.objects.get(coupon_code=coupon_code, is_used=False)
+    referrer = UserProfile.objects.get(referral_code=normalize(referral_code)).user if referral_code else None
+
+    with transaction.atomic():
+        user = User.objects.create_user(username=username, email=email, password=password)
+        package = coupon.package
+        UserProfile.objects.create(user=user, package=package, phone_number=phone_number)
+        UserEarningsSummary.objects.create(user=user)
+        coupons.redeem(coupon, user)
+        if referrer:
+            bonus = referral_bonus(package)
+            Referral.objects.create(referrer=referrer, referee=user, reward_earned=bonus,
+                                    referee_package=package.package_type)
+            outbox.enqueue('referral_bonus', referrer_id=referrer.id, amount=bonus,
+                           description=f'Referral bonus for {user.username} ({package.package_type.title()} package)')
+
+
+class Command(BaseCommand):
+    help = (
+        'Run sign-ups through the old pre-checked flow and through registration.register() '
+        'and print signups/s and queries per signup for each. Writes real rows and deletes '
+        'them afterwards: run it against a scratch database'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--signups', type=int, default=200, help='Sign-ups per flow')
+        parser.add_argument('--hasher', default='django.contrib.auth.hashers.MD5PasswordHasher',
+                            help='Password hasher to use; the default leaves out hashing to show the database '
+                                 'cost (pass django.contrib.auth.hashers.PBKDF2PasswordHasher for the real one)')
+        parser.add_argument('--single-transaction', action='store_true',
+                            help='Run every sign-up inside one rolled-back transaction, so commits (disk flushes) '
+                                 'drop out and only the round trips are compared')
+
+    def handle(self, *args, **options):
+        package = Package.objects.order_by('id').first()
+        if package is None:
+            raise CommandError('No packages: run setup_packages first')
+        if User.objects.filter(username__startswith=USERNAME_PREFIX).exists():
+            raise CommandError(f'Leftover {USERNAME_PREFIX}* users from an earlier run; delete them first')
+
+        count = options['signups']
+        last_message = OutboxMessage.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        batch = coupons.mint(package, count * 2)
+        codes = iter(batch.coupons.values_list('coupon_code', flat=True))
+        referrer = User.objects.create_user(f'{USERNAME_PREFIX}referrer', '', 'benchmark-referrer')
+        referral_code = UserProfile.objects.create(user=referrer, package=package).referral_code
+        UserEarningsSummary.objects.create(user=referrer)
+
+        try:
+            scope = transaction.atomic() if options['single_transaction'] else nullcontext()
+            with override_settings(PASSWORD_HASHERS=[options['hasher']]), scope:
+                before = self.run('before', pre_checked_signup, count, codes, referral_code)
+                after = self.run('after', register, count, codes, referral_code)
+                if options['single_transaction']:
+                    transaction.set_rollback(True)
+        finally:
+            User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+            batch.coupons.all().delete()
+            batch.delete()
+            OutboxMessage.objects.filter(id__gt=last_message).delete()
+
+        self.stdout.write(f'Hasher: {options["hasher"].rsplit(".", 1)[-1]}')
+        for label, (rate, queries) in [('Pre-checked sign-up', before), ('registration.register()', after)]:
+            self.stdout.write(f'{label:<26} {rate:9.1f} signups/s  {queries:5.1f} queries/signup')
+        self.stdout.write(f'Speed-up: {after[0] / before[0]:.2f}x')
+
+    def run(self, label, signup, count, codes, referral_code):
+        queries = 0
+
+        def count_query(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count_query):
+            started = time.perf_counter()
+            for n in range(count):
+                # Every other sign-up comes with a referral code
+                signup(
+                    username=f'{USERNAME_PREFIX}{label}_{n}', email=f'{USERNAME_PREFIX}{label}_{n}@example.com',
+                    password='benchmark-pass-123', coupon_code=next(codes), phone_number='08000000000',
+                    referral_code=referral_code if n % 2 else '',
+                )
+            elapsed = time.perf_counter() - started
+        return count / elapsed, queries / count
@@ -0,0 +1,53 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from api import payouts
+from api.models import PayoutBatch
+from payments.paystack import PaystackError
+
+class Command(BaseCommand):
+    help = (
+        'Claim the next pending withdrawals in priority order and mark them processing, then write '
+        'their payout CSV or (--send) pay them through Paystack transfers'
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=100, help='Withdrawals to claim')
+        parser.add_argument('--output', help='CSV path (default: stdout)')
+        parser.add_argument('--send', action='store_true', help='Submit the batch as Paystack transfers instead of writing a CSV')
+        parser.add_argument('--resend', type=int, metavar='BATCH_ID',
+                            help='Submit an already claimed batch\'s unsent withdrawals to Paystack and exit')
+    
+    def handle(self, *args, **options):
+        if options['resend']:
+            try:
+                batch = PayoutBatch.objects.get(pk=options['resend'])
+            except PayoutBatch.DoesNotExist:
+                raise CommandError(f'No payout batch {options["resend"]}')
+            return self.send(batch)
+        
+        batch = payouts.claim_batch(size=options['size'])
+        if batch is None:
+            self.stderr.write('No pending withdrawals to claim')
+            return
+        
+        self.stderr.write(self.style.SUCCESS(
+            f'Claimed payout batch {batch.pk}: {batch.withdrawal_count} withdrawals, ₦{batch.total_amount}'
+        ))
+        if options['send']:
+            return self.send(batch)
+        
+        output = open(options['output'], 'w', newline='') if options['output'] else sys.stdout
+        try:
+            for line in payouts.payout_rows(batch):
+                output.write(line)
+        finally:
+            if output is not sys.stdout:
+                output.close()
+    
+    def send(self, batch):
+        try:
+            sent = payouts.send_transfers(batch.withdrawals.all())
+        except PaystackError as e:
+            raise CommandError(f'Paystack failed for batch {batch.pk}: {e}. Rerun with --resend {batch.pk}')
+        self.stderr.write(self.style.SUCCESS(f'Submitted {sent} transfers to Paystack for batch {batch.pk}'))
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Sum
+from api.models import BalanceSnapshot, Transaction, UserProfile
+
+class Command(BaseCommand):
+    help = 'Roll BalanceSnapshot rows forward over settled Transaction rows so balance reads stay cheap'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users',
+                            help='Only compact this user id (can be repeated)')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--settle-seconds', type=int, default=60,
+                            help='Leave transactions younger than this for the next run')
+        parser.add_argument('--verify', action='store_true',
+                            help='Afterwards, compare the full ledger with each profile\'s running balances')
+
+    def handle(self, *args, **options):
+        count = BalanceSnapshot.objects.compact(
+            users=options['users'],
+            settle_seconds=options['settle_seconds'],
+            batch_size=options['batch_size']
+        )
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Compacted ledger snapshots for {count} users')
+        )
+
+        if options['verify']:
+            self.verify(options['users'], options['batch_size'])
+
+    def verify(self, users, batch_size):
+        """Re-sum every transaction (ignoring snapshots) and report profiles that disagree"""
+        profiles = UserProfile.objects.order_by('user_id').values_list('user_id', 'wallet_balance', 'total_earnings')
+        if users:
+            profiles = profiles.filter(user_id__in=users)
+
+        mismatches = checked = 0
+        profiles = list(profiles)
+        for start in range(0, len(profiles), batch_size):
+            batch = profiles[start:start + batch_size]
+            totals = {
+                row['user_id']: row
+                for row in Transaction.objects.filter(user_id__in=[p[0] for p in batch]).values('user_id').annotate(
+                    wallet=Sum('wallet_amount'), earnings=Sum('amount')
+                )
+            }
+            for user_id, wallet_balance, total_earnings in batch:
+                checked += 1
+                ledger = totals.get(user_id, {'wallet': 0, 'earnings': 0})
+                if ledger['wallet'] != wallet_balance or ledger['earnings'] != total_earnings:
+                    mismatches += 1
+                    self.stdout.write(self.style.WARNING(
+                        f'  user {user_id}: ledger wallet {ledger["wallet"]} / earnings {ledger["earnings"]}, '
+                        f'profile wallet {wallet_balance} / earnings {total_earnings}'
+                    ))
+
+        style = self.style.SUCCESS if not mismatches else self.style.ERROR
+        self.stdout.write(style(f'Verified {checked} profiles against the ledger: {mismatches} mismatches'))
@@ -0,0 +1,38 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from api import coupons
+from api.models import Package
+
+class Command(BaseCommand):
+    help = 'Mint a batch of unique coupons for a package and write them as CSV'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('package', help='Package type (e.g. pro, silver)')
+        parser.add_argument('quantity', type=int)
+        parser.add_argument('--output', help='CSV path (default: stdout)')
+    
+    def handle(self, *args, **options):
+        try:
+            package = Package.objects.get(package_type=options['package'])
+        except Package.DoesNotExist:
+            raise CommandError(f'No package of type {options["package"]}')
+        
+        started = time.perf_counter()
+        try:
+            batch = coupons.mint(package, options['quantity'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stderr.write(self.style.SUCCESS(
+            f'Minted coupon batch {batch.pk}: {batch.quantity} {package.package_type} coupons '
+            f'in {time.perf_counter() - started:.2f}s'
+        ))
+        
+        output = open(options['output'], 'w', newline='') if options['output'] else sys.stdout
+        try:
+            for line in coupons.coupon_rows(batch):
+                output.write(line)
+        finally:
+            if output is not sys.stdout:
+                output.close()
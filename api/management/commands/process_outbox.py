@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+from api import outbox
+
+class Command(BaseCommand):
+    help = 'Run queued outbox messages (counter rollups, referral credits) in batches; runs until stopped unless --once'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain the queue once and exit')
+        parser.add_argument('--batch-size', type=int, default=500, help='Messages claimed per transaction')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds to wait when the queue is empty')
+    
+    def handle(self, *args, **options):
+        while True:
+            processed = outbox.process_pending(batch_size=options['batch_size'])
+            if processed:
+                summary = ', '.join(f'{count} {topic}' for topic, count in sorted(processed.items()))
+                self.stdout.write(f'Processed outbox messages: {summary}')
+            if options['once']:
+                return
+            if not processed:
+                time.sleep(options['interval'])
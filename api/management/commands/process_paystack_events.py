@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+from api import webhooks
+
+class Command(BaseCommand):
+    help = 'Apply queued Paystack webhook events to their withdrawals (runs until stopped unless --once)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain the queue once and exit')
+        parser.add_argument('--batch-size', type=int, default=100, help='Events claimed per transaction')
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds to wait when the queue is empty')
+    
+    def handle(self, *args, **options):
+        while True:
+            outcomes = webhooks.process_pending(batch_size=options['batch_size'])
+            if outcomes:
+                summary = ', '.join(f'{count} {outcome}' for outcome, count in sorted(outcomes.items()))
+                self.stdout.write(f'Processed Paystack events: {summary}')
+            if options['once']:
+                return
+            if not outcomes:
+                time.sleep(options['interval'])
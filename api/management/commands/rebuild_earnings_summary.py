@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from api.models import UserEarningsSummary
+
+class Command(BaseCommand):
+    help = 'Rebuild UserEarningsSummary rows from Transaction, ContentSubmission and Referral'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users',
+                            help='Only rebuild this user id (can be repeated)')
+        parser.add_argument('--batch-size', type=int, default=1000)
+    
+    def handle(self, *args, **options):
+        count = UserEarningsSummary.objects.rebuild(
+            users=options['users'],
+            batch_size=options['batch_size']
+        )
+        
+        self.stdout.write(
+            self.style.SUCCESS(f'Rebuilt earnings summary for {count} users')
+        )
@@ -0,0 +1,248 @@
+import random
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from api.models import (
+    ContentSubmission, Coupon, GameParticipation, Package, Referral, Transaction,
+    UserEarningsSummary, UserProfile, WithdrawalRequest,
+)
+
+PLATFORM_EARNINGS = {
+    'tiktok': Decimal('500'),
+    'instagram': Decimal('400'),
+    'facebook': Decimal('300'),
+}
+REFERRAL_BONUS = {
+    'pro': Decimal('4000.00'),
+    'silver': Decimal('3000.00'),
+}
+DAILY_LOGIN_BONUS = {
+    'pro': Decimal('1000.00'),
+    'silver': Decimal('700.00'),
+}
+GAME_BASE_REWARDS = {
+    'daily_spin': Decimal('500'),
+    'scratch_card': Decimal('300'),
+    'quiz': Decimal('200'),
+}
+SUBMISSION_STATUS_WEIGHTS = [('pending', 30), ('approved', 30), ('rejected', 10), ('paid', 30)]
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """Let bulk_create keep our generated dates instead of auto_now_add's now()"""
+    fields = [field for model in models for field in model._meta.fields if getattr(field, 'auto_now_add', False)]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = (
+        'Bulk-create synthetic users with coupons, referral chains, submissions, game plays, '
+        'withdrawals and a consistent Transaction ledger. Deterministic for a given --seed.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--batch-size', type=int, default=2000, help='Users generated and inserted per transaction')
+        parser.add_argument('--prefix', default='load', help='Username / referral code prefix')
+        parser.add_argument('--submissions', type=int, default=6, help='Average submissions per user')
+        parser.add_argument('--games', type=int, default=8, help='Average game plays per user')
+        parser.add_argument('--days', type=int, default=90, help='History spread over this many days')
+        parser.add_argument('--start-date', default='2025-01-01')
+        parser.add_argument('--password', default='loadtest-pass', help='Password set on every generated user')
+        parser.add_argument('--flush', action='store_true', help='Delete previously generated users with this prefix first')
+        parser.add_argument('--skip-summary', action='store_true', help='Do not rebuild UserEarningsSummary rows')
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.rng = random.Random(options['seed'])
+        self.start = timezone.make_aware(datetime.fromisoformat(options['start_date']))
+        self.prefix = options['prefix']
+
+        existing = User.objects.filter(username__startswith=f'{self.prefix}_')
+        if existing.exists():
+            if not options['flush']:
+                raise CommandError(f'Users with prefix "{self.prefix}_" already exist; use --flush or another --prefix')
+            self.stdout.write('Deleting previously generated users...')
+            existing.delete()
+
+        call_command('setup_packages', stdout=self.stdout)
+        self.packages = {package.package_type: package for package in Package.objects.all()}
+        self.password = make_password(options['password'])
+
+        started = time.perf_counter()
+        self.counts = {}
+        total, batch_size = options['users'], options['batch_size']
+        for offset in range(0, total, batch_size):
+            self.create_batch(offset, min(batch_size, total - offset))
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f'  {min(offset + batch_size, total)}/{total} users ({elapsed:.1f}s)')
+
+        rows = sum(self.counts.values())
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {rows} rows in {time.perf_counter() - started:.1f}s: '
+            + ', '.join(f'{name}={count}' for name, count in self.counts.items())
+        ))
+
+    def random_date(self):
+        return self.start + timedelta(seconds=self.rng.randrange(self.options['days'] * 86400))
+
+    def bulk_create(self, model, objs):
+        model.objects.bulk_create(objs, batch_size=1000)
+        self.counts[model.__name__] = self.counts.get(model.__name__, 0) + len(objs)
+        return objs
+
+    def create_batch(self, offset, size):
+        rng = self.rng
+        with transaction.atomic(), explicit_timestamps(
+            Coupon, ContentSubmission, Referral, GameParticipation, Transaction, WithdrawalRequest
+        ):
+            users = self.bulk_create(User, [
+                User(
+                    username=f'{self.prefix}_{offset + n}', email=f'{self.prefix}_{offset + n}@example.com',
+                    password=self.password, date_joined=self.random_date(),
+                )
+                for n in range(size)
+            ])
+            if users[0].pk is None:
+                # Backends without RETURNING on bulk insert (MySQL)
+                ids = dict(User.objects.filter(username__in=[u.username for u in users]).values_list('username', 'id'))
+                for user in users:
+                    user.pk = ids[user.username]
+            users.sort(key=lambda user: user.date_joined)
+
+            # Per-user running balances following the app's crediting rules
+            wallet = {user.pk: Decimal('0') for user in users}
+            earned = {user.pk: Decimal('0') for user in users}
+            package_of = {}
+            coupons, profiles, referrals, transactions = [], [], [], []
+
+            def credit(user, amount, transaction_type, description, date, to_wallet=True, to_earnings=True):
+                earnings_amount = amount if to_earnings else Decimal('0')
+                wallet_amount = amount if to_wallet else Decimal('0')
+                earned[user.pk] += earnings_amount
+                wallet[user.pk] += wallet_amount
+                transactions.append(Transaction(
+                    user=user, amount=earnings_amount, wallet_amount=wallet_amount,
+                    transaction_type=transaction_type, description=description, date=date,
+                ))
+
+            for index, user in enumerate(users):
+                package_type = 'pro' if rng.random() < 0.4 else 'silver'
+                package = self.packages[package_type]
+                package_of[user.pk] = package_type
+                coupons.append(Coupon(
+                    coupon_code=f'{self.prefix}{offset + index:09d}', package=package, is_used=True, used_by=user,
+                    created_at=user.date_joined, used_at=user.date_joined, price_paid=package.price,
+                ))
+
+                # Referral chains: most users were referred by someone who joined shortly before
+                referrer = None
+                if index and rng.random() < 0.7:
+                    referrer = users[index - 1 - rng.randrange(min(index, 25))]
+                    reward = REFERRAL_BONUS[package_type]
+                    referrals.append(Referral(
+                        referrer=referrer, referee=user, referral_date=user.date_joined, reward_earned=reward,
+                        is_paid=rng.random() < 0.5, referee_package=package_type,
+                    ))
+                    credit(referrer, reward, 'referral',
+                           f'Referral bonus for {user.username} ({package_type.title()} package)', user.date_joined)
+
+                profiles.append(UserProfile(
+                    user=user, package=package, referral_code=f'{self.prefix.upper()}{offset + index}',
+                    referred_by=referrer, phone_number=f'080{rng.randrange(10 ** 8):08d}',
+                ))
+
+            submissions, plays, withdrawals = [], [], []
+            platforms = list(PLATFORM_EARNINGS)
+            statuses, weights = zip(*SUBMISSION_STATUS_WEIGHTS)
+            for user, profile in zip(users, profiles):
+                package_type = package_of[user.pk]
+
+                for _ in range(rng.randint(0, 2 * self.options['submissions'])):
+                    platform = rng.choice(platforms)
+                    status = rng.choices(statuses, weights)[0]
+                    submitted = self.random_date()
+                    submission = ContentSubmission(
+                        user=user, platform=platform, video_url=f'https://example.com/{user.pk}/{len(submissions)}',
+                        submission_date=submitted, status=status,
+                    )
+                    profile.total_submissions += 1
+                    if status in ('approved', 'paid'):
+                        submission.earnings = PLATFORM_EARNINGS[platform]
+                        submission.approved_at = submitted + timedelta(hours=rng.randint(1, 48))
+                        profile.approved_submissions += 1
+                        # Approval adds to total earnings; payment moves it to the wallet
+                        credit(user, submission.earnings, 'content', f'{submission.get_platform_display()} video approved',
+                               submission.approved_at, to_wallet=False)
+                        if status == 'paid':
+                            submission.paid_at = submission.approved_at + timedelta(hours=rng.randint(1, 72))
+                            credit(user, submission.earnings, 'content',
+                                   f'{submission.get_platform_display()} video paid to wallet',
+                                   submission.paid_at, to_earnings=False)
+                    submissions.append(submission)
+
+                for _ in range(rng.randint(0, 2 * self.options['games'])):
+                    game_type = rng.choice(list(GAME_BASE_REWARDS))
+                    played = self.random_date()
+                    multiplier = Decimal('1.5') if package_type == 'pro' else Decimal('1.2')
+                    variation = rng.uniform(0.8, 1.5)
+                    reward = round(GAME_BASE_REWARDS[game_type] * multiplier * Decimal(variation), 2)
+                    plays.append(GameParticipation(
+                        user=user, game_type=game_type, participation_date=played, reward_earned=reward,
+                        game_data={'base_reward': float(GAME_BASE_REWARDS[game_type] * multiplier),
+                                   'multiplier': variation, 'game_type': game_type},
+                    ))
+                    credit(user, reward, 'game', f'{game_type.replace("_", " ").title()} reward', played)
+
+                logins = rng.randint(0, self.options['days'] // 3)
+                for day in sorted(rng.sample(range(self.options['days']), logins)):
+                    logged_in = self.start + timedelta(days=day, hours=rng.randint(6, 22))
+                    credit(user, DAILY_LOGIN_BONUS[package_type], 'daily_login',
+                           f'Daily login bonus - {self.packages[package_type].name}', logged_in)
+                    profile.last_daily_login = logged_in
+                    profile.login_streak = rng.randint(1, 7)
+
+            # Withdrawals come last so they never exceed what the user had earned
+            for user in users:
+                if wallet[user.pk] >= 1000 and rng.random() < 0.4:
+                    amount = Decimal(rng.randrange(1000, int(wallet[user.pk]) + 1, 500))
+                    requested = self.start + timedelta(days=self.options['days'], hours=rng.randint(0, 72))
+                    withdrawals.append(WithdrawalRequest(
+                        user=user, amount=amount, bank_name=rng.choice(['Access Bank', 'GTBank', 'Opay', 'Zenith Bank']),
+                        account_number=f'{rng.randrange(10 ** 10):010d}', account_name=user.username,
+                        status=rng.choice(['pending', 'processing', 'completed']), created_at=requested,
+                    ))
+                    credit(user, -amount, 'payout',
+                           f'Withdrawal to {withdrawals[-1].bank_name} - {withdrawals[-1].account_number}', requested)
+
+            for profile in profiles:
+                profile.wallet_balance = wallet[profile.user.pk]
+                profile.total_earnings = earned[profile.user.pk]
+
+            # bulk_create skips the models' save() side effects; the ledger above replaces them
+            self.bulk_create(Coupon, coupons)
+            self.bulk_create(UserProfile, profiles)
+            self.bulk_create(Referral, referrals)
+            self.bulk_create(ContentSubmission, submissions)
+            self.bulk_create(GameParticipation, plays)
+            self.bulk_create(WithdrawalRequest, withdrawals)
+            self.bulk_create(Transaction, transactions)
+
+            if not self.options['skip_summary']:
+                UserEarningsSummary.objects.rebuild(users=users)
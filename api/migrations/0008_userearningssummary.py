@@ -0,0 +1,39 @@
+# Generated by Django 5.2.7 on 2026-10-18 00:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_referral_referee_package'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserEarningsSummary',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='earnings_summary', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('content_earnings', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('referral_earnings', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('game_earnings', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('daily_login_earnings', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('payout_total', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('package_purchase_total', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('tiktok_submissions', models.IntegerField(default=0)),
+                ('tiktok_approved', models.IntegerField(default=0)),
+                ('tiktok_earnings', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('instagram_submissions', models.IntegerField(default=0)),
+                ('instagram_approved', models.IntegerField(default=0)),
+                ('instagram_earnings', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('facebook_submissions', models.IntegerField(default=0)),
+                ('facebook_approved', models.IntegerField(default=0)),
+                ('facebook_earnings', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('referral_count', models.IntegerField(default=0)),
+                ('referral_total', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+            ],
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.7 on 2026-10-18 00:32
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_transaction_user_date_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='contentsubmission',
+            index=models.Index(fields=['user', 'status', 'platform'], name='content_user_status_plat_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contentsubmission',
+            index=models.Index(fields=['user', 'submission_date'], name='content_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='gameparticipation',
+            index=models.Index(fields=['user', 'game_type', 'participation_date'], name='game_user_type_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='referral',
+            index=models.Index(fields=['referrer', 'is_paid'], name='referral_referrer_paid_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='withdrawalrequest',
+            index=models.Index(fields=['user', 'status'], name='withdrawal_user_status_idx'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.7 on 2026-10-18 00:42
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_wallet_amounts(apps, schema_editor):
+    """Every existing row moved the wallet by its amount, except content
+    approvals; paid submissions get the wallet entry they never had"""
+    Transaction = apps.get_model('api', 'Transaction')
+    ContentSubmission = apps.get_model('api', 'ContentSubmission')
+    Transaction.objects.exclude(transaction_type='content').update(wallet_amount=F('amount'))
+
+    paid = ContentSubmission.objects.filter(status='paid', earnings__gt=0)
+    platforms = {'tiktok': 'TikTok', 'instagram': 'Instagram', 'facebook': 'Facebook'}
+    entries = [
+        Transaction(
+            user_id=submission.user_id, amount=0, wallet_amount=submission.earnings, transaction_type='content',
+            description=f'{platforms.get(submission.platform, submission.platform)} video paid to wallet',
+        )
+        for submission in paid.iterator()
+    ]
+    Transaction.objects.bulk_create(entries, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_hot_query_indexes'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceSnapshot',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='balance_snapshot', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('last_transaction_id', models.BigIntegerField(default=0)),
+                ('wallet_balance', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('total_earnings', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='wallet_amount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['user', 'id'], name='transaction_user_id_idx'),
+        ),
+        migrations.RunPython(backfill_wallet_amounts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-18 00:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_withdrawal_payout_batches'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='withdrawalrequest',
+            name='failure_reason',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='withdrawalrequest',
+            name='transfer_code',
+            field=models.CharField(blank=True, max_length=50),
+        ),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations
+from django.db.models import Q
+
+from api.codes import referral_code
+
+
+def fill_missing_codes(apps, schema_editor):
+    """Existing codes (META####) are kept; profiles without one get the derived code"""
+    UserProfile = apps.get_model('api', 'UserProfile')
+    missing = list(UserProfile.objects.filter(Q(referral_code__isnull=True) | Q(referral_code='')).only('id', 'user_id'))
+    for profile in missing:
+        profile.referral_code = referral_code(profile.user_id)
+    UserProfile.objects.bulk_update(missing, ['referral_code'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_outbox_messages'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_missing_codes, migrations.RunPython.noop),
+    ]
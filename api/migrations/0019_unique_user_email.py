@@ -0,0 +1,59 @@
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+EMAIL_CONSTRAINT = models.UniqueConstraint(
+    fields=['email'], condition=~models.Q(email=''), name='api_user_email_uniq',
+)
+
+
+def check_duplicate_emails(apps, schema_editor):
+    """Stop before adding the constraint if accounts already share an email.
+
+    Older sign-ups didn't always reject a taken email, and these accounts can
+    hold wallet balances, so they aren't merged or renamed automatically:
+    resolve them in the admin (e.g. give all but one a different email) and
+    migrate again.
+    """
+    if not schema_editor.connection.features.supports_partial_indexes:
+        return
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    duplicates = (
+        User.objects.exclude(email='').values('email').annotate(count=Count('id')).filter(count__gt=1)
+        .values_list('email', flat=True)
+    )
+    clashes = {}
+    for user_id, email in User.objects.filter(email__in=list(duplicates)).order_by('email', 'id').values_list('id', 'email'):
+        clashes.setdefault(email, []).append(user_id)
+    if clashes:
+        listing = '; '.join(f'{email}: users {", ".join(map(str, ids))}' for email, ids in clashes.items())
+        raise RuntimeError(f'Cannot add the unique email constraint, these accounts share an email: {listing}')
+
+
+def add_email_constraint(apps, schema_editor):
+    # A partial unique index; schema editors without partial index support
+    # (MySQL) skip it and registration.register() checks for a taken email instead
+    schema_editor.add_constraint(apps.get_model(settings.AUTH_USER_MODEL), EMAIL_CONSTRAINT)
+
+
+def remove_email_constraint(apps, schema_editor):
+    schema_editor.remove_constraint(apps.get_model(settings.AUTH_USER_MODEL), EMAIL_CONSTRAINT)
+
+
+class Migration(migrations.Migration):
+    """Sign-up relies on the database to reject a taken email (see api/registration.py).
+
+    auth_user belongs to django.contrib.auth, so the constraint is added
+    through the schema editor rather than the model state. Blank emails
+    (createsuperuser, admin-made accounts) are left out of it.
+    """
+
+    dependencies = [
+        ('api', '0018_coupon_batches'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_emails, migrations.RunPython.noop),
+        migrations.RunPython(add_email_constraint, remove_email_constraint),
+    ]
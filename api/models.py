@@ -1,10 +1,22 @@
-from django.db import models
+import logging
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, Max, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.utils import timezone
-import secrets
-import random  # Add this import
+from collections import defaultdict
+from datetime import timedelta
 from decimal import Decimal
 
+from .codes import referral_code
+from .log import AUDIT
+from .state import StateMachine, TrackedModel
+
+logger = logging.getLogger(__name__)
+
 # Create your models here.
 
 class Package(models.Model):
@@ -28,9 +40,26 @@ class Package(models.Model):
     def __str__(self):
         return f"{self.name} - ₦{self.price}"
 
+class CouponBatch(models.Model):
+    """Coupons minted together for one package (see api/coupons.py), exported as one CSV"""
+    # Largest batch one call may mint
+    MAX_QUANTITY = 100000
+    
+    package = models.ForeignKey(Package, on_delete=models.CASCADE, related_name='coupon_batches')
+    quantity = models.IntegerField(validators=[MinValueValidator(1), MaxValueValidator(MAX_QUANTITY)])
+    created_at = models.DateTimeField(auto_now_add=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='coupon_batches')
+    
+    class Meta:
+        verbose_name_plural = 'coupon batches'
+    
+    def __str__(self):
+        return f"Coupon batch {self.pk} - {self.quantity} {self.package.package_type} coupons"
+
 class Coupon(models.Model):
     coupon_code = models.CharField(max_length=22, unique=True)
     package = models.ForeignKey(Package, on_delete=models.CASCADE)
+    batch = models.ForeignKey(CouponBatch, on_delete=models.SET_NULL, null=True, blank=True, related_name='coupons')
     is_used = models.BooleanField(default=False)
     used_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -57,12 +86,8 @@ class UserProfile(models.Model):
     
     def save(self, *args, **kwargs):
         if not self.referral_code:
-            # Generate unique referral code: META + 4-digit number
-            while True:
-                code = f"META{random.randint(1000, 9999)}"
-                if not UserProfile.objects.filter(referral_code=code).exists():
-                    self.referral_code = code
-                    break
+            # Derived from the user id: unique without a lookup (see api/codes.py)
+            self.referral_code = referral_code(self.user_id)
         super().save(*args, **kwargs)
     
     def __str__(self):
@@ -142,7 +167,61 @@ class UserProfile(models.Model):
         return f"{self.user.username} - {self.platform}" 
         """
 
-class ContentSubmission(models.Model):
+class ContentSubmissionQuerySet(models.QuerySet):
+    """Bulk status transitions; the per-row equivalents are ContentSubmission's enter_* hooks"""
+
+    def approve(self, batch_size=500):
+        """Approve every pending submission in the queryset. Returns the number approved."""
+        return self._transition('pending', 'approved', 'approved_at', batch_size)
+
+    def mark_paid(self, batch_size=500):
+        """Pay every approved submission's earnings into its owner's wallet. Returns the number paid."""
+        return self._transition('approved', 'paid', 'paid_at', batch_size)
+
+    def _transition(self, from_status, to_status, timestamp_field, batch_size):
+        from . import ledger
+        from .cache import invalidate_user
+
+        with transaction.atomic():
+            submissions = list(self.filter(status=from_status).select_for_update())
+            if not submissions:
+                return 0
+
+            now = timezone.now()
+            entries = []
+            increments = defaultdict(lambda: defaultdict(int))
+            summary_deltas = defaultdict(lambda: defaultdict(int))
+            for submission in submissions:
+                submission.status = to_status
+                setattr(submission, timestamp_field, now)
+                if to_status == 'approved':
+                    # Same side effects as approving one submission through save()
+                    summary_deltas[submission.user_id][f'{submission.platform}_approved'] += 1
+                    summary_deltas[submission.user_id][f'{submission.platform}_earnings'] += submission.earnings
+                if submission.earnings <= 0:
+                    continue
+                if to_status == 'approved':
+                    increments[submission.user_id]['approved_submissions'] += 1
+                    entries.append(Transaction(
+                        user_id=submission.user_id, amount=submission.earnings, wallet_amount=0,
+                        transaction_type='content', description=f'{submission.get_platform_display()} video approved',
+                    ))
+                else:
+                    entries.append(Transaction(
+                        user_id=submission.user_id, amount=0, wallet_amount=submission.earnings,
+                        transaction_type='content',
+                        description=f'{submission.get_platform_display()} video paid to wallet',
+                    ))
+
+            self.model.objects.bulk_update(submissions, ['status', timestamp_field], batch_size=batch_size)
+            ledger.post_many(entries, increments=increments, summary_increments=summary_deltas, batch_size=batch_size)
+            # bulk_update() skips post_save, and post_many() only reaches users with a ledger entry
+            for user_id in {submission.user_id for submission in submissions}:
+                invalidate_user(user_id)
+        return len(submissions)
+
+
+class ContentSubmission(TrackedModel):
     PLATFORM_CHOICES = [
         ('tiktok', 'TikTok'),
         ('instagram', 'Instagram'),
@@ -167,55 +246,75 @@ class ContentSubmission(models.Model):
     approved_at = models.DateTimeField(null=True, blank=True)
     paid_at = models.DateTimeField(null=True, blank=True)
     
+    objects = ContentSubmissionQuerySet.as_manager()
+    
+    status_machine = StateMachine('status', {
+        'pending': ['approved', 'rejected'],
+        'approved': ['paid'],
+    }, initial='pending')
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'status', 'platform'], name='content_user_status_plat_idx'),
+            models.Index(fields=['user', 'submission_date'], name='content_user_date_idx'),
+        ]
+    
+    def clean(self):
+        super().clean()
+        ContentSubmission.status_machine.validate(self)
+    
     def save(self, *args, **kwargs):
-        is_new = self._state.adding
-        old_status = None
-        
-        # Get old status if updating
-        if not is_new:
-            try:
-                old_instance = ContentSubmission.objects.get(pk=self.pk)
-                old_status = old_instance.status
-            except ContentSubmission.DoesNotExist:
-                pass
-        
-        # Update user's total submissions count when new submission is created
-        if is_new:
-            profile = self.user.userprofile
-            profile.total_submissions += 1
-            profile.save()
-        
-        # Handle approval - ADD TO TOTAL EARNINGS WHEN APPROVED
-        if self.status == 'approved' and old_status != 'approved':
-            self.approved_at = timezone.now()
-            
-            # Only add to total_earnings if this is a new approval
-            if self.earnings > 0:
-                profile = self.user.userprofile
-                profile.total_earnings += self.earnings  # ADD TO TOTAL EARNINGS
-                profile.approved_submissions += 1
-                profile.save()
-                
-                # Create transaction record
-                Transaction.objects.create(
-                    user=self.user,
-                    amount=self.earnings,
-                    transaction_type='content',
-                    description=f'{self.get_platform_display()} video approved'
-                )
-                print(f"✅ Added ₦{self.earnings} to total earnings for {self.user.username}'s {self.platform} video")
-        
-        # Handle payment - Add to wallet when marked as paid
-        if self.status == 'paid' and old_status != 'paid':
-            self.paid_at = timezone.now()
-            # Add earnings to wallet (total_earnings was already added in approval)
-            if self.earnings > 0:
-                profile = self.user.userprofile
-                profile.wallet_balance += self.earnings
-                profile.save()
-                print(f"✅ Added ₦{self.earnings} to wallet for {self.user.username}'s {self.platform} video")
-        
-        super().save(*args, **kwargs)
+        # Reject undeclared moves up front; after that the status hooks and the row
+        # write commit (or roll back) together, with the caller's block if any
+        ContentSubmission.status_machine.validate(self)
+        with transaction.atomic(savepoint=False):
+            ContentSubmission.status_machine.apply(self)
+            super().save(*args, **kwargs)
+    
+    # Status hooks, called once per transition by status_machine.apply()
+    
+    def enter_pending(self, source):
+        """New submission: count it (the counters are rolled up by the outbox worker)"""
+        from . import outbox
+        outbox.enqueue('submission_created', user_id=self.user_id, platform=self.platform)
+    
+    def enter_approved(self, source):
+        """ADD TO TOTAL EARNINGS WHEN APPROVED; the wallet is credited when paid"""
+        from . import ledger
+        self.approved_at = timezone.now()
+        if self.earnings > 0:
+            ledger.post(
+                self.user_id,
+                self.earnings,
+                'content',
+                f'{self.get_platform_display()} video approved',
+                wallet=False,
+                increments={'approved_submissions': 1}
+            )
+            logger.info('Content earnings approved', extra={
+                'user_id': self.user_id, 'submission_id': self.pk, 'platform': self.platform, 'amount': self.earnings,
+                **AUDIT,
+            })
+        UserEarningsSummary.objects.bump(
+            self.user_id, **{f'{self.platform}_approved': 1, f'{self.platform}_earnings': self.earnings}
+        )
+    
+    def enter_paid(self, source):
+        """Add earnings to wallet (total_earnings was already added in approval)"""
+        from . import ledger
+        self.paid_at = timezone.now()
+        if self.earnings > 0:
+            ledger.post(
+                self.user_id,
+                self.earnings,
+                'content',
+                f'{self.get_platform_display()} video paid to wallet',
+                earnings=False
+            )
+            logger.info('Content earnings paid to wallet', extra={
+                'user_id': self.user_id, 'submission_id': self.pk, 'platform': self.platform, 'amount': self.earnings,
+                **AUDIT,
+            })
     
     def __str__(self):
         return f"{self.user.username} - {self.platform}"
@@ -230,8 +329,16 @@ class Referral(models.Model):
     
     class Meta:
         unique_together = ('referrer', 'referee')
+        indexes = [
+            models.Index(fields=['referrer', 'is_paid'], name='referral_referrer_paid_idx'),
+        ]
     
     def save(self, *args, **kwargs):
+        with transaction.atomic():
+            self._save_and_update_totals(*args, **kwargs)
+    
+    def _save_and_update_totals(self, *args, **kwargs):
+        is_new = not self.pk
         if not self.pk and not self.reward_earned:  # New referral
             # Get referee's package type
             if self.referee.userprofile.package:
@@ -244,20 +351,17 @@ class Referral(models.Model):
                     self.reward_earned = Decimal('3000.00')  # ₦3000 for Silver referral
                 
                 # Add to referrer's wallet and total earnings
-                referrer_profile = self.referrer.userprofile
-                referrer_profile.wallet_balance += self.reward_earned
-                referrer_profile.total_earnings += self.reward_earned
-                referrer_profile.save()
-                
-                # Create transaction
-                Transaction.objects.create(
-                    user=self.referrer,
-                    amount=self.reward_earned,
-                    transaction_type='referral',
-                    description=f'Referral bonus for {self.referee.username} ({self.referee_package.title()} package)'
+                from . import ledger
+                ledger.post(
+                    self.referrer_id,
+                    self.reward_earned,
+                    'referral',
+                    f'Referral bonus for {self.referee.username} ({self.referee_package.title()} package)'
                 )
         
         super().save(*args, **kwargs)
+        if is_new:
+            UserEarningsSummary.objects.bump(self.referrer, referral_count=1, referral_total=self.reward_earned)
     
     def __str__(self):
         return f"{self.referrer.username} → {self.referee.username} ({self.referee_package})"
@@ -275,21 +379,17 @@ class GameParticipation(models.Model):
     reward_earned = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     game_data = models.JSONField(default=dict)
     
+    class Meta:
+        indexes = [
+            # Once-per-day check: user + game_type + today's participation_date range
+            models.Index(fields=['user', 'game_type', 'participation_date'], name='game_user_type_date_idx'),
+        ]
+    
     def save(self, *args, **kwargs):
         if self.reward_earned > 0 and not self._state.adding:
-            # Update user's wallet
-            profile = self.user.userprofile
-            profile.wallet_balance += self.reward_earned
-            profile.total_earnings += self.reward_earned
-            profile.save()
-            
-            # Create transaction
-            Transaction.objects.create(
-                user=self.user,
-                amount=self.reward_earned,
-                transaction_type='game',
-                description=f'{self.get_game_type_display()} reward'
-            )
+            # Credit wallet and total earnings, with its transaction
+            from . import ledger
+            ledger.post(self.user_id, self.reward_earned, 'game', f'{self.get_game_type_display()} reward')
         
         super().save(*args, **kwargs)
     
@@ -307,15 +407,55 @@ class Transaction(models.Model):
     ]
     
     user = models.ForeignKey(User, on_delete=models.CASCADE)
+    # Change to total earnings
     amount = models.DecimalField(max_digits=10, decimal_places=2)
+    # Change to the wallet; differs from amount for content, which counts
+    # towards earnings when approved and reaches the wallet when paid
+    wallet_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     transaction_type = models.CharField(max_length=20, choices=TRANSACTION_TYPES)
     description = models.TextField()
     date = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        indexes = [
+            # Statement scrolling: WHERE user = ? ORDER BY date DESC, id DESC
+            models.Index(fields=['user', 'date'], name='transaction_user_date_idx'),
+            # Balance reads: WHERE user = ? AND id > <snapshot high-water mark>
+            models.Index(fields=['user', 'id'], name='transaction_user_id_idx'),
+        ]
+    
     def __str__(self):
         return f"{self.user.username} - {self.transaction_type} - ₦{self.amount}"
 
-class WithdrawalRequest(models.Model):
+class WithdrawalRequestQuerySet(models.QuerySet):
+    def with_priority(self):
+        """Annotate ``queue_priority`` (the owner's package withdrawal_priority) via joins"""
+        return self.annotate(queue_priority=Coalesce(
+            'user__userprofile__package__withdrawal_priority', WithdrawalRequest.DEFAULT_PRIORITY
+        ))
+
+    def pending_queue(self):
+        """Pending requests in processing order: package priority, then oldest first"""
+        return self.filter(status='pending').with_priority().order_by('queue_priority', 'created_at', 'id')
+
+
+class PayoutBatch(models.Model):
+    """A set of withdrawals claimed together and sent to the bank as one payout file"""
+    created_at = models.DateTimeField(auto_now_add=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='payout_batches')
+    withdrawal_count = models.IntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    
+    class Meta:
+        verbose_name_plural = 'payout batches'
+    
+    def __str__(self):
+        return f"Payout batch {self.pk} - {self.withdrawal_count} withdrawals - ₦{self.total_amount}"
+
+class WithdrawalRequest(TrackedModel):
+    # Lower number = higher priority; used when the user has no package
+    DEFAULT_PRIORITY = 2
+    
     STATUS_CHOICES = [
         ('pending', 'Pending'),
         ('processing', 'Processing'),
@@ -331,13 +471,422 @@ class WithdrawalRequest(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     created_at = models.DateTimeField(auto_now_add=True)
     processed_at = models.DateTimeField(null=True, blank=True)
+    batch = models.ForeignKey(PayoutBatch, on_delete=models.SET_NULL, null=True, blank=True, related_name='withdrawals')
+    # Set once the transfer has been submitted to Paystack
+    transfer_code = models.CharField(max_length=50, blank=True)
+    failure_reason = models.TextField(blank=True)
+    
+    objects = WithdrawalRequestQuerySet.as_manager()
+    
+    # pending -> completed is for payouts an admin settled outside Paystack
+    status_machine = StateMachine('status', {
+        'pending': ['processing', 'completed', 'failed'],
+        'processing': ['completed', 'failed'],
+    }, initial='pending')
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'status'], name='withdrawal_user_status_idx'),
+            # Processing queue: WHERE status = 'pending' ORDER BY ..., created_at
+            models.Index(fields=['status', 'created_at'], name='withdrawal_status_created_idx'),
+        ]
     
     @property
     def priority(self):
-        """Get withdrawal priority based on user's package"""
+        """Get withdrawal priority based on user's package (free when loaded via with_priority())"""
+        if hasattr(self, 'queue_priority'):
+            return self.queue_priority
         if self.user.userprofile.package:
             return self.user.userprofile.package.withdrawal_priority
-        return 2  # Default priority
+        return self.DEFAULT_PRIORITY
+    
+    def clean(self):
+        super().clean()
+        WithdrawalRequest.status_machine.validate(self)
+    
+    def save(self, *args, **kwargs):
+        # Reject undeclared moves up front; after that the status hooks and the row
+        # write commit (or roll back) together, with the caller's block if any
+        WithdrawalRequest.status_machine.validate(self)
+        with transaction.atomic(savepoint=False):
+            WithdrawalRequest.status_machine.apply(self)
+            super().save(*args, **kwargs)
+    
+    # Status hooks, called once per transition by status_machine.apply()
+    
+    def enter_processing(self, source):
+        """Send the transfer to Paystack once the claim is committed (when Paystack is configured)"""
+        from django.conf import settings
+        from . import payouts
+        if settings.PAYSTACK_SECRET_KEY:
+            transaction.on_commit(lambda: payouts.send_transfers_safely(WithdrawalRequest.objects.filter(pk=self.pk)))
+    
+    def enter_completed(self, source):
+        self.processed_at = timezone.now()
+    
+    def enter_failed(self, source):
+        """The money never left: put it back in the wallet (and total earnings) through the ledger"""
+        from . import ledger
+        self.processed_at = timezone.now()
+        ledger.post(
+            self.user_id,
+            self.amount,
+            'payout',
+            f'Refund for failed withdrawal to {self.bank_name} - {self.account_number}'
+        )
+    
+    def __str__(self):
+        return f"{self.user.username} - ₦{self.amount} - {self.status}"
+
+
+class PaystackEvent(models.Model):
+    """A webhook event exactly as Paystack sent it, queued for the process_paystack_events worker"""
+    # Paystack doesn't send a global event id; "<event>:<data.id>" identifies a delivery's subject
+    event_id = models.CharField(max_length=100, unique=True)
+    event = models.CharField(max_length=50)
+    payload = models.JSONField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+    
+    class Meta:
+        indexes = [
+            # Worker queue: WHERE processed_at IS NULL ORDER BY id
+            models.Index(fields=['processed_at', 'id'], name='paystack_event_queue_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.event_id} ({'processed' if self.processed_at else 'queued'})"
+
+
+class IdempotencyKey(models.Model):
+    """The stored response to a POST sent with an Idempotency-Key header, replayed to retries"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=255)
+    # sha256 of the request body: the same key with a different body is a client bug, not a retry
+    request_hash = models.CharField(max_length=64)
+    status_code = models.IntegerField()
+    response = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('user', 'key')
+
+    def __str__(self):
+        return f"{self.user_id}:{self.key} ({self.status_code})"
+
+
+class OutboxMessage(models.Model):
+    """Follow-up work written in the same transaction as the change that caused it (see api/outbox.py)"""
+    topic = models.CharField(max_length=50)
+    payload = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            # Worker queue: WHERE processed_at IS NULL ORDER BY id
+            models.Index(fields=['processed_at', 'id'], name='outbox_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.topic} #{self.pk} ({'processed' if self.processed_at else 'queued'})"
+
+
+def add_grouped_deltas(queryset, deltas_by_user, batch_size=500):
+    """Add different per-user deltas to many rows with one UPDATE per batch of users.
+
+    ``deltas_by_user`` maps user id -> {field: delta}; each field becomes
+    ``field = field + CASE user_id WHEN ... END``.
+    """
+    return _add_grouped_deltas(queryset, deltas_by_user, batch_size)[0]
+
+
+def _add_grouped_deltas(queryset, deltas_by_user, batch_size=500):
+    """add_grouped_deltas() returning (user ids with a delta, rows updated)"""
+    user_ids = [user_id for user_id, deltas in deltas_by_user.items() if any(deltas.values())]
+    updated = 0
+    for start in range(0, len(user_ids), batch_size):
+        batch = user_ids[start:start + batch_size]
+        updates = {}
+        for field in {field for user_id in batch for field in deltas_by_user[user_id]}:
+            whens = [
+                models.When(user_id=user_id, then=models.Value(deltas_by_user[user_id][field]))
+                for user_id in batch if deltas_by_user[user_id].get(field)
+            ]
+            if whens:
+                output_field = queryset.model._meta.get_field(field)
+                updates[field] = models.F(field) + models.Case(
+                    *whens, default=models.Value(0), output_field=output_field
+                )
+        if updates:
+            updated += queryset.filter(user_id__in=batch).update(**updates)
+    return user_ids, updated
+
+
+class UserEarningsSummaryManager(models.Manager):
+    def _lock_users(self, user_ids):
+        """Lock the users' rows until the transaction ends; for_user() rebuilds under the same lock"""
+        list(User.objects.select_for_update().filter(pk__in=user_ids).values_list('pk', flat=True))
+
+    def bump(self, user, **deltas):
+        """Apply counter deltas to a user's summary row with a single UPDATE.
+
+        With no row yet, for_user() may be rebuilding it right now from data
+        that can't include this uncommitted write, so the bump waits on the
+        rebuild's user lock and tries again. Still no row: the next read
+        builds it from the raw tables, this write included.
+        """
+        updates = {field: models.F(field) + delta for field, delta in deltas.items() if delta}
+        if updates and not self.filter(user=user).update(**updates):
+            with transaction.atomic():
+                self._lock_users([getattr(user, 'pk', user)])
+                self.filter(user=user).update(**updates)
+
+    def bump_many(self, deltas_by_user):
+        """bump() for many users at once: {user_id: {field: delta}}"""
+        user_ids, updated = _add_grouped_deltas(self.all(), deltas_by_user)
+        if updated < len(user_ids):
+            missing = set(user_ids) - set(self.filter(user_id__in=user_ids).values_list('user_id', flat=True))
+            with transaction.atomic():
+                self._lock_users(missing)
+                add_grouped_deltas(self.all(), {user_id: deltas_by_user[user_id] for user_id in missing})
+
+    def record_transaction(self, user, transaction_type, amount):
+        field = UserEarningsSummary.TRANSACTION_FIELDS.get(transaction_type)
+        if field:
+            self.bump(user, **{field: amount})
+
+    def for_user(self, user):
+        """Single-row primary key lookup, rebuilding the row if it is missing"""
+        try:
+            return self.get(user=user)
+        except UserEarningsSummary.DoesNotExist:
+            try:
+                with transaction.atomic():
+                    # Writers that find no row wait for this rebuild before bumping (see bump())
+                    self._lock_users([getattr(user, 'pk', user)])
+                    self.rebuild(users=[user])
+            except IntegrityError:
+                pass  # Another request rebuilt it first
+            return self.get(user=user)
+
+    def _pending_rollups(self, user_ids=None):
+        """{user_id: {field: delta}} that unprocessed outbox messages will still add (see api/outbox.py)"""
+        messages = OutboxMessage.objects.filter(
+            processed_at__isnull=True, topic__in=['submission_created', 'referral_bonus']
+        )
+        if user_ids is not None:
+            messages = messages.filter(Q(payload__user_id__in=user_ids) | Q(payload__referrer_id__in=user_ids))
+        pending = defaultdict(lambda: defaultdict(int))
+        for topic, payload in messages.values_list('topic', 'payload'):
+            if topic == 'submission_created':
+                pending[payload['user_id']][f'{payload["platform"]}_submissions'] += 1
+            elif payload.get('count_referral'):
+                pending[payload['referrer_id']]['referral_count'] += 1
+                pending[payload['referrer_id']]['referral_total'] += Decimal(payload['amount'])
+        return pending
+
+    def rebuild(self, users=None, batch_size=1000):
+        """Recompute summary rows from Transaction, ContentSubmission and Referral.
+
+        Counter rollups still queued in the outbox are left out; the worker
+        adds them when it runs. Rebuilds every user when ``users`` is None.
+        Returns the number of rows written.
+        """
+        user_ids = User.objects.values_list('id', flat=True)
+        transactions = Transaction.objects.all()
+        submissions = ContentSubmission.objects.all()
+        referrals = Referral.objects.all()
+        if users is not None:
+            user_ids = user_ids.filter(pk__in=[getattr(u, 'pk', u) for u in users])
+            transactions = transactions.filter(user_id__in=user_ids)
+            submissions = submissions.filter(user_id__in=user_ids)
+            referrals = referrals.filter(referrer_id__in=user_ids)
+
+        rows = {user_id: UserEarningsSummary(user_id=user_id) for user_id in user_ids}
+
+        transaction_totals = transactions.values('user_id').annotate(**{
+            field: Sum('amount', filter=Q(transaction_type=transaction_type))
+            for transaction_type, field in UserEarningsSummary.TRANSACTION_FIELDS.items()
+        })
+        for totals in transaction_totals:
+            user_id = totals.pop('user_id')
+            summary = rows.setdefault(user_id, UserEarningsSummary(user_id=user_id))
+            for field, value in totals.items():
+                setattr(summary, field, value or 0)
+
+        approved = Q(status__in=UserEarningsSummary.APPROVED_STATUSES)
+        submission_aggregates = {}
+        for platform, _ in ContentSubmission.PLATFORM_CHOICES:
+            submission_aggregates[f'{platform}_submissions'] = Count('id', filter=Q(platform=platform))
+            submission_aggregates[f'{platform}_approved'] = Count('id', filter=Q(platform=platform) & approved)
+            submission_aggregates[f'{platform}_earnings'] = Sum('earnings', filter=Q(platform=platform) & approved)
+        submission_totals = submissions.values('user_id').annotate(**submission_aggregates)
+        for totals in submission_totals:
+            user_id = totals.pop('user_id')
+            summary = rows.setdefault(user_id, UserEarningsSummary(user_id=user_id))
+            for field, value in totals.items():
+                setattr(summary, field, value or 0)
+
+        referral_totals = referrals.values('referrer_id').annotate(
+            referral_count=Count('id'), referral_total=Sum('reward_earned')
+        )
+        for totals in referral_totals:
+            user_id = totals['referrer_id']
+            summary = rows.setdefault(user_id, UserEarningsSummary(user_id=user_id))
+            summary.referral_count = totals['referral_count']
+            summary.referral_total = totals['referral_total'] or 0
+
+        # Rows whose outbox rollup hasn't run yet are counted already; the worker would count them again
+        for user_id, deltas in self._pending_rollups(None if users is None else list(rows)).items():
+            if user_id in rows:
+                for field, delta in deltas.items():
+                    setattr(rows[user_id], field, getattr(rows[user_id], field) - delta)
+
+        with transaction.atomic():
+            if users is None:
+                self.all().delete()
+            else:
+                self.filter(user_id__in=list(rows)).delete()
+            self.bulk_create(rows.values(), batch_size=batch_size)
+        return len(rows)
+
+
+class UserEarningsSummary(models.Model):
+    """Per-user running totals, kept in step with every earning/payout write"""
+    TRANSACTION_FIELDS = {
+        'content': 'content_earnings',
+        'referral': 'referral_earnings',
+        'game': 'game_earnings',
+        'daily_login': 'daily_login_earnings',
+        'payout': 'payout_total',
+        'package_purchase': 'package_purchase_total',
+    }
+    APPROVED_STATUSES = ('approved', 'paid')
+    
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='earnings_summary')
+    
+    # Sum of Transaction.amount per transaction type
+    content_earnings = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    referral_earnings = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    game_earnings = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    daily_login_earnings = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    payout_total = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    package_purchase_total = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    
+    # Content submissions per platform (approved = approved or paid)
+    tiktok_submissions = models.IntegerField(default=0)
+    tiktok_approved = models.IntegerField(default=0)
+    tiktok_earnings = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    instagram_submissions = models.IntegerField(default=0)
+    instagram_approved = models.IntegerField(default=0)
+    instagram_earnings = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    facebook_submissions = models.IntegerField(default=0)
+    facebook_approved = models.IntegerField(default=0)
+    facebook_earnings = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    
+    # Referrals made by this user
+    referral_count = models.IntegerField(default=0)
+    referral_total = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    
+    objects = UserEarningsSummaryManager()
+    
+    def platform_stats(self, platform):
+        return {
+            'earnings': getattr(self, f'{platform}_earnings'),
+            'submissions': getattr(self, f'{platform}_submissions'),
+            'approved': getattr(self, f'{platform}_approved'),
+        }
+    
+    @property
+    def submission_count(self):
+        return sum(getattr(self, f'{platform}_submissions') for platform, _ in ContentSubmission.PLATFORM_CHOICES)
+    
+    def __str__(self):
+        return f"{self.user.username} - earnings summary"
+
+
+class BalanceSnapshotManager(models.Manager):
+    def balances(self, user):
+        """(wallet_balance, total_earnings) from the ledger: snapshot plus newer transactions.
+
+        One query whatever the history length; users without a snapshot sum
+        their whole ledger.
+        """
+        newer = Transaction.objects.filter(
+            user_id=OuterRef('pk'),
+            id__gt=Coalesce(OuterRef('balance_snapshot__last_transaction_id'), 0)
+        ).values('user_id')
+        zero = models.Value(Decimal('0'), output_field=models.DecimalField())
+        row = User.objects.filter(pk=getattr(user, 'pk', user)).values_list(
+            Coalesce('balance_snapshot__wallet_balance', zero)
+            + Coalesce(Subquery(newer.annotate(total=Sum('wallet_amount')).values('total')), zero),
+            Coalesce('balance_snapshot__total_earnings', zero)
+            + Coalesce(Subquery(newer.annotate(total=Sum('amount')).values('total')), zero),
+        ).get()
+        return tuple(value.quantize(Decimal('0.01')) for value in row)
+
+    def compact(self, users=None, settle_seconds=60, batch_size=1000):
+        """Roll snapshots forward to the newest settled transaction, in bulk.
+
+        Transactions younger than ``settle_seconds`` are left for the next run,
+        so a slow writer committing a lower id after the high-water mark moved
+        can't be skipped. Returns the number of snapshots written.
+        """
+        settled = Transaction.objects.filter(date__lte=timezone.now() - timedelta(seconds=settle_seconds))
+        high_water = settled.aggregate(high_water=Max('id'))['high_water']
+        if high_water is None:
+            return 0
+
+        snapshot_mark = self.filter(user_id=OuterRef('user_id')).values('last_transaction_id')
+        pending = Transaction.objects.filter(id__lte=high_water, id__gt=Coalesce(Subquery(snapshot_mark), 0))
+        if users is not None:
+            pending = pending.filter(user_id__in=[getattr(u, 'pk', u) for u in users])
+        user_ids = list(pending.values_list('user_id', flat=True).distinct().order_by('user_id'))
+
+        written = 0
+        for start in range(0, len(user_ids), batch_size):
+            batch = user_ids[start:start + batch_size]
+            with transaction.atomic():
+                # Lock existing snapshots so two compactions can't add the same deltas
+                snapshots = {s.user_id: s for s in self.select_for_update().filter(user_id__in=batch)}
+                deltas = pending.filter(user_id__in=batch).values('user_id').annotate(
+                    wallet=Sum('wallet_amount'), earnings=Sum('amount')
+                )
+                created, now = [], timezone.now()
+                for delta in deltas:
+                    snapshot = snapshots.get(delta['user_id'])
+                    if snapshot is None:
+                        snapshot = BalanceSnapshot(user_id=delta['user_id'])
+                        created.append(snapshot)
+                    snapshot.wallet_balance += delta['wallet']
+                    snapshot.total_earnings += delta['earnings']
+                    snapshot.last_transaction_id = high_water
+                    snapshot.updated_at = now
+                self.bulk_update(
+                    snapshots.values(), ['wallet_balance', 'total_earnings', 'last_transaction_id', 'updated_at'],
+                    batch_size=batch_size
+                )
+                # A concurrent run may have created a user's first snapshot since the lock above; its row
+                # wins (it covers the same settled transactions, from the same starting point of zero)
+                self.bulk_create(created, batch_size=batch_size, ignore_conflicts=True)
+                written += len(snapshots) + len(created)
+        return written
+
+
+class BalanceSnapshot(models.Model):
+    """A user's ledger balances up to and including ``last_transaction_id``"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='balance_snapshot')
+    last_transaction_id = models.BigIntegerField(default=0)
+    wallet_balance = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    total_earnings = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    objects = BalanceSnapshotManager()
     
     def __str__(self):
-        return f"{self.user.username} - ₦{self.amount} - {self.status}"
\ No newline at end of file
+        return f"{self.user.username} - balance at transaction {self.last_transaction_id}"
@@ -0,0 +1,127 @@
+"""Transactional outbox for follow-up work that doesn't have to finish inside the request.
+
+enqueue() writes an OutboxMessage in the caller's transaction, so the work
+is queued exactly when the change that caused it commits. The process_outbox
+worker runs the queued messages in batches, one handler call per topic, so
+e.g. a burst of content submissions becomes one grouped counter UPDATE.
+
+    @handler('topic')
+    def handle_topic(payloads): ...   # list of payload dicts, oldest first
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import ledger
+from .cache import invalidate_auth_user, invalidate_user
+from .models import OutboxMessage, Transaction, UserEarningsSummary, UserProfile, add_grouped_deltas
+
+# Give up on a message after this many failed attempts (the admin can retry it)
+MAX_ATTEMPTS = 5
+
+HANDLERS = {}
+
+
+def handler(topic):
+    def register(func):
+        HANDLERS[topic] = func
+        return func
+    return register
+
+
+def enqueue(topic, **payload):
+    """Queue ``payload`` for the ``topic`` handler; call it inside the transaction doing the write"""
+    if topic not in HANDLERS:
+        raise ValueError(f'No outbox handler for {topic}')
+    message = OutboxMessage.objects.create(topic=topic, payload=payload)
+    if settings.OUTBOX_EAGER:
+        # Development without a worker: run it as soon as the write commits
+        transaction.on_commit(process_pending)
+    return message
+
+
+def process_pending(batch_size=500):
+    """Run queued messages oldest first, batch by batch. Returns {topic: messages processed}.
+
+    Each topic's messages in a batch go to its handler together. If that
+    call fails, they are retried one by one so only the bad message fails;
+    failures stay queued with the error and are retried on later runs.
+    """
+    processed, last_id = defaultdict(int), 0
+    while True:
+        with transaction.atomic():
+            messages = list(
+                OutboxMessage.objects.filter(processed_at__isnull=True, attempts__lt=MAX_ATTEMPTS, id__gt=last_id)
+                .order_by('id').select_for_update(skip_locked=True)[:batch_size]
+            )
+            if not messages:
+                return dict(processed)
+            last_id = messages[-1].id
+
+            by_topic = defaultdict(list)
+            for message in messages:
+                by_topic[message.topic].append(message)
+            for topic, batch in by_topic.items():
+                if not _run(topic, batch) and len(batch) > 1:
+                    for message in batch:
+                        _run(topic, [message])
+                for message in batch:
+                    message.attempts += 1
+                done = sum(1 for message in batch if message.processed_at)
+                if done:
+                    processed[topic] += done
+            OutboxMessage.objects.bulk_update(messages, ['processed_at', 'error', 'attempts'])
+
+
+def _run(topic, messages):
+    """Hand ``messages`` to the topic's handler in a savepoint and record the outcome on them"""
+    try:
+        with transaction.atomic():
+            HANDLERS[topic]([message.payload for message in messages])
+    except Exception as exc:
+        error = f'{type(exc).__name__}: {exc}'
+        for message in messages:
+            message.error = error
+        return False
+    done = timezone.now()
+    for message in messages:
+        message.processed_at, message.error = done, ''
+    return True
+
+
+@handler('submission_created')
+def count_submissions(payloads):
+    """Profile total_submissions and per-platform summary counters for new content submissions"""
+    profile_deltas = defaultdict(lambda: defaultdict(int))
+    summary_deltas = defaultdict(lambda: defaultdict(int))
+    for payload in payloads:
+        profile_deltas[payload['user_id']]['total_submissions'] += 1
+        summary_deltas[payload['user_id']][f'{payload["platform"]}_submissions'] += 1
+    for user_id in add_grouped_deltas(UserProfile.objects.all(), profile_deltas):
+        # The cached auth bundle carries the profile, total_submissions included
+        invalidate_auth_user(user_id)
+        invalidate_user(user_id)
+    UserEarningsSummary.objects.bump_many(summary_deltas)
+
+
+@handler('referral_bonus')
+def credit_referral_bonuses(payloads):
+    """Referrers' wallet credit for new sign-ups, plus their referral counters when the sign-up left them to us"""
+    referral_counts = defaultdict(lambda: defaultdict(int))
+    for payload in payloads:
+        if payload.get('count_referral'):
+            referral_counts[payload['referrer_id']]['referral_count'] += 1
+            referral_counts[payload['referrer_id']]['referral_total'] += Decimal(payload['amount'])
+    ledger.post_many([
+        Transaction(
+            user_id=payload['referrer_id'],
+            amount=Decimal(payload['amount']),
+            wallet_amount=Decimal(payload['amount']),
+            transaction_type='referral',
+            description=payload['description'],
+        )
+        for payload in payloads
+    ], summary_increments=referral_counts)
@@ -0,0 +1,17 @@
+from rest_framework.pagination import CursorPagination
+
+
+class KeysetPagination(CursorPagination):
+    """Opaque-cursor (keyset) pagination for every list endpoint.
+
+    Views set ``cursor_ordering`` to their natural ordering column so page N
+    is a ``WHERE col < last_seen ... LIMIT`` instead of an OFFSET scan.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = '-pk'
+    
+    def get_ordering(self, request, queryset, view):
+        self.ordering = getattr(view, 'cursor_ordering', self.ordering)
+        return super().get_ordering(request, queryset, view)
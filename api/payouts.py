@@ -0,0 +1,171 @@
+"""Withdrawal processing: claim pending requests in priority order, then pay them out
+through Paystack transfers or an exported bank payout file.
+
+Claiming locks the rows it takes (skipping rows another operator has locked,
+where the database supports it), so several operators can pull batches off
+the same queue at once without overlapping.
+"""
+import csv
+import logging
+
+from django.db import transaction
+from django.db.models import Sum
+from django.http import StreamingHttpResponse
+
+from payments import paystack
+
+from .cache import invalidate_user
+from .models import PayoutBatch, WithdrawalRequest
+from .streaming import Echo
+
+logger = logging.getLogger(__name__)
+
+PAYOUT_CSV_COLUMNS = [
+    'reference', 'account_name', 'account_number', 'bank_name', 'amount', 'priority', 'requested_at', 'username',
+]
+
+
+def claim_batch(size=100, operator=None, withdrawals=None):
+    """Claim up to ``size`` pending withdrawals into a new PayoutBatch and mark them processing.
+
+    ``withdrawals`` narrows the queue (e.g. to an admin selection). Returns
+    the batch, or None when nothing was left to claim.
+    """
+    queue = (withdrawals if withdrawals is not None else WithdrawalRequest.objects.all()).pending_queue()
+    with transaction.atomic():
+        # of=('self',): the priority joins are outer joins, which can't be locked
+        claimed = list(
+            queue.select_for_update(skip_locked=True, of=('self',)).values_list('id', 'user_id')[:size]
+        )
+        if not claimed:
+            return None
+
+        ids = [withdrawal_id for withdrawal_id, _ in claimed]
+        total = WithdrawalRequest.objects.filter(pk__in=ids).aggregate(total=Sum('amount'))['total']
+        batch = PayoutBatch.objects.create(created_by=operator, withdrawal_count=len(ids), total_amount=total)
+        WithdrawalRequest.objects.filter(pk__in=ids).update(status='processing', batch=batch)
+
+    # update() skips post_save, so drop the owners' cached dashboards here
+    for user_id in {user_id for _, user_id in claimed}:
+        invalidate_user(user_id)
+    return batch
+
+
+def payout_reference(withdrawal_id):
+    """Our reference for a withdrawal's transfer (Paystack wants lowercase, 16+ characters)"""
+    return f'wdr_{withdrawal_id:012d}'
+
+
+def withdrawal_id_from_reference(reference):
+    prefix, _, number = (reference or '').partition('_')
+    return int(number) if prefix == 'wdr' and number.isdigit() else None
+
+
+def send_transfers(withdrawals, client=None):
+    """Submit processing withdrawals to Paystack: one bulk recipient call and one bulk
+    transfer call per 100 withdrawals.
+
+    Withdrawals already submitted are skipped, and a resend after a failure is
+    safe because Paystack de-duplicates transfers by reference. Withdrawals
+    whose bank Paystack doesn't know stay in processing with a failure_reason
+    for manual payout; transfers Paystack reports as failed straight away are
+    failed (refunding the wallet). Returns the number of transfers submitted.
+    """
+    client = client or paystack.get_client()
+    withdrawals = list(withdrawals.filter(status='processing', transfer_code=''))
+    if not withdrawals:
+        return 0
+
+    bank_codes, recipients = {}, {}
+    for withdrawal in withdrawals:
+        bank_code = client.bank_code(withdrawal.bank_name)
+        if bank_code is None:
+            withdrawal.failure_reason = f'Paystack has no bank named "{withdrawal.bank_name}"; pay out manually'
+            continue
+        bank_codes[withdrawal.pk] = bank_code
+        recipients[(withdrawal.account_number, bank_code)] = {
+            'name': withdrawal.account_name,
+            'account_number': withdrawal.account_number,
+            'bank_code': bank_code,
+        }
+    recipient_codes = client.create_recipients(list(recipients.values())) if recipients else {}
+
+    transfers, by_reference = [], {}
+    for withdrawal in withdrawals:
+        if withdrawal.pk not in bank_codes:
+            continue
+        recipient = recipient_codes.get((withdrawal.account_number, bank_codes[withdrawal.pk]))
+        if recipient is None:
+            withdrawal.failure_reason = 'Paystack rejected the account details; pay out manually'
+            continue
+        reference = payout_reference(withdrawal.pk)
+        by_reference[reference] = withdrawal
+        transfers.append({
+            'amount': paystack.to_kobo(withdrawal.amount),
+            'recipient': recipient,
+            'reference': reference,
+            'reason': f'Withdrawal {reference}',
+        })
+
+    results = client.bulk_transfer(transfers) if transfers else []
+    finished = []
+    for result in results:
+        withdrawal = by_reference.get(result.get('reference'))
+        if withdrawal is None:
+            continue
+        withdrawal.transfer_code = result.get('transfer_code') or ''
+        withdrawal.failure_reason = ''
+        if result.get('status') in ('success', 'failed', 'reversed'):
+            finished.append((withdrawal, 'completed' if result['status'] == 'success' else 'failed'))
+
+    with transaction.atomic():
+        # The rows were read unlocked before the Paystack calls; a webhook may have
+        # settled some since. Only write to the ones still processing, re-read under lock
+        current = WithdrawalRequest.objects.select_for_update().in_bulk(
+            [withdrawal.pk for withdrawal in withdrawals]
+        )
+        current = {pk: row for pk, row in current.items() if row.status == 'processing'}
+        WithdrawalRequest.objects.bulk_update(
+            [withdrawal for withdrawal in withdrawals if withdrawal.pk in current],
+            ['transfer_code', 'failure_reason'],
+            batch_size=500
+        )
+        for withdrawal, status in finished:
+            locked = current.get(withdrawal.pk)
+            if locked is None:
+                continue
+            locked.status = status
+            locked.transfer_code = withdrawal.transfer_code
+            if status == 'failed':
+                locked.failure_reason = 'Paystack rejected the transfer'
+            # enter_failed refunds the wallet through the ledger
+            locked.save()
+    return len(results)
+
+
+def send_transfers_safely(withdrawals, client=None):
+    """send_transfers() for after-commit hooks: a Paystack outage must not break the request"""
+    try:
+        return send_transfers(withdrawals, client)
+    except paystack.PaystackError as exc:
+        logger.error('Paystack transfer submission failed', extra={
+            'error': str(exc), 'status_code': exc.status_code, 'payload': exc.payload,
+        })
+        return 0
+
+
+def payout_rows(batch):
+    """The batch's payout file as CSV lines, read from the database in chunks"""
+    writer = csv.writer(Echo())
+    yield writer.writerow(PAYOUT_CSV_COLUMNS)
+    withdrawals = batch.withdrawals.with_priority().order_by('queue_priority', 'created_at', 'id').values_list(
+        'id', 'account_name', 'account_number', 'bank_name', 'amount', 'queue_priority', 'created_at', 'user__username'
+    )
+    for withdrawal_id, *fields, created_at, username in withdrawals.iterator(chunk_size=500):
+        yield writer.writerow([payout_reference(withdrawal_id), *fields, created_at.isoformat(), username])
+
+
+def payout_csv_response(batch):
+    response = StreamingHttpResponse(payout_rows(batch), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="payout-batch-{batch.pk}.csv"'
+    return response
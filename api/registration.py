@@ -0,0 +1,115 @@
+"""Account sign-up with as few database round trips as the data allows.
+
+Two reads, both on unique indexes: the coupon (with its package), and the
+referrer's user id when a referral code was given. Everything else is a
+write inside one transaction:
+
+    INSERT user, INSERT profile, INSERT earnings summary,
+    UPDATE coupon (claim), INSERT referral, INSERT outbox message
+
+Taken usernames and emails aren't looked up first. The unique indexes on
+auth_user (the email one comes from migration 0019) reject them and
+register() turns the IntegrityError into the same message the pre-checks
+used to give, so a race between two sign-ups can't get past it either.
+The email index is partial (blank emails may repeat); on databases without
+partial indexes (MySQL) there is none, and a taken email is looked up first.
+The profile's referral code is derived from the new user id (api/codes.py)
+and the referrer's counters and wallet credit are applied by the outbox
+worker, so neither needs a query here.
+"""
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError, connection, transaction
+
+from . import coupons, outbox
+from .cache import invalidate_user
+from .codes import normalize
+from .models import Coupon, Referral, UserEarningsSummary, UserProfile
+
+# Referrer's bonus by the new user's package type
+REFERRAL_BONUSES = {
+    'pro': Decimal('4000.00'),
+    'silver': Decimal('3000.00'),
+}
+DEFAULT_REFERRAL_BONUS = Decimal('2000.00')
+
+
+class RegistrationError(Exception):
+    """Sign-up refused; the message is safe to show to the user"""
+    pass
+
+
+def referral_bonus(package):
+    return REFERRAL_BONUSES.get(package.package_type, DEFAULT_REFERRAL_BONUS)
+
+
+def _conflict_message(exc):
+    # SQLite names the column, PostgreSQL the index; both mention the field
+    error = str(exc).lower()
+    if 'email' in error:
+        return 'Email already exists'
+    if 'username' in error:
+        return 'Username already exists'
+    return None
+
+
+def register(username, email, password, coupon_code, phone_number='', referral_code=''):
+    """Create the user, profile and summary, claim the coupon and record the referral.
+
+    Returns (user, profile, package). Raises RegistrationError for a taken
+    username or email, an unknown or used coupon, or an unknown referral code.
+    """
+    if email and not connection.features.supports_partial_indexes and User.objects.filter(email=email).exists():
+        raise RegistrationError('Email already exists')
+
+    coupon = Coupon.objects.select_related('package').filter(coupon_code=coupon_code, is_used=False).first()
+    if coupon is None:
+        raise RegistrationError('Invalid or used coupon code')
+    package = coupon.package
+
+    referrer_id = None
+    if referral_code:
+        referrer_id = (
+            UserProfile.objects.filter(referral_code=normalize(referral_code))
+            .values_list('user_id', flat=True).first()
+        )
+        if referrer_id is None:
+            raise RegistrationError('Invalid referral code')
+
+    try:
+        with transaction.atomic():
+            user = User.objects.create_user(username=username, email=email, password=password)
+            profile = UserProfile.objects.create(user=user, package=package, phone_number=phone_number)
+            UserEarningsSummary.objects.create(user=user)
+            # Raises CouponUnavailable if a concurrent sign-up claimed it first
+            coupons.redeem(coupon, user)
+
+            if referrer_id is not None:
+                bonus = referral_bonus(package)
+                # bulk_create skips Referral.save(): the outbox handler credits the
+                # referrer and bumps their referral counters in one go
+                Referral.objects.bulk_create([Referral(
+                    referrer_id=referrer_id,
+                    referee=user,
+                    reward_earned=bonus,
+                    referee_package=package.package_type,
+                )])
+                outbox.enqueue(
+                    'referral_bonus',
+                    referrer_id=referrer_id,
+                    amount=bonus,
+                    description=f'Referral bonus for {user.username} ({package.package_type.title()} package)',
+                    count_referral=True,
+                )
+    except coupons.CouponUnavailable:
+        raise RegistrationError('Invalid or used coupon code')
+    except IntegrityError as exc:
+        message = _conflict_message(exc)
+        if message is None:
+            raise
+        raise RegistrationError(message) from exc
+
+    if referrer_id is not None:
+        invalidate_user(referrer_id)
+    return user, profile, package
@@ -2,6 +2,7 @@ from rest_framework import serializers
 from django.contrib.auth.models import User
 from django.contrib.auth.password_validation import validate_password
 from .models import *
+from .catalog import package_catalog
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -14,8 +15,18 @@ class PackageSerializer(serializers.ModelSerializer):
         model = Package
         fields = '__all__'
 
+class CatalogPackageField(serializers.Field):
+    """Package FK rendered like PackageSerializer, from the in-process catalog (no query per row)"""
+    def __init__(self, **kwargs):
+        kwargs.setdefault('source', 'package_id')
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+    
+    def to_representation(self, package_id):
+        return package_catalog.get(package_id)
+
 class CouponSerializer(serializers.ModelSerializer):
-    package = PackageSerializer(read_only=True)
+    package = CatalogPackageField()
     
     class Meta:
         model = Coupon
@@ -23,7 +34,7 @@ class CouponSerializer(serializers.ModelSerializer):
 
 class UserProfileSerializer(serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
-    package = PackageSerializer(read_only=True)
+    package = CatalogPackageField()
     
     class Meta:
         model = UserProfile
@@ -72,7 +83,7 @@ class TransactionSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Transaction
-        fields = ['id', 'user_username', 'user_email', 'amount', 'transaction_type', 'description', 'date']
+        fields = ['id', 'user_username', 'user_email', 'amount', 'wallet_amount', 'transaction_type', 'description', 'date']
         read_only_fields = ['user_username', 'user_email', 'date']
 
 class WithdrawalRequestSerializer(serializers.ModelSerializer):
@@ -82,7 +93,10 @@ class WithdrawalRequestSerializer(serializers.ModelSerializer):
     class Meta:
         model = WithdrawalRequest
         fields = '__all__'
-        read_only_fields = ('user', 'status', 'created_at', 'processed_at')
+        # Money and status only move through the withdrawal flow, never a client PATCH
+        read_only_fields = (
+            'user', 'amount', 'status', 'created_at', 'processed_at', 'batch', 'transfer_code', 'failure_reason',
+        )
 
 class SignupSerializer(serializers.Serializer):
     username = serializers.CharField(max_length=150)
@@ -94,37 +108,12 @@ class SignupSerializer(serializers.Serializer):
     phone_number = serializers.CharField(required=True, allow_blank=False, max_length=14)
     
     def validate(self, data):
-        print("🔍 Validating registration data:", data)
-        
         # Password validation
         if data['password'] != data['confirm_password']:
             raise serializers.ValidationError("Passwords do not match")
         
-        # Username validation
-        if User.objects.filter(username=data['username']).exists():
-            raise serializers.ValidationError("Username already exists")
-        
-        # Email validation
-        if User.objects.filter(email=data['email']).exists():
-            raise serializers.ValidationError("Email already exists")
-        
-        # Coupon validation
-        try:
-            coupon = Coupon.objects.get(coupon_code=data['coupon_code'], is_used=False)
-            data['coupon'] = coupon
-            print(f"✅ Coupon validated: {coupon.coupon_code}")
-        except Coupon.DoesNotExist:
-            raise serializers.ValidationError("Invalid or used coupon code")
-        
-        # Referral code validation (if provided)
-        if data.get('referral_code'):
-            try:
-                referrer_profile = UserProfile.objects.get(referral_code=data['referral_code'])
-                data['referrer'] = referrer_profile.user
-                print(f"✅ Referral code validated: {data['referral_code']}")
-            except UserProfile.DoesNotExist:
-                raise serializers.ValidationError("Invalid referral code")
-        
+        # Taken usernames/emails, the coupon and the referral code are checked by
+        # registration.register() as part of creating the account
         return data
     
 class LoginSerializer(serializers.Serializer):
@@ -139,6 +128,10 @@ class DailyLoginSerializer(serializers.Serializer):
 class GamePlaySerializer(serializers.Serializer):
     game_type = serializers.ChoiceField(choices=GameParticipation.GAME_CHOICES)
 
+class CouponMintSerializer(serializers.Serializer):
+    package = serializers.SlugRelatedField(slug_field='package_type', queryset=Package.objects.all())
+    quantity = serializers.IntegerField(min_value=1, max_value=CouponBatch.MAX_QUANTITY)
+
 class CouponValidationSerializer(serializers.Serializer):
     coupon_code = serializers.CharField(max_length=22)
     
@@ -0,0 +1,39 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .cache import invalidate_auth_user, invalidate_user
+from .catalog import package_catalog
+from .coupons import coupon_filter
+from .models import ContentSubmission, Coupon, Package, Referral, Transaction, UserProfile, WithdrawalRequest
+
+
+# Anything that feeds the cached dashboard/wallet/profile payloads
+@receiver([post_save, post_delete], sender=UserProfile)
+@receiver([post_save, post_delete], sender=Transaction)
+@receiver([post_save, post_delete], sender=ContentSubmission)
+@receiver([post_save, post_delete], sender=WithdrawalRequest)
+def invalidate_owner_cache(sender, instance, **kwargs):
+    invalidate_user(instance.user_id)
+
+@receiver([post_save, post_delete], sender=Referral)
+def invalidate_referrer_cache(sender, instance, **kwargs):
+    invalidate_user(instance.referrer_id)
+
+@receiver(post_save, sender=User)
+def invalidate_user_cache(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
+
+@receiver([post_save, post_delete], sender=User)
+@receiver([post_save, post_delete], sender=UserProfile)
+def invalidate_auth_cache(sender, instance, **kwargs):
+    invalidate_auth_user(instance.pk if sender is User else instance.user_id)
+
+@receiver([post_save, post_delete], sender=Package)
+def invalidate_package_catalog(sender, instance, **kwargs):
+    package_catalog.invalidate()
+
+@receiver(post_save, sender=Coupon)
+def add_to_coupon_filter(sender, instance, created, **kwargs):
+    # Coupons minted in bulk skip signals; coupons.mint() adds them to the filter itself
+    if created:
+        coupon_filter.added([(instance.pk, instance.coupon_code)])
@@ -0,0 +1,102 @@
+"""Original-value tracking and declared status transitions for models.
+
+TrackedModel remembers the field values an instance was loaded (or last
+saved) with, so save() can tell what changed without re-reading the row.
+StateMachine uses that to validate a status change and call the model's
+``enter_<state>`` hook exactly once per transition.
+"""
+from django.core.exceptions import ValidationError
+from django.db import models
+
+
+class InvalidTransition(ValidationError):
+    pass
+
+
+class TrackedModel(models.Model):
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._original = {
+            name: value for name, value in zip(field_names, values) if value is not models.DEFERRED
+        }
+        return instance
+
+    def _remember(self, fields=None):
+        names = fields or [field.attname for field in self._meta.concrete_fields]
+        deferred = self.get_deferred_fields()
+        original = getattr(self, '_original', {})
+        original.update({name: getattr(self, name) for name in names if name not in deferred})
+        self._original = original
+
+    def original(self, field):
+        """Value ``field`` had in the database when this instance was loaded or last saved.
+
+        Falls back to reading the row for instances that were never loaded
+        through the ORM (e.g. built by hand with an existing pk).
+        """
+        attname = self._meta.get_field(field).attname
+        original = getattr(self, '_original', {})
+        if attname not in original:
+            original[attname] = (
+                type(self)._base_manager.filter(pk=self.pk).values_list(attname, flat=True).first()
+            )
+            self._original = original
+        return original[attname]
+
+    def has_changed(self, field):
+        return self._state.adding or self.original(field) != getattr(self, self._meta.get_field(field).attname)
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        self._remember([self._meta.get_field(name).attname for name in update_fields] if update_fields else None)
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        self._remember([self._meta.get_field(name).attname for name in fields] if fields else None)
+
+
+class StateMachine:
+    """Allowed moves of one field, e.g. ``StateMachine('status', {'pending': ['approved']}, initial='pending')``"""
+
+    def __init__(self, field, transitions, initial):
+        self.field = field
+        self.transitions = {source: tuple(targets) for source, targets in transitions.items()}
+        self.initial = initial
+
+    def allows(self, source, target):
+        if source is None:
+            return target == self.initial
+        return source == target or target in self.transitions.get(source, ())
+
+    def pending(self, instance):
+        """(source, target) the instance is about to move between; source is None when creating"""
+        source = None if instance._state.adding else instance.original(self.field)
+        return source, getattr(instance, self.field)
+
+    def validate(self, instance):
+        source, target = self.pending(instance)
+        if not self.allows(source, target):
+            raise InvalidTransition(
+                f'Cannot move {self.field} from {source or "(new)"} to {target}',
+                code='invalid_transition'
+            )
+        return source, target
+
+    def apply(self, instance):
+        """Validate the pending transition and run ``instance.enter_<target>(source)`` if the value changes.
+
+        Returns the (source, target) pair, or None when nothing moved. Call it
+        before writing the row, inside the same transaction as the save.
+        """
+        source, target = self.validate(instance)
+        if source == target:
+            return None
+        hook = getattr(instance, f'enter_{target}', None)
+        if hook:
+            hook(source)
+        return source, target
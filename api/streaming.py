@@ -0,0 +1,8 @@
+"""Helpers for streaming CSV downloads (payout files, coupon batches)."""
+
+
+class Echo:
+    """File-like object whose write() hands the line back to the csv writer's caller"""
+
+    def write(self, value):
+        return value
@@ -1,3 +1,1322 @@
-from django.test import TestCase
+import hashlib
+import hmac
+import io
+import json
+import logging
+import os
+import statistics
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection, connections
+from django.forms.models import model_to_dict
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from payments import paystack
+from payments.fake_paystack import FakePaystack
+from payments.paystack import PaystackClient, PaystackError
+
+from . import coupons, hashing, ledger, outbox, payouts, webhooks
+from .cache import auth_user_key, cache_key, invalidate_user
+from .codes import referral_code, referral_code_user_id
+from .log import QueueLogHandler, RedactingFilter, SamplingFilter, extra_fields
+from .models import *
+from .serializers import WithdrawalRequestSerializer
+from .state import InvalidTransition
+
+# Where the per-endpoint budget report is written (diff it between releases)
+REPORT_PATH = os.environ.get('API_BUDGET_REPORT', os.path.join(settings.BASE_DIR, 'api_budget_report.json'))
+
+# Timed (cold-cache) calls per endpoint
+BUDGET_RUNS = int(os.environ.get('API_BUDGET_RUNS', 15))
+
+
+def paystack_signature(payload, secret_key):
+    """X-Paystack-Signature for ``payload`` as the test client will serialise it"""
+    return hmac.new(secret_key.encode(), JSONRenderer().render(payload), hashlib.sha512).hexdigest()
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def seed_api_data():
+    """A user with a realistic amount of history plus the rows every route needs"""
+    pro = Package.objects.create(
+        name='Pro Package', package_type='pro', price=10000, description='Pro',
+        referral_bonus=4000, daily_login_bonus=1000, daily_game_bonus=700, withdrawal_priority=1,
+    )
+    silver = Package.objects.create(
+        name='Silver Package', package_type='silver', price=8000, description='Silver',
+        referral_bonus=3000, daily_game_bonus=700, withdrawal_priority=2,
+    )
+    user = User.objects.create_user('budget_user', 'budget@example.com', 'budget-pass-123')
+    UserProfile.objects.create(user=user, package=pro, phone_number='08000000000')
+    UserEarningsSummary.objects.create(user=user)
+
+    for n in range(30):
+        referee = User.objects.create_user(f'referee{n}', f'referee{n}@example.com', 'budget-pass-123')
+        UserProfile.objects.create(user=referee, package=pro if n % 2 else silver)
+        Referral.objects.create(referrer=user, referee=referee)
+
+    platforms = [choice[0] for choice in ContentSubmission.PLATFORM_CHOICES]
+    for n in range(60):
+        submission = ContentSubmission.objects.create(
+            user=user, platform=platforms[n % 3], video_url=f'https://example.com/v/{n}',
+            earnings=Decimal('500'),
+        )
+        if n % 3 == 0:
+            submission.status = 'approved'
+            submission.save()
+        if n % 6 == 0:
+            submission.status = 'paid'
+            submission.save()
+
+    for n in range(40):
+        Transaction.objects.create(user=user, amount=Decimal('300'), transaction_type='game', description='Game reward')
+        GameParticipation.objects.create(user=user, game_type='quiz', reward_earned=Decimal('300'))
+    GameParticipation.objects.filter(user=user).update(participation_date=timezone.now() - timedelta(days=2))
+
+    for n in range(10):
+        WithdrawalRequest.objects.create(
+            user=user, amount=Decimal('1000'), bank_name='Bank', account_number='0123456789', account_name='Budget User',
+        )
+    for n in range(50):
+        Coupon.objects.create(coupon_code=f'budget{n:04d}', package=pro if n % 2 else silver)
+
+    # Plenty of balance for the withdrawal endpoint
+    UserProfile.objects.filter(user=user).update(wallet_balance=Decimal('1000000'), total_earnings=Decimal('1000000'))
+    return user
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class EndpointBudgetTests(TestCase):
+    """Calls every route in api/urls.py, asserts a query budget and records p50/p95 latency.
+
+    Every call runs with an empty cache, so the numbers are the cold path.
+    """
+    results = {}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = seed_api_data()
+        cls.submission = ContentSubmission.objects.filter(user=cls.user).first()
+        cls.referral = Referral.objects.filter(referrer=cls.user).first()
+        cls.withdrawal = WithdrawalRequest.objects.filter(user=cls.user).first()
+        cls.transaction = Transaction.objects.filter(user=cls.user).first()
+        cls.coupon = Coupon.objects.first()
+        cls.package = Package.objects.first()
+        cls.refresh = RefreshToken.for_user(cls.user)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        with open(REPORT_PATH, 'w') as report:
+            json.dump({
+                'generated_at': timezone.now().isoformat(),
+                'database': connection.vendor,
+                'runs': BUDGET_RUNS,
+                'endpoints': dict(sorted(cls.results.items())),
+            }, report, indent=2)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh.access_token}')
+        self.anonymous = APIClient()
+        self.counter = 0
+
+    def unique(self):
+        self.counter += 1
+        return self.counter
+
+    def measure(self, name, method, path, max_queries, expected_status=200, data=None, client=None, before=None):
+        client = client or self.client
+        query_counts, timings = [], []
+        for _ in range(BUDGET_RUNS):
+            if before:
+                before()
+            payload = data() if callable(data) else data
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = getattr(client, method)(path, payload, format='json')
+                timings.append((time.perf_counter() - started) * 1000)
+            self.assertEqual(response.status_code, expected_status, f'{name}: {getattr(response, "data", response)}')
+            query_counts.append(len(queries))
+
+        self.results[name] = {
+            'method': method.upper(),
+            'path': path,
+            'status': expected_status,
+            'queries': max(query_counts),
+            'max_queries': max_queries,
+            'p50_ms': round(statistics.median(timings), 3),
+            'p95_ms': round(percentile(timings, 95), 3),
+        }
+        self.assertLessEqual(max(query_counts), max_queries, f'{name} query budget exceeded')
+
+    # Authentication
+
+    def test_register(self):
+        def payload():
+            n = self.unique()
+            coupon = Coupon.objects.create(coupon_code=f'reg{n:04d}', package=self.package)
+            return {
+                'username': f'newuser{n}', 'email': f'newuser{n}@example.com',
+                'password': 'budget-pass-123', 'confirm_password': 'budget-pass-123',
+                'coupon_code': coupon.coupon_code, 'referral_code': self.user.userprofile.referral_code,
+                'phone_number': '08000000001',
+            }
+        self.measure('register', 'post', '/api/auth/register/', 10, 201, data=payload, client=self.anonymous)
+
+    def test_login(self):
+        self.measure('login', 'post', '/api/auth/login/', 3, data={
+            'username': 'budget_user', 'password': 'budget-pass-123',
+        }, client=self.anonymous)
+
+    def test_validate_coupon(self):
+        self.measure('validate-coupon', 'post', '/api/auth/validate-coupon/', 2,
+                     data={'coupon_code': self.coupon.coupon_code}, client=self.anonymous)
+
+    def test_validate_coupon_guess(self):
+        # The code filter is built once per process; after that guesses cost nothing
+        coupons.coupon_filter.might_contain(self.coupon.coupon_code)
+        self.measure('validate-coupon-guess', 'post', '/api/auth/validate-coupon/', 0, 400,
+                     data={'coupon_code': 'METAPRO0000000000'}, client=self.anonymous)
+
+    def test_verify_token(self):
+        self.measure('verify-token', 'post', '/api/auth/verify-token/', 1)
+
+    def test_token_refresh(self):
+        self.measure('token-refresh', 'post', '/api/auth/token/refresh/', 0,
+                     data={'refresh': str(self.refresh)}, client=self.anonymous)
+
+    # Dashboard & user
+
+    def test_dashboard(self):
+        self.measure('dashboard', 'get', '/api/dashboard/', 5)
+
+    def test_profile(self):
+        self.measure('profile', 'get', '/api/profile/', 3)
+
+    def test_wallet(self):
+        self.measure('wallet-balance', 'get', '/api/wallet/balance/', 2)
+
+    def test_cache_stats(self):
+        User.objects.filter(pk=self.user.pk).update(is_staff=True)
+        self.measure('cache-stats', 'get', '/api/cache/stats/', 1)
+
+    def test_daily_login(self):
+        def reset():
+            UserProfile.objects.filter(user=self.user).update(last_daily_login=None)
+        self.measure('daily-login', 'post', '/api/daily-login/', 8, before=reset)
+
+    # Games
+
+    def test_play_game(self):
+        def reset():
+            GameParticipation.objects.filter(user=self.user, game_type='daily_spin').delete()
+        self.measure('games-play', 'post', '/api/games/play/', 9, data={'game_type': 'daily_spin'}, before=reset)
+
+    def test_game_history(self):
+        self.measure('games-history', 'get', '/api/games/history/', 2)
+
+    # Referrals
+
+    def test_referral_stats(self):
+        self.measure('referral-stats', 'get', '/api/referrals/stats/', 3)
+
+    def test_referral_list(self):
+        self.measure('referrals-list', 'get', '/api/referrals/', 2)
+
+    def test_referral_detail(self):
+        self.measure('referrals-detail', 'get', f'/api/referrals/{self.referral.pk}/', 2)
+
+    # Router endpoints
+
+    def test_api_root(self):
+        self.measure('api-root', 'get', '/api/', 1)
+
+    def test_package_list(self):
+        self.measure('packages-list', 'get', '/api/packages/', 1, client=self.anonymous)
+
+    def test_package_detail(self):
+        self.measure('packages-detail', 'get', f'/api/packages/{self.package.pk}/', 1, client=self.anonymous)
+
+    def test_coupon_list(self):
+        self.measure('coupons-list', 'get', '/api/coupons/', 3)
+
+    def test_coupon_detail(self):
+        self.measure('coupons-detail', 'get', f'/api/coupons/{self.coupon.pk}/', 3)
+
+    def test_coupon_validate(self):
+        self.measure('coupons-validate', 'post', '/api/coupons/validate/', 2,
+                     data={'coupon_code': self.coupon.coupon_code}, client=self.anonymous)
+
+    def test_user_profile_list(self):
+        self.measure('user-profiles-list', 'get', '/api/user-profiles/', 3)
+
+    def test_user_profile_detail(self):
+        self.measure('user-profiles-detail', 'get', f'/api/user-profiles/{self.user.userprofile.pk}/', 3)
+
+    def test_content_list(self):
+        self.measure('content-list', 'get', '/api/content/', 2)
+
+    def test_content_detail(self):
+        self.measure('content-detail', 'get', f'/api/content/{self.submission.pk}/', 2)
+
+    def test_content_create(self):
+        def payload():
+            return {'platform': 'tiktok', 'video_url': f'https://example.com/new/{self.unique()}', 'description': 'New'}
+        self.measure('content-create', 'post', '/api/content/', 3, 201, data=payload)
+
+    def test_withdrawal_list(self):
+        self.measure('withdrawals-list', 'get', '/api/withdrawals/', 2)
+
+    def test_withdrawal_detail(self):
+        self.measure('withdrawals-detail', 'get', f'/api/withdrawals/{self.withdrawal.pk}/', 2)
+
+    def test_withdrawal_create(self):
+        self.measure('withdrawals-create', 'post', '/api/withdrawals/', 8, 201, data={
+            'password': 'budget-pass-123', 'amount': '1000', 'bank_name': 'Bank',
+            'account_number': '0123456789', 'account_name': 'Budget User',
+        })
+
+    def test_transaction_list(self):
+        self.measure('transactions-list', 'get', '/api/transactions/', 2)
+
+    def test_transaction_filtered_list(self):
+        self.measure('transactions-filtered', 'get', '/api/transactions/?transaction_type=game&date_from=2000-01-01', 2)
+
+    def test_transaction_detail(self):
+        self.measure('transactions-detail', 'get', f'/api/transactions/{self.transaction.pk}/', 2)
+
+    # Webhooks
+
+    @override_settings(PAYSTACK_SECRET_KEY='sk_test_budget')
+    def test_paystack_webhook(self):
+        def payload():
+            n = self.unique()
+            event = {'event': 'transfer.success', 'data': {'id': n, 'reference': payouts.payout_reference(n)}}
+            self.anonymous.credentials(HTTP_X_PAYSTACK_SIGNATURE=paystack_signature(event, 'sk_test_budget'))
+            return event
+        # Stored, not processed: one INSERT however the event turns out
+        self.measure('paystack-webhook', 'post', '/api/webhooks/paystack/', 1, data=payload, client=self.anonymous)
+
+
+class LedgerConcurrencyTests(TransactionTestCase):
+    """Hammers one wallet from several threads; no update may be lost"""
+    threads = 8
+    posts_per_thread = 10
+
+    def setUp(self):
+        self.user = User.objects.create_user('ledger_user', 'ledger@example.com', 'ledger-pass-123')
+        UserProfile.objects.create(user=self.user)
+        UserEarningsSummary.objects.create(user=self.user)
+
+    def run_threads(self, work):
+        errors = []
+
+        def target():
+            try:
+                for _ in range(self.posts_per_thread):
+                    work()
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=target) for _ in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(errors, [])
+
+    def test_concurrent_credits_and_debits_add_up(self):
+        ledger.post(self.user, Decimal('100000'), 'referral', 'Opening balance')
+
+        def work():
+            ledger.post(self.user, Decimal('300'), 'game', 'Game reward')
+            ledger.post(self.user, Decimal('-100'), 'payout', 'Withdrawal', require_funds=True)
+
+        self.run_threads(work)
+
+        wallet, earned = ledger.balances(self.user)
+        total = Transaction.objects.filter(user=self.user).aggregate(total=Sum('amount'))['total']
+        self.assertEqual(wallet, total)
+        self.assertEqual(earned, total)
+        self.assertEqual(wallet, Decimal('100000') + self.threads * self.posts_per_thread * Decimal('200'))
+
+        summary = UserEarningsSummary.objects.get(user=self.user)
+        self.assertEqual(summary.game_earnings, self.threads * self.posts_per_thread * Decimal('300'))
+        self.assertEqual(summary.payout_total, -self.threads * self.posts_per_thread * Decimal('100'))
+
+    def test_concurrent_withdrawals_never_overdraw(self):
+        ledger.post(self.user, Decimal('5000'), 'referral', 'Opening balance')
+        refused = []
+
+        def work():
+            try:
+                ledger.post(self.user, Decimal('-1000'), 'payout', 'Withdrawal', require_funds=True)
+            except ledger.InsufficientFunds:
+                refused.append(1)
+
+        self.run_threads(work)
+
+        wallet, _ = ledger.balances(self.user)
+        self.assertEqual(wallet, Decimal('0'))
+        self.assertEqual(Transaction.objects.filter(user=self.user, transaction_type='payout').count(), 5)
+        self.assertEqual(len(refused), self.threads * self.posts_per_thread - 5)
+
+
+class LedgerSnapshotTests(TestCase):
+    def test_balance_is_snapshot_plus_newer_transactions(self):
+        user = User.objects.create_user('snapshot_user', 'snapshot@example.com', 'snapshot-pass-123')
+        UserProfile.objects.create(user=user)
+        ledger.post(user, Decimal('1000'), 'referral', 'Referral bonus')
+        ledger.post(user, Decimal('500'), 'content', 'TikTok video approved', wallet=False)
+        ledger.post(user, Decimal('500'), 'content', 'TikTok video paid to wallet', earnings=False)
+        self.assertEqual(ledger.balances(user), (Decimal('1500'), Decimal('1500')))
+
+        self.assertEqual(BalanceSnapshot.objects.compact(settle_seconds=0), 1)
+        ledger.post(user, Decimal('-1000'), 'payout', 'Withdrawal', require_funds=True)
+
+        snapshot = BalanceSnapshot.objects.get(user=user)
+        self.assertEqual((snapshot.wallet_balance, snapshot.total_earnings), (Decimal('1500'), Decimal('1500')))
+        self.assertEqual(ledger.balances(user), (Decimal('500'), Decimal('500')))
+        self.assertEqual(ledger.drift(user), (0, 0))
+        with self.assertNumQueries(1):
+            ledger.balances(user)
+
+    def test_concurrent_compactions_skip_snapshots_created_meanwhile(self):
+        user = User.objects.create_user('compact_user', 'compact@example.com', 'compact-pass-123')
+        UserProfile.objects.create(user=user)
+        entry = ledger.post(user, Decimal('1000'), 'referral', 'Referral bonus')
+
+        def other_run_commits_first(*args, **kwargs):
+            BalanceSnapshot.objects.create(user=user, last_transaction_id=entry.pk,
+                                           wallet_balance=Decimal('1000'), total_earnings=Decimal('1000'))
+
+        # The other run created the user's first snapshot after this one locked (and found none)
+        with mock.patch.object(BalanceSnapshot.objects, 'bulk_update', side_effect=other_run_commits_first):
+            BalanceSnapshot.objects.compact(settle_seconds=0)
+        self.assertEqual(BalanceSnapshot.objects.filter(user=user).count(), 1)
+        self.assertEqual(ledger.balances(user), (Decimal('1000'), Decimal('1000')))
+
+
+class EarningsSummaryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('summary_user', 'summary@example.com', 'summary-pass-123')
+        UserProfile.objects.create(user=self.user)
+        ledger.post(self.user, Decimal('1000'), 'referral', 'Referral bonus')
+        # No summary row yet: the next read rebuilds it
+        self.assertFalse(UserEarningsSummary.objects.filter(user=self.user).exists())
+
+    def rebuild_before_locking(self):
+        # Another request's for_user() finishes its rebuild (without the bumped write) as the bump misses the row
+        summaries = UserEarningsSummary.objects
+        lock = summaries._lock_users
+
+        def rebuild_then_lock(user_ids):
+            summaries.rebuild(users=list(user_ids))
+            lock(user_ids)
+        return mock.patch.object(summaries, '_lock_users', side_effect=rebuild_then_lock)
+
+    def test_bumps_racing_a_lazy_rebuild_are_kept(self):
+        with self.rebuild_before_locking():
+            UserEarningsSummary.objects.bump(self.user, game_earnings=Decimal('50'))
+        summary = UserEarningsSummary.objects.for_user(self.user)
+        self.assertEqual((summary.referral_earnings, summary.game_earnings), (Decimal('1000'), Decimal('50')))
+
+        UserEarningsSummary.objects.filter(user=self.user).delete()
+        with self.rebuild_before_locking():
+            UserEarningsSummary.objects.bump_many({self.user.pk: {'tiktok_submissions': 2}})
+        self.assertEqual(UserEarningsSummary.objects.for_user(self.user).tiktok_submissions, 2)
+
+
+class BulkContentTransitionTests(TestCase):
+    def test_zero_earnings_approvals_drop_cached_payloads(self):
+        cache.clear()
+        user = User.objects.create_user('bulk_zero', 'bulk-zero@example.com', 'bulk-pass-123')
+        UserProfile.objects.create(user=user)
+        UserEarningsSummary.objects.create(user=user)
+        ContentSubmission.objects.create(user=user, platform='tiktok', video_url='https://example.com/zero')
+        client = APIClient()
+        client.force_authenticate(user)
+        self.assertEqual(client.get('/api/dashboard/').data['recent_submissions'][0]['status'], 'pending')
+
+        self.assertEqual(ContentSubmission.objects.filter(user=user).approve(), 1)
+        response = client.get('/api/dashboard/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['recent_submissions'][0]['status'], 'approved')
+        self.assertEqual(response.data['platform_stats']['tiktok']['approved'], 1)
+
+    def test_bulk_approve_and_pay_match_the_ledger(self):
+        users = []
+        for n in range(3):
+            user = User.objects.create_user(f'bulk{n}', f'bulk{n}@example.com', 'bulk-pass-123')
+            UserProfile.objects.create(user=user)
+            UserEarningsSummary.objects.create(user=user)
+            users.append(user)
+            for platform, _ in ContentSubmission.PLATFORM_CHOICES:
+                ContentSubmission.objects.create(
+                    user=user, platform=platform, video_url=f'https://example.com/{n}/{platform}', earnings=Decimal('400'),
+                )
+        # Submission counters are rolled up by the outbox worker
+        self.assertEqual(outbox.process_pending(), {'submission_created': 9})
+
+        # SELECT, submission UPDATE, profile UPDATE, INSERT and summary UPDATE (plus
+        # the test's savepoint pair) however many submissions and users are involved
+        with self.assertNumQueries(7):
+            self.assertEqual(ContentSubmission.objects.approve(), 9)
+        self.assertEqual(ContentSubmission.objects.approve(), 0)
+        self.assertEqual(ContentSubmission.objects.mark_paid(), 9)
+
+        for user in users:
+            profile = UserProfile.objects.get(user=user)
+            self.assertEqual((profile.wallet_balance, profile.total_earnings), (Decimal('1200'), Decimal('1200')))
+            self.assertEqual(profile.approved_submissions, 3)
+            self.assertEqual(ledger.drift(user), (0, 0))
+
+        incremental = {s.pk: s for s in UserEarningsSummary.objects.all()}
+        UserEarningsSummary.objects.rebuild()
+        for summary in UserEarningsSummary.objects.all():
+            self.assertEqual(model_to_dict(summary), model_to_dict(incremental[summary.pk]))
+
+
+class ContentStatusMachineTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('status_user', 'status@example.com', 'status-pass-123')
+        UserProfile.objects.create(user=self.user)
+        self.submission = ContentSubmission.objects.create(
+            user=self.user, platform='tiktok', video_url='https://example.com/v', earnings=Decimal('500'),
+        )
+
+    def test_transitions_credit_once_without_reselecting(self):
+        self.submission.status = 'approved'
+        self.submission.save()
+        self.submission.save()
+
+        submission = ContentSubmission.objects.get(pk=self.submission.pk)
+        submission.status = 'paid'
+        with CaptureQueriesContext(connection) as queries:
+            submission.save()
+        selects = [q['sql'] for q in queries if q['sql'].startswith('SELECT') and 'api_contentsubmission' in q['sql']]
+        self.assertEqual(selects, [])
+        submission.save()
+
+        self.assertEqual(Transaction.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(ledger.balances(self.user), (Decimal('500'), Decimal('500')))
+        self.assertEqual(ledger.drift(self.user), (0, 0))
+
+    def test_undeclared_transitions_are_rejected(self):
+        self.submission.status = 'paid'
+        with self.assertRaises(InvalidTransition):
+            self.submission.save()
+
+        self.submission.status = 'rejected'
+        self.submission.save()
+        self.submission.status = 'approved'
+        with self.assertRaises(InvalidTransition):
+            self.submission.save()
+        self.assertEqual(ContentSubmission.objects.get(pk=self.submission.pk).status, 'rejected')
+
+
+class PayoutQueueTests(TestCase):
+    def test_claims_follow_priority_order_without_overlap(self):
+        fast = Package.objects.create(name='Pro', package_type='pro', price=10000, description='Pro', withdrawal_priority=1)
+        slow = Package.objects.create(name='Silver', package_type='silver', price=8000, description='Silver', withdrawal_priority=3)
+        expected = []
+        for n, package in enumerate([slow, None, fast, slow, fast]):
+            user = User.objects.create_user(f'payee{n}', f'payee{n}@example.com', 'payee-pass-123')
+            UserProfile.objects.create(user=user, package=package)
+            withdrawal = WithdrawalRequest.objects.create(
+                user=user, amount=Decimal('1000') + n, bank_name='Bank', account_number=f'{n:010d}', account_name=f'Payee {n}',
+            )
+            expected.append((package.withdrawal_priority if package else WithdrawalRequest.DEFAULT_PRIORITY, n, withdrawal.pk))
+        expected = [pk for _, _, pk in sorted(expected)]
+
+        with self.assertNumQueries(1):
+            queue = [(w.pk, w.priority) for w in WithdrawalRequest.objects.pending_queue()]
+        self.assertEqual([pk for pk, _ in queue], expected)
+
+        first = payouts.claim_batch(size=3)
+        second = payouts.claim_batch(size=3)
+        self.assertIsNone(payouts.claim_batch(size=3))
+        self.assertEqual(set(first.withdrawals.values_list('pk', flat=True)), set(expected[:3]))
+        self.assertEqual(second.withdrawal_count, 2)
+        self.assertEqual(first.total_amount, Decimal('3007'))
+        self.assertFalse(WithdrawalRequest.objects.exclude(status='processing').exists())
+
+        lines = list(payouts.payout_rows(first))
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[1].startswith(payouts.payout_reference(expected[0])))
+
+
+class PaystackPayoutTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = FakePaystack('sk_test_payouts').start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.client_ = PaystackClient('sk_test_payouts', base_url=self.server.url, backoff=0)
+        self.user = User.objects.create_user('payout_user', 'payout@example.com', 'payout-pass-123')
+        UserProfile.objects.create(user=self.user)
+        ledger.post(self.user, Decimal('10000'), 'referral', 'Referral bonus')
+
+    def tearDown(self):
+        self.client_.close()
+
+    def withdraw(self, amount, bank_name='Access Bank'):
+        ledger.post(self.user, -amount, 'payout', 'Withdrawal', require_funds=True)
+        return WithdrawalRequest.objects.create(
+            user=self.user, amount=amount, bank_name=bank_name, account_number='0123456789', account_name='Payout User',
+        )
+
+    def test_transient_errors_are_retried(self):
+        self.server.fail_next(2, status=503)
+        calls = self.server.request_count
+        results = self.client_.bulk_transfer([
+            {'amount': 100000, 'recipient': 'RCP_x', 'reference': 'retry_test_000001', 'reason': 'Test'},
+        ])
+        self.assertEqual(results[0]['status'], 'received')
+        self.assertEqual(self.server.request_count - calls, 3)
+
+        self.server.fail_next(1, status=400)
+        with self.assertRaises(PaystackError):
+            self.client_.verify_transfer('retry_test_000001')
+
+    def test_claimed_batch_is_sent_as_bulk_transfers(self):
+        sent = [self.withdraw(Decimal('1500')), self.withdraw(Decimal('2500'))]
+        unknown_bank = self.withdraw(Decimal('1000'), bank_name='Bank of Nowhere')
+        batch = payouts.claim_batch()
+
+        calls = self.server.request_count
+        self.assertEqual(payouts.send_transfers(batch.withdrawals.all(), client=self.client_), 2)
+        # Banks list, one bulk recipient call, one bulk transfer call
+        self.assertEqual(self.server.request_count - calls, 3)
+        for withdrawal in sent:
+            withdrawal.refresh_from_db()
+            self.assertEqual(withdrawal.status, 'processing')
+            transfer = self.server.transfers[payouts.payout_reference(withdrawal.pk)]
+            self.assertEqual(withdrawal.transfer_code, transfer['transfer_code'])
+            self.assertEqual(transfer['amount'], paystack.to_kobo(withdrawal.amount))
+        unknown_bank.refresh_from_db()
+        self.assertEqual(unknown_bank.transfer_code, '')
+        self.assertIn('Bank of Nowhere', unknown_bank.failure_reason)
+
+        # Sending again submits nothing new
+        self.assertEqual(payouts.send_transfers(batch.withdrawals.all(), client=self.client_), 0)
+
+    def test_failed_withdrawal_is_refunded_once(self):
+        withdrawal = self.withdraw(Decimal('4000'))
+        self.assertEqual(ledger.balances(self.user)[0], Decimal('6000'))
+        withdrawal.status = 'processing'
+        withdrawal.save()
+        withdrawal.status = 'failed'
+        withdrawal.save()
+        withdrawal.save()
+
+        self.assertEqual(ledger.balances(self.user), (Decimal('10000'), Decimal('10000')))
+        self.assertEqual(ledger.drift(self.user), (0, 0))
+        withdrawal.status = 'completed'
+        with self.assertRaises(InvalidTransition):
+            withdrawal.save()
+
+    def test_webhook_settling_a_withdrawal_mid_send_wins(self):
+        withdrawal = self.withdraw(Decimal('4000'))
+        batch = payouts.claim_batch()
+        server = self.server
+
+        class WebhookFirstClient(PaystackClient):
+            # Paystack answers "failed", but its webhook for the same transfer lands first
+            def bulk_transfer(self, transfers):
+                results = super().bulk_transfer(transfers)
+                event = PaystackEvent(event='transfer.failed', payload={
+                    'data': {'reference': payouts.payout_reference(withdrawal.pk), 'reason': 'Account closed'},
+                })
+                webhooks.apply(event)
+                return [{**result, 'status': 'failed'} for result in results]
+
+        client = WebhookFirstClient('sk_test_payouts', base_url=server.url, backoff=0)
+        try:
+            payouts.send_transfers(batch.withdrawals.all(), client=client)
+        finally:
+            client.close()
+
+        withdrawal.refresh_from_db()
+        self.assertEqual(withdrawal.status, 'failed')
+        self.assertIn('Account closed', withdrawal.failure_reason)
+        # Refunded by the webhook only, not a second time by the send
+        self.assertEqual(ledger.balances(self.user), (Decimal('10000'), Decimal('10000')))
+        self.assertEqual(ledger.drift(self.user), (0, 0))
+
+    def test_admins_can_complete_a_payout_made_outside_paystack(self):
+        withdrawal = self.withdraw(Decimal('1000'))
+        admin_user = User.objects.create_superuser('payout_admin', 'payout-admin@example.com', 'admin-pass-123')
+        self.client.force_login(admin_user)
+        url = f'/admin/api/withdrawalrequest/{withdrawal.pk}/change/'
+        self.assertContains(self.client.get(url), 'records a payout made outside Paystack')
+
+        response = self.client.post(url, {
+            'user': self.user.pk, 'amount': '1000', 'bank_name': 'Access Bank', 'account_number': '0123456789',
+            'account_name': 'Payout User', 'status': 'completed', 'transfer_code': '', 'failure_reason': '',
+        })
+        self.assertEqual(response.status_code, 302)
+        withdrawal.refresh_from_db()
+        self.assertEqual((withdrawal.status, withdrawal.transfer_code), ('completed', ''))
+        self.assertIsNotNone(withdrawal.processed_at)
+        self.assertEqual(ledger.balances(self.user)[0], Decimal('9000'))
+
+    def test_refusals_report_the_balance_that_was_checked(self):
+        # The profile (which the guard checks) and a ledger sum can disagree, e.g. before a drift repair
+        UserProfile.objects.filter(user=self.user).update(wallet_balance=Decimal('300'))
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post('/api/withdrawals/', {
+            'amount': '1000', 'bank_name': 'Access Bank', 'account_number': '0123456789',
+            'account_name': 'Payout User', 'password': 'payout-pass-123',
+        }, format='json')
+        self.assertEqual((response.status_code, response.data['error']), (400, 'Insufficient balance. Available: ₦300.00'))
+
+    def test_clients_cannot_change_a_withdrawal(self):
+        withdrawal = self.withdraw(Decimal('1000'))
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        url = f'/api/withdrawals/{withdrawal.pk}/'
+        self.assertEqual(client.patch(url, {'amount': '900000'}, format='json').status_code, 405)
+        self.assertEqual(client.delete(url).status_code, 405)
+
+        # Nor through the serializer, should an update route come back
+        serializer = WithdrawalRequestSerializer(withdrawal, data={'amount': '900000', 'transfer_code': 'TRF_x'},
+                                                 partial=True)
+        self.assertTrue(serializer.is_valid())
+        self.assertEqual(serializer.validated_data, {})
+
+        withdrawal.refresh_from_db()
+        self.assertEqual(withdrawal.amount, Decimal('1000'))
+        withdrawal.status = 'failed'
+        withdrawal.save()
+        self.assertEqual(ledger.balances(self.user)[0], Decimal('10000'))
+
+
+@override_settings(PAYSTACK_SECRET_KEY='sk_test_webhooks')
+class PaystackWebhookTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('webhook_user', 'webhook@example.com', 'webhook-pass-123')
+        UserProfile.objects.create(user=self.user)
+        ledger.post(self.user, Decimal('10000'), 'referral', 'Referral bonus')
+        ledger.post(self.user, Decimal('-4000'), 'payout', 'Withdrawal', require_funds=True)
+        self.withdrawal = WithdrawalRequest.objects.create(
+            user=self.user, amount=Decimal('4000'), bank_name='Access Bank', account_number='0123456789',
+            account_name='Webhook User',
+        )
+        payouts.claim_batch()
+        self.client = APIClient()
+
+    def deliver(self, event, transfer_id=1, signature=None):
+        payload = {'event': event, 'data': {
+            'id': transfer_id, 'reference': payouts.payout_reference(self.withdrawal.pk),
+            'transfer_code': f'TRF_{transfer_id:010d}', 'status': event.split('.')[1],
+        }}
+        return self.client.post(
+            '/api/webhooks/paystack/', payload, format='json',
+            HTTP_X_PAYSTACK_SIGNATURE=signature or paystack_signature(payload, 'sk_test_webhooks'),
+        )
+
+    def test_unsigned_events_are_rejected(self):
+        response = self.deliver('transfer.success', signature='forged')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(PaystackEvent.objects.exists())
+
+    def test_redelivered_success_completes_once(self):
+        for _ in range(3):
+            self.assertEqual(self.deliver('transfer.success').status_code, 200)
+        self.assertEqual(PaystackEvent.objects.count(), 1)
+        self.withdrawal.refresh_from_db()
+        self.assertEqual(self.withdrawal.status, 'processing')
+
+        self.assertEqual(webhooks.process_pending(), {'completed': 1})
+        self.assertEqual(webhooks.process_pending(), {})
+        self.withdrawal.refresh_from_db()
+        self.assertEqual(self.withdrawal.status, 'completed')
+        self.assertEqual(self.withdrawal.transfer_code, 'TRF_0000000001')
+        self.assertEqual(ledger.balances(self.user)[0], Decimal('6000'))
+
+    def test_failure_refunds_once_and_late_reversal_needs_review(self):
+        self.deliver('transfer.failed', transfer_id=1)
+        self.deliver('transfer.reversed', transfer_id=1)
+        self.assertEqual(webhooks.process_pending(), {'failed': 1, 'already applied': 1})
+        self.withdrawal.refresh_from_db()
+        self.assertEqual(self.withdrawal.status, 'failed')
+        self.assertEqual(ledger.balances(self.user), (Decimal('10000'), Decimal('10000')))
+        self.assertEqual(ledger.drift(self.user), (0, 0))
+
+        # A success after the failure can't be applied automatically; it stays queued with the reason
+        self.deliver('transfer.success', transfer_id=2)
+        self.assertEqual(webhooks.process_pending(), {'error': 1})
+        event = PaystackEvent.objects.get(event='transfer.success')
+        self.assertIsNone(event.processed_at)
+        self.assertIn('manual review', event.error)
+        self.assertEqual(ledger.balances(self.user)[0], Decimal('10000'))
+
+
+class IdempotencyKeyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('retry_user', 'retry@example.com', 'retry-pass-123')
+        UserProfile.objects.create(user=self.user)
+        ledger.post(self.user, Decimal('5000'), 'referral', 'Referral bonus')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        self.withdrawal = {
+            'amount': '1500', 'password': 'retry-pass-123', 'bank_name': 'Access Bank',
+            'account_number': '0123456789', 'account_name': 'Retry User',
+        }
+
+    def withdraw(self, key, **changes):
+        return self.client.post('/api/withdrawals/', {**self.withdrawal, **changes}, format='json',
+                                HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retries_replay_the_first_response(self):
+        first = self.withdraw('wd-1')
+        self.assertEqual(first.status_code, 201)
+        self.withdraw('wd-1')
+        # Once auth is cached again (the withdrawal dropped it), a replay doesn't touch the database
+        with self.assertNumQueries(0):
+            retry = self.withdraw('wd-1')
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual((retry.status_code, retry.data), (first.status_code, first.data))
+
+        # With the cache gone the stored row answers
+        cache.clear()
+        self.assertEqual(self.withdraw('wd-1').data['withdrawal_id'], first.data['withdrawal_id'])
+
+        self.assertEqual(WithdrawalRequest.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(ledger.balances(self.user)[0], Decimal('3500'))
+        self.assertEqual(self.withdraw('wd-2').status_code, 201)
+        self.assertEqual(ledger.balances(self.user)[0], Decimal('2000'))
+
+    def test_key_reused_for_a_different_request_is_rejected(self):
+        self.withdraw('wd-1')
+        self.assertEqual(self.withdraw('wd-1', amount='2000').status_code, 422)
+        self.assertEqual(ledger.balances(self.user)[0], Decimal('3500'))
+
+    def test_daily_login_and_games_replay(self):
+        for path, data in (('/api/daily-login/', {}), ('/api/games/play/', {'game_type': 'daily_game'})):
+            responses = [self.client.post(path, data, format='json', HTTP_IDEMPOTENCY_KEY=f'{path}-1') for _ in range(2)]
+            self.assertEqual(responses[0].status_code, 200, responses[0].data)
+            self.assertEqual(responses[1].data, responses[0].data)
+        self.assertEqual(Transaction.objects.filter(user=self.user, transaction_type__in=['daily_login', 'game']).count(), 2)
+
+
+class AuthCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('authed', 'authed@example.com', 'authed-pass-123')
+        self.profile = UserProfile.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+
+    def wallet(self):
+        cache.delete(cache_key('wallet', self.user.pk))
+        return self.client.get('/api/wallet/balance/')
+
+    def test_warm_requests_run_no_auth_queries(self):
+        self.assertEqual(self.wallet().status_code, 200)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.wallet().status_code, 200)
+        # Only the wallet's own profile read is left
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('auth_user', queries[0]['sql'])
+
+    def test_saves_drop_the_cached_user(self):
+        for instance in (self.user, self.profile):
+            self.wallet()
+            self.assertIsNotNone(cache.get(auth_user_key(self.user.pk)))
+            instance.save()
+            self.assertIsNone(cache.get(auth_user_key(self.user.pk)))
+
+    def test_deactivated_users_are_refused_straight_away(self):
+        self.assertEqual(self.wallet().status_code, 200)
+        self.user.is_active = False
+        self.user.save(update_fields=['is_active'])
+        self.assertEqual(self.wallet().status_code, 403)
+
+        # The inactive copy is cached now, and still refused
+        self.assertFalse(cache.get(auth_user_key(self.user.pk)).is_active)
+        self.assertEqual(self.wallet().status_code, 403)
+
+
+class CachedUserViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('cached', 'cached@example.com', 'cached-pass-123')
+        UserProfile.objects.create(user=self.user)
+        UserEarningsSummary.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+
+    def views(self):
+        return {
+            'dashboard': self.client.get('/api/dashboard/'),
+            'profile': self.client.get('/api/profile/'),
+            'wallet': self.client.get('/api/wallet/balance/'),
+        }
+
+    def test_writes_are_seen_by_the_next_read(self):
+        self.assertTrue(all(response['X-Cache'] == 'MISS' for response in self.views().values()))
+        self.assertTrue(all(response['X-Cache'] == 'HIT' for response in self.views().values()))
+
+        ledger.post(self.user, Decimal('2500'), 'referral', 'Referral bonus')
+        ContentSubmission.objects.create(user=self.user, platform='tiktok', video_url='https://example.com/v')
+        views = self.views()
+        self.assertTrue(all(response['X-Cache'] == 'MISS' for response in views.values()))
+        self.assertEqual(views['wallet'].data, {'balance': 2500.0, 'total_earnings': 2500.0})
+        self.assertEqual(views['profile'].data['wallet_balance'], '2500.00')
+        self.assertEqual(views['dashboard'].data['wallet_balance'], 2500.0)
+        self.assertEqual([row['description'] for row in views['dashboard'].data['recent_transactions']],
+                         ['Referral bonus'])
+        self.assertEqual(len(views['dashboard'].data['recent_submissions']), 1)
+
+    def test_views_do_not_read_the_cached_auth_profile(self):
+        self.views()
+        self.assertIsNotNone(cache.get(auth_user_key(self.user.pk)))
+        # A write that drops only the view payloads (the auth entry stays warm)
+        UserProfile.objects.filter(user=self.user).update(wallet_balance=Decimal('700'), total_earnings=Decimal('900'))
+        invalidate_user(self.user.pk)
+        views = self.views()
+        self.assertEqual(views['wallet'].data, {'balance': 700.0, 'total_earnings': 900.0})
+        self.assertEqual(views['profile'].data['wallet_balance'], '700.00')
+        self.assertEqual(views['dashboard'].data['wallet_balance'], 700.0)
+
+
+class OutboxTests(TestCase):
+    def setUp(self):
+        self.package = Package.objects.create(name='Pro', package_type='pro', price=Decimal('5000'), description='Pro')
+        self.referrer = User.objects.create_user('referrer', 'referrer@example.com', 'referrer-pass-123')
+        UserProfile.objects.create(user=self.referrer)
+        UserEarningsSummary.objects.create(user=self.referrer)
+
+    def register(self, n):
+        coupon = Coupon.objects.create(coupon_code=f'outbox{n:04d}', package=self.package)
+        return APIClient().post('/api/auth/register/', {
+            'username': f'referee{n}', 'email': f'referee{n}@example.com',
+            'password': 'referee-pass-123', 'confirm_password': 'referee-pass-123',
+            'coupon_code': coupon.coupon_code, 'referral_code': self.referrer.userprofile.referral_code,
+            'phone_number': '08000000002',
+        }, format='json')
+
+    def test_referral_bonuses_are_credited_by_the_worker_once(self):
+        for n in range(3):
+            self.assertEqual(self.register(n).status_code, 201)
+        self.assertEqual(ledger.balances(self.referrer)[0], 0)
+
+        self.assertEqual(outbox.process_pending(), {'referral_bonus': 3})
+        self.assertEqual(outbox.process_pending(), {})
+        self.assertEqual(ledger.balances(self.referrer), (Decimal('12000'), Decimal('12000')))
+        self.assertEqual(ledger.drift(self.referrer), (0, 0))
+        summary = UserEarningsSummary.objects.get(user=self.referrer)
+        self.assertEqual(summary.referral_earnings, Decimal('12000'))
+        self.assertEqual((summary.referral_count, summary.referral_total), (3, Decimal('12000')))
+
+    def test_submission_counts_drop_the_cached_auth_profile(self):
+        cache.clear()
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.referrer).access_token}')
+        self.assertEqual(client.get('/api/profile/').data['total_submissions'], 0)
+        self.assertIsNotNone(cache.get(auth_user_key(self.referrer.pk)))
+
+        ContentSubmission.objects.create(user=self.referrer, platform='tiktok', video_url='https://example.com/v')
+        outbox.process_pending()
+        self.assertIsNone(cache.get(auth_user_key(self.referrer.pk)))
+        self.assertEqual(client.get('/api/profile/').data['total_submissions'], 1)
+
+    def test_rebuilds_before_the_worker_runs_count_once(self):
+        for n in range(2):
+            self.assertEqual(self.register(n).status_code, 201)
+        ContentSubmission.objects.create(user=self.referrer, platform='tiktok', video_url='https://example.com/v')
+        UserEarningsSummary.objects.filter(user=self.referrer).delete()
+        summary = UserEarningsSummary.objects.for_user(self.referrer)
+        self.assertEqual((summary.tiktok_submissions, summary.referral_count), (0, 0))
+
+        outbox.process_pending()
+        summary = UserEarningsSummary.objects.get(user=self.referrer)
+        self.assertEqual((summary.tiktok_submissions, summary.referral_count, summary.referral_total),
+                         (1, 2, Decimal('8000')))
+
+    def test_one_bad_message_does_not_hold_back_its_batch(self):
+        outbox.enqueue('referral_bonus', referrer_id=self.referrer.pk, amount='1000', description='Good')
+        outbox.enqueue('referral_bonus', referrer_id=self.referrer.pk, amount='not a number', description='Broken')
+        outbox.enqueue('referral_bonus', referrer_id=self.referrer.pk, amount='2000', description='Good')
+
+        self.assertEqual(outbox.process_pending(), {'referral_bonus': 2})
+        for _ in range(outbox.MAX_ATTEMPTS):
+            outbox.process_pending()
+
+        broken = OutboxMessage.objects.get(payload__description='Broken')
+        self.assertEqual((broken.processed_at, broken.attempts), (None, outbox.MAX_ATTEMPTS))
+        self.assertFalse(OutboxMessage.objects.filter(processed_at__isnull=True).exclude(pk=broken.pk).exists())
+        self.assertEqual(ledger.balances(self.referrer)[0], Decimal('3000'))
+
+    def test_failed_batches_stay_queued(self):
+        outbox.enqueue('referral_bonus', referrer_id=self.referrer.pk, amount='not a number', description='Broken')
+        self.assertEqual(outbox.process_pending(), {})
+        message = OutboxMessage.objects.get()
+        self.assertIsNone(message.processed_at)
+        self.assertEqual(message.attempts, 1)
+        self.assertIn('InvalidOperation', message.error)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class RegistrationTests(TestCase):
+    def setUp(self):
+        package = Package.objects.create(name='Pro', package_type='pro', price=Decimal('5000'), description='Pro')
+        self.coupons = coupons.mint(package, 3).coupons.all()
+        self.existing = User.objects.create_user('taken', 'taken@example.com', 'taken-pass-123')
+        UserProfile.objects.create(user=self.existing)
+
+    def register(self, coupon, **fields):
+        return APIClient().post('/api/auth/register/', {
+            'username': 'newcomer', 'email': 'newcomer@example.com',
+            'password': 'newcomer-pass-123', 'confirm_password': 'newcomer-pass-123',
+            'coupon_code': coupon.coupon_code, 'phone_number': '08000000003', **fields,
+        }, format='json')
+
+    def test_taken_username_and_email_are_rejected_by_the_database(self):
+        for fields, message in [({'username': 'taken'}, 'Username already exists'),
+                                ({'email': 'taken@example.com'}, 'Email already exists')]:
+            response = self.register(self.coupons[0], **fields)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.data, {'non_field_errors': [message]})
+        # The failed attempts rolled back, coupon claim included
+        self.assertFalse(Coupon.objects.filter(is_used=True).exists())
+        self.assertEqual(User.objects.count(), 1)
+
+    def test_taken_email_is_looked_up_without_partial_indexes(self):
+        # MySQL: migration 0019 can't add the email index there
+        with mock.patch.object(connection.features, 'supports_partial_indexes', False):
+            response = self.register(self.coupons[0], email='taken@example.com')
+        self.assertEqual(response.data, {'non_field_errors': ['Email already exists']})
+
+    def test_unknown_codes_are_rejected(self):
+        response = self.register(self.coupons[0], referral_code='MS000000')
+        self.assertEqual(response.data, {'non_field_errors': ['Invalid referral code']})
+        self.assertEqual(self.register(self.coupons[0]).status_code, 201)
+        response = self.register(self.coupons[0], username='second', email='second@example.com')
+        self.assertEqual(response.data, {'non_field_errors': ['Invalid or used coupon code']})
+
+    def test_blank_emails_may_repeat(self):
+        User.objects.create_user('admin1', '', 'admin-pass-123')
+        User.objects.create_user('admin2', '', 'admin-pass-123')
+        self.assertEqual(User.objects.filter(email='').count(), 2)
+
+
+class StructuredLoggingTests(TestCase):
+    def record(self, name='api.views', level=logging.INFO, **extra):
+        record = logging.LogRecord(name, level, __file__, 1, 'Withdrawal request received', None, None)
+        record.__dict__.update(extra)
+        return record
+
+    def test_sensitive_fields_are_redacted(self):
+        record = self.record(data={'amount': '1500', 'password': 'hunter22', 'bank': {'account_number': '0123'}},
+                             token='abc')
+        RedactingFilter(['password', 'account_number', 'token']).filter(record)
+        self.assertEqual(record.data, {'amount': '1500', 'password': '[redacted]', 'bank': {'account_number': '[redacted]'}})
+        self.assertEqual(record.token, '[redacted]')
+
+    def test_sampling_keeps_warnings(self):
+        sampler = SamplingFilter({'api': 1.0, 'api.views': 0.0})
+        self.assertFalse(sampler.filter(self.record()))
+        self.assertTrue(sampler.filter(self.record(level=logging.WARNING)))
+        self.assertTrue(sampler.filter(self.record(name='api.models')))
+        self.assertTrue(sampler.filter(self.record(name='api.viewsets')))
+
+    def capture(self, rate):
+        """Records the api loggers emit at INFO while a login and a withdrawal run, sampled at ``rate``"""
+        records = []
+        capture = logging.Handler()
+        capture.emit = records.append
+        capture.addFilter(SamplingFilter({'api': rate}))
+        api_logger = logging.getLogger('api')
+        handlers = mock.patch.object(api_logger, 'handlers', [capture])
+        handlers.start()
+        self.addCleanup(handlers.stop)
+        self.addCleanup(api_logger.setLevel, api_logger.level)
+        api_logger.setLevel(logging.INFO)
+
+        user = User.objects.create_user('audited', 'audited@example.com', 'audit-pass-123')
+        UserProfile.objects.create(user=user)
+        ledger.post(user, Decimal('5000'), 'referral', 'Referral bonus')
+        client = APIClient()
+        client.post('/api/auth/login/', {'username': 'audited', 'password': 'audit-pass-123'}, format='json')
+        client.force_authenticate(user)
+        response = client.post('/api/withdrawals/', {
+            'amount': '1500', 'bank_name': 'Access Bank', 'account_number': '0123456789',
+            'account_name': 'Audited User', 'password': 'audit-pass-123',
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return records
+
+    def test_audit_events_survive_sampling(self):
+        self.assertEqual(settings.LOG_SAMPLE_RATES['api.views'], 1.0)
+        records = self.capture(0.0)
+        self.assertEqual([record.getMessage() for record in records], ['Login succeeded', 'Withdrawal created'])
+
+    def test_request_bodies_are_not_logged(self):
+        records = self.capture(1.0)
+        self.assertIn('Withdrawal request received', [record.getMessage() for record in records])
+        for record in records:
+            fields = json.dumps(extra_fields(record), default=str)
+            for value in ('Access Bank', 'Audited User', '0123456789', 'audit-pass-123'):
+                self.assertNotIn(value, fields)
+
+    def test_records_are_written_as_json_off_thread(self):
+        stream = io.StringIO()
+        handler = QueueLogHandler(stream)
+        handler.addFilter(RedactingFilter(['password']))
+        handler.handle(self.record(user_id=7, data={'password': 'hunter22'}))
+        handler.close()
+        entry = json.loads(stream.getvalue())
+        self.assertEqual(entry['message'], 'Withdrawal request received')
+        self.assertEqual((entry['user_id'], entry['data']), (7, {'password': '[redacted]'}))
+
+
+class ReferralCodeTests(TestCase):
+    def test_codes_are_unique_short_and_reversible(self):
+        ids = list(range(1, 20001)) + [2 ** 30 - 1, 2 ** 30, 2 ** 40 - 1]
+        codes = [referral_code(user_id) for user_id in ids]
+        self.assertEqual(len(set(codes)), len(ids))
+        self.assertEqual(len(referral_code(2 ** 30 - 1)), 8)
+        self.assertEqual([referral_code_user_id(code.lower()) for code in codes], ids)
+        self.assertIsNone(referral_code_user_id('META1234'))
+
+    def test_profiles_get_derived_codes_without_lookups(self):
+        legacy = User.objects.create_user('legacy', 'legacy@example.com', 'legacy-pass-123')
+        UserProfile.objects.create(user=legacy, referral_code='META1234')
+        user = User.objects.create_user('fresh', 'fresh@example.com', 'fresh-pass-123')
+        with self.assertNumQueries(1):
+            profile = UserProfile.objects.create(user=user)
+        self.assertEqual(profile.referral_code, referral_code(user.pk))
+        self.assertEqual(UserProfile.objects.get(user=legacy).referral_code, 'META1234')
+
+
+class CouponMintingTests(TestCase):
+    def setUp(self):
+        self.package = Package.objects.create(name='Silver', package_type='silver', price=Decimal('3000'), description='Silver')
+        self.admin = User.objects.create_superuser('mint_admin', 'mint@example.com', 'mint-pass-123')
+
+    def test_mint_tops_up_codes_that_already_exist(self):
+        taken = [f'METASIL{n:010d}' for n in range(5)]
+        Coupon.objects.bulk_create([Coupon(coupon_code=code, package=self.package) for code in taken])
+        # The first round draws only taken codes; the top-up round fills the batch
+        draws = iter(taken + [f'{n:010d}' for n in range(100, 105)])
+        original = coupons.random_code
+        coupons.random_code = lambda length: next(draws)[-length:]
+        try:
+            batch = coupons.mint(self.package, 5)
+        finally:
+            coupons.random_code = original
+        self.assertEqual(batch.coupons.count(), 5)
+        self.assertEqual(Coupon.objects.count(), 10)
+
+    def test_mint_endpoint_streams_the_batch(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        response = client.post('/api/coupons/mint/', {'package': 'silver', 'quantity': 2500}, format='json')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(lines[0], ','.join(coupons.COUPON_CSV_COLUMNS))
+        codes = [line.split(',')[0] for line in lines[1:]]
+        self.assertEqual(len(set(codes)), 2500)
+        self.assertTrue(all(code.startswith('METASIL') and len(code) == 17 for code in codes))
+        self.assertEqual(Coupon.objects.filter(coupon_code__in=codes, is_used=False, batch__isnull=False).count(), 2500)
+
+        user = User.objects.create_user('not_admin', 'not-admin@example.com', 'not-admin-123')
+        client.force_authenticate(user)
+        self.assertEqual(client.post('/api/coupons/mint/', {'package': 'silver', 'quantity': 1}, format='json').status_code, 403)
+
+
+class CouponRedemptionTests(TransactionTestCase):
+    def setUp(self):
+        package = Package.objects.create(name='Pro', package_type='pro', price=Decimal('5000'), description='Pro')
+        self.coupon = coupons.mint(package, 1).coupons.get()
+        self.users = [User.objects.create_user(f'redeemer{n}', f'redeemer{n}@example.com', 'redeem-pass-123')
+                      for n in range(6)]
+
+    def test_concurrent_redemptions_claim_once(self):
+        winners, errors = [], []
+
+        def redeem(user):
+            try:
+                coupons.redeem(Coupon.objects.get(pk=self.coupon.pk), user)
+                winners.append(user.pk)
+            except coupons.CouponUnavailable:
+                pass
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=redeem, args=(user,)) for user in self.users]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(winners), 1)
+        self.coupon.refresh_from_db()
+        self.assertEqual((self.coupon.is_used, self.coupon.used_by_id), (True, winners[0]))
+
+    def test_filter_knows_minted_codes_only(self):
+        self.assertTrue(coupons.coupon_filter.might_contain(self.coupon.coupon_code))
+        guesses = [f'METAPRO{n:010d}' for n in range(2000)]
+        self.assertLess(sum(coupons.coupon_filter.might_contain(code) for code in guesses), 40)
+        self.assertFalse(coupons.coupon_filter.might_contain(''))
+
+        response = APIClient().post('/api/coupons/validate/', {'coupon_code': self.coupon.coupon_code}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_other_processes_read_only_the_new_coupons(self):
+        other = coupons.CouponCodeFilter()
+        self.assertTrue(other.might_contain(self.coupon.coupon_code))
+        codes = list(coupons.mint(self.coupon.package, 3).coupons.values_list('coupon_code', flat=True))
+
+        # The minting process added them itself; another one reads just the new rows
+        with self.assertNumQueries(0):
+            self.assertTrue(all(coupons.coupon_filter.might_contain(code) for code in codes))
+        other._checked_at = 0.0
+        with mock.patch.object(other, '_build', side_effect=AssertionError('full rebuild')), self.assertNumQueries(1):
+            self.assertTrue(all(other.might_contain(code) for code in codes))
+
+    def test_expired_filter_is_rebuilt_in_the_background(self):
+        other = coupons.CouponCodeFilter()
+        other.might_contain(self.coupon.coupon_code)
+        release, build = threading.Event(), other._build
+
+        def slow_build():
+            release.wait()
+            return build()
+
+        with mock.patch.object(other, '_build', slow_build), self.settings(COUPON_FILTER_MAX_AGE=0):
+            other._checked_at = 0.0
+            # Answered from the current filter while the rebuild waits
+            self.assertTrue(other.might_contain(self.coupon.coupon_code))
+            rebuilder = other._rebuilder
+            self.assertTrue(rebuilder.is_alive())
+            release.set()
+            rebuilder.join()
+        self.assertIsNone(other._rebuilder)
+        self.assertEqual(other._max_id, Coupon.objects.order_by('-pk').values_list('pk', flat=True).first())
+
+
+@override_settings(
+    ROOT_URLCONF='backend.urls_asgi',
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.ScryptPasswordHasher', 'django.contrib.auth.hashers.MD5PasswordHasher'],
+)
+class AsyncPasswordViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('async_user', 'async@example.com', 'async-pass-123')
+        UserProfile.objects.create(user=self.user)
+        ledger.post(self.user, Decimal('5000'), 'referral', 'Referral bonus')
+        self.client = AsyncClient()
+        self.auth = {'Authorization': f'Bearer {RefreshToken.for_user(self.user).access_token}'}
+
+    def login(self, password='async-pass-123'):
+        return self.client.post('/api/auth/login/', {'username': 'async_user', 'password': password},
+                                content_type='application/json')
+
+    async def test_login_hashes_on_the_pool(self):
+        response = await self.login()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['user']['id'], self.user.pk)
+        self.assertTrue(response.json()['token'])
+
+        response = await self.login('wrong-pass-123')
+        self.assertEqual((response.status_code, response.json()), (400, {'error': 'Invalid username or password'}))
+
+    async def test_outdated_hashes_are_upgraded_on_login(self):
+        self.user.password = make_password('async-pass-123', hasher='md5')
+        await self.user.asave(update_fields=['password'])
+
+        self.assertEqual((await self.login()).status_code, 200)
+        await self.user.arefresh_from_db()
+        self.assertTrue(self.user.password.startswith('scrypt$'))
+        self.assertTrue(self.user.check_password('async-pass-123'))
+
+    async def test_full_pool_sheds_with_503(self):
+        release = threading.Event()
+        with self.settings(HASHING_POOL_WORKERS=1, HASHING_POOL_QUEUE=0):
+            blocker = hashing.pool.submit(release.wait)
+            try:
+                response = await self.login()
+            finally:
+                release.set()
+                blocker.result()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual((await self.login()).status_code, 200)
+
+    async def test_withdrawal_checks_password_before_the_viewset(self):
+        withdrawal = {'amount': '1500', 'bank_name': 'Access Bank', 'account_number': '0123456789',
+                      'account_name': 'Async User'}
+        response = await self.client.post('/api/withdrawals/', {**withdrawal, 'password': 'wrong-pass-123'},
+                                          content_type='application/json', headers=self.auth)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Invalid password', response.json()['error'])
+
+        response = await self.client.post('/api/withdrawals/', {**withdrawal, 'password': 'async-pass-123'},
+                                          content_type='application/json', headers=self.auth)
+        self.assertEqual(response.status_code, 201)
+
+        # Everything else still goes through the viewset as before
+        response = await self.client.get('/api/withdrawals/', headers=self.auth)
+        self.assertEqual(len(response.json()['results']), 1)
+        response = await self.client.post('/api/withdrawals/', withdrawal, content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+
+    async def test_withdrawal_retries_replay_without_hashing(self):
+        withdrawal = {'amount': '1500', 'bank_name': 'Access Bank', 'account_number': '0123456789',
+                      'account_name': 'Async User', 'password': 'async-pass-123'}
+        headers = {**self.auth, 'Idempotency-Key': 'async-withdrawal-1'}
+        first = await self.client.post('/api/withdrawals/', withdrawal, content_type='application/json', headers=headers)
+        self.assertEqual(first.status_code, 201)
+
+        # With the pool full a fresh request is shed, but a retry never reaches the hasher
+        release = threading.Event()
+        with self.settings(HASHING_POOL_WORKERS=1, HASHING_POOL_QUEUE=0):
+            blocker = hashing.pool.submit(release.wait)
+            try:
+                retry = await self.client.post('/api/withdrawals/', withdrawal, content_type='application/json',
+                                               headers=headers)
+                fresh = await self.client.post('/api/withdrawals/', withdrawal, content_type='application/json',
+                                               headers={**self.auth, 'Idempotency-Key': 'async-withdrawal-2'})
+            finally:
+                release.set()
+                blocker.result()
+        self.assertEqual((retry.status_code, retry['Idempotent-Replayed']), (201, 'true'))
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(fresh.status_code, 503)
+        self.assertEqual(await WithdrawalRequest.objects.filter(user=self.user).acount(), 1)
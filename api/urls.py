@@ -9,8 +9,7 @@ router.register(r'user-profiles', views.UserProfileViewSet, basename='userprofil
 router.register(r'content', views.ContentSubmissionViewSet, basename='content')
 router.register(r'referrals', views.ReferralViewSet, basename='referral')
 router.register(r'withdrawals', views.WithdrawalViewSet, basename='withdrawal')
-# Remove the TransactionViewSet line since it doesn't exist in your views
-# router.register(r'transactions', views.TransactionViewSet, basename='transaction')
+router.register(r'transactions', views.TransactionViewSet, basename='transaction')
 
 urlpatterns = [
     # Authentication endpoints
@@ -24,6 +23,7 @@ urlpatterns = [
     path('api/dashboard/', views.DashboardView.as_view(), name='dashboard'),
     path('api/profile/', views.ProfileView.as_view(), name='profile'),
     path('api/wallet/balance/', views.WalletView.as_view(), name='wallet-balance'),
+    path('api/cache/stats/', views.CacheStatsView.as_view(), name='cache-stats'),
     
     # Daily Login endpoint
     path('api/daily-login/', views.DailyLoginView.as_view(), name='daily-login'),
@@ -35,6 +35,9 @@ urlpatterns = [
     # Referral stats endpoint
     path('api/referrals/stats/', views.ReferralViewSet.as_view({'get': 'stats'}), name='referral-stats'),
     
+    # Paystack transfer webhooks
+    path('api/webhooks/paystack/', views.PaystackWebhookView.as_view(), name='paystack-webhook'),
+    
     # Include router URLs last
     path('api/', include(router.urls)),
 ]
\ No newline at end of file
@@ -1,3 +1,5 @@
+import logging
+
 from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
 from django.utils import timezone
@@ -6,14 +8,23 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 from rest_framework_simplejwt.tokens import RefreshToken
 from decimal import Decimal
 import random
 from .models import *
 from .serializers import *
-from django.db.models import Sum
-from datetime import timedelta
+from .cache import cached_user_response, get_stats
+from .catalog import package_catalog
+from .idempotency import idempotent
+from .log import AUDIT
+from . import coupons, ledger, registration, webhooks
+from django.db.models import Q, Sum
+from datetime import datetime, time, timedelta
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+
+logger = logging.getLogger(__name__)
 
 
 # JWT Token generation helper
@@ -24,121 +35,118 @@ def get_tokens_for_user(user):
         'access': str(refresh.access_token),
     }
 
+
+def login_response_data(user, phone_number='', whatsapp_number=''):
+    """Tokens and user details for a successful login (shared with api/async_views.py)"""
+    # Update phone number or whatsapp number if provided
+    if phone_number or whatsapp_number:
+        try:
+            profile = user.userprofile
+            if phone_number:
+                profile.phone_number = phone_number
+            if whatsapp_number:
+                profile.whatsapp_number = whatsapp_number
+            profile.save()
+        except UserProfile.DoesNotExist:
+            UserProfile.objects.create(
+                user=user, 
+                phone_number=phone_number,
+                whatsapp_number=whatsapp_number
+            )
+    
+    # Get or create user profile
+    profile, created = UserProfile.objects.get_or_create(user=user)
+    
+    # Generate JWT tokens
+    tokens = get_tokens_for_user(user)
+    
+    # Prepare user data
+    user_data = {
+        'id': user.id,
+        'username': user.username,
+        'email': user.email,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'phone_number': profile.phone_number,
+        'whatsapp_number': profile.whatsapp_number,
+        'wallet_balance': float(profile.wallet_balance),
+        'total_earnings': float(profile.total_earnings),
+        'referral_code': profile.referral_code,
+        'package': {
+            'id': profile.package.id if profile.package else None,
+            'name': profile.package.name if profile.package else None,
+            'type': profile.package.package_type if profile.package else None,
+            'price': float(profile.package.price) if profile.package else 0,
+        } if profile.package else None
+    }
+    
+    return {
+        'token': tokens['access'],
+        'refresh': tokens['refresh'],
+        'user': user_data
+    }
+
 # Authentication Views
 class AuthView(APIView):
     permission_classes = [AllowAny]
     
     def post(self, request):
-        print("📝 Registration request received:", request.data)
+        logger.info('Registration request received')
         
         serializer = SignupSerializer(data=request.data)
         
         if not serializer.is_valid():
-            print("❌ Serializer errors:", serializer.errors)
+            logger.info('Registration rejected', extra={'errors': serializer.errors})
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         
-        print("✅ Serializer is valid")
-        
+        data = serializer.validated_data
         try:
-            with transaction.atomic():
-                data = serializer.validated_data
-                
-                # Create user
-                user = User.objects.create_user(
-                    username=data['username'],
-                    email=data['email'],
-                    password=data['password']
-                )
-                print(f"✅ User created: {user.username}")
-                
-                # Get coupon and package
-                coupon = data['coupon']
-                package = coupon.package
-                
-                # Create user profile with package
-                profile = UserProfile.objects.create(
-                    user=user,
-                    package=package,
-                    phone_number=data.get('phone_number', ''),
-                )
-                print(f"✅ Profile created for: {user.username} with package: {package.name}")
-                
-                # Mark coupon as used
-                coupon.is_used = True
-                coupon.used_by = user
-                coupon.used_at = timezone.now()
-                coupon.save()
-                print(f"✅ Coupon marked as used: {coupon.coupon_code}")
-                
-                # Handle referral if provided
-                if data.get('referrer'):
-                    referrer = data['referrer']
-                    
-                    # Fixed referral bonuses based on referee's package
-                    if package.package_type == 'pro':
-                        referral_bonus = Decimal('4000.00')  # ₦4000 for Pro referral
-                    elif package.package_type == 'silver':
-                        referral_bonus = Decimal('3000.00')  # ₦3000 for Silver referral
-                    else:
-                        referral_bonus = Decimal('2000.00')  # Default for other packages
-                    
-                    # Create referral record
-                    referral = Referral.objects.create(
-                        referrer=referrer,
-                        referee=user,
-                        reward_earned=referral_bonus,
-                        referee_package=package.package_type
-                    )
-                    
-                    # Add referral bonus to referrer's wallet
-                    referrer_profile = referrer.userprofile
-                    referrer_profile.wallet_balance += referral_bonus
-                    referrer_profile.total_earnings += referral_bonus
-                    referrer_profile.save()
-                    
-                    # Create transaction for referrer
-                    Transaction.objects.create(
-                        user=referrer,
-                        amount=referral_bonus,
-                        transaction_type='referral',
-                        description=f'Referral bonus for {user.username} ({package.package_type.title()} package)'
-                    )
-                    
-                    print(f"✅ Referral created for: {referrer.username} with bonus: ₦{referral_bonus}")
-                
-                # Generate JWT tokens
-                tokens = get_tokens_for_user(user)
-                print(f"✅ JWT tokens generated for: {user.username}")
-                
-                # Prepare user data for response
-                user_data = {
-                    'id': user.id,
-                    'username': user.username,
-                    'email': user.email,
-                    'first_name': user.first_name,
-                    'last_name': user.last_name,
-                    'phone_number': profile.phone_number,
-                    'wallet_balance': float(profile.wallet_balance),
-                    'total_earnings': float(profile.total_earnings),
-                    'referral_code': profile.referral_code,
-                    'package': {
-                        'id': package.id,
-                        'name': package.name,
-                        'type': package.package_type,
-                        'price': float(package.price),
-                    } if package else None
-                }
-                
-                return Response({
-                    'token': tokens['access'],
-                    'refresh': tokens['refresh'],
-                    'user': user_data
-                }, status=status.HTTP_201_CREATED)
-                
+            user, profile, package = registration.register(
+                username=data['username'],
+                email=data['email'],
+                password=data['password'],
+                coupon_code=data['coupon_code'],
+                phone_number=data.get('phone_number', ''),
+                referral_code=data.get('referral_code', ''),
+            )
+            
+            # Generate JWT tokens
+            tokens = get_tokens_for_user(user)
+            logger.info('User registered', extra={
+                'user_id': user.id, 'package': package.package_type, 'coupon': data['coupon_code'], **AUDIT,
+            })
+            
+            # Prepare user data for response
+            user_data = {
+                'id': user.id,
+                'username': user.username,
+                'email': user.email,
+                'first_name': user.first_name,
+                'last_name': user.last_name,
+                'phone_number': profile.phone_number,
+                'wallet_balance': float(profile.wallet_balance),
+                'total_earnings': float(profile.total_earnings),
+                'referral_code': profile.referral_code,
+                'package': {
+                    'id': package.id,
+                    'name': package.name,
+                    'type': package.package_type,
+                    'price': float(package.price),
+                } if package else None
+            }
+            
+            return Response({
+                'token': tokens['access'],
+                'refresh': tokens['refresh'],
+                'user': user_data
+            }, status=status.HTTP_201_CREATED)
+            
+        except registration.RegistrationError as e:
+            # Same shape as the serializer's own validation errors
+            logger.info('Registration rejected', extra={'errors': str(e)})
+            return Response({'non_field_errors': [str(e)]}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
-            print(f"❌ Error during registration: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception('Registration failed')
             return Response(
                 {"error": f"Registration failed: {str(e)}"}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -149,7 +157,7 @@ class LoginView(APIView):
     permission_classes = [AllowAny]
     
     def post(self, request):
-        print("🔐 Login request received:", request.data)
+        logger.info('Login request received', extra={'username': request.data.get('username')})
         
         serializer = LoginSerializer(data=request.data)
         
@@ -165,56 +173,11 @@ class LoginView(APIView):
         user = authenticate(username=username, password=password)
         
         if user is not None:
-            # Update phone number or whatsapp number if provided
-            if phone_number or whatsapp_number:
-                try:
-                    profile = user.userprofile
-                    if phone_number:
-                        profile.phone_number = phone_number
-                    if whatsapp_number:
-                        profile.whatsapp_number = whatsapp_number
-                    profile.save()
-                except UserProfile.DoesNotExist:
-                    UserProfile.objects.create(
-                        user=user, 
-                        phone_number=phone_number,
-                        whatsapp_number=whatsapp_number
-                    )
-            
-            # Get or create user profile
-            profile, created = UserProfile.objects.get_or_create(user=user)
-            
-            # Generate JWT tokens
-            tokens = get_tokens_for_user(user)
-            
-            # Prepare user data
-            user_data = {
-                'id': user.id,
-                'username': user.username,
-                'email': user.email,
-                'first_name': user.first_name,
-                'last_name': user.last_name,
-                'phone_number': profile.phone_number,
-                'whatsapp_number': profile.whatsapp_number,
-                'wallet_balance': float(profile.wallet_balance),
-                'total_earnings': float(profile.total_earnings),
-                'referral_code': profile.referral_code,
-                'package': {
-                    'id': profile.package.id if profile.package else None,
-                    'name': profile.package.name if profile.package else None,
-                    'type': profile.package.package_type if profile.package else None,
-                    'price': float(profile.package.price) if profile.package else 0,
-                } if profile.package else None
-            }
-            
-            print(f"✅ Login successful for: {user.username}")
-            return Response({
-                'token': tokens['access'],
-                'refresh': tokens['refresh'],
-                'user': user_data
-            })
+            data = login_response_data(user, phone_number, whatsapp_number)
+            logger.info('Login succeeded', extra={'user_id': user.id, **AUDIT})
+            return Response(data)
         else:
-            print("❌ Login failed: Invalid credentials")
+            logger.info('Login failed', extra={'username': username, **AUDIT})
             return Response({
                 'error': 'Invalid username or password'
             }, status=status.HTTP_400_BAD_REQUEST)
@@ -244,34 +207,34 @@ class ValidateCouponView(APIView):
     def post(self, request):
         coupon_code = request.data.get('coupon_code')
         
-        print(f"🎫 Coupon validation request: {coupon_code}")
-        
         if not coupon_code:
-            print("❌ No coupon code provided")
             return Response(
                 {"error": "Coupon code is required"},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
         try:
+            # Guessed codes stop here, without a query
+            if not coupons.coupon_filter.might_contain(coupon_code):
+                raise Coupon.DoesNotExist()
             coupon = Coupon.objects.get(coupon_code=coupon_code, is_used=False)
-            print(f"✅ Valid coupon found: {coupon.coupon_code} for {coupon.package.name}")
+            package = package_catalog.get(coupon.package_id)
             return Response({
                 'valid': True,
                 'package': {
-                    'id': coupon.package.id,
-                    'name': coupon.package.name,
-                    'price': float(coupon.package.price)
+                    'id': package['id'],
+                    'name': package['name'],
+                    'price': float(package['price'])
                 }
             })
         except Coupon.DoesNotExist:
-            print(f"❌ Invalid or used coupon: {coupon_code}")
+            logger.info('Invalid or used coupon', extra={'coupon': coupon_code})
             return Response({
                 'valid': False,
                 'error': 'Invalid or used coupon code'
             }, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
-            print(f"❌ Coupon validation error: {str(e)}")
+            logger.exception('Coupon validation failed', extra={'coupon': coupon_code})
             return Response({
                 'valid': False,
                 'error': 'Server error during coupon validation'
@@ -294,108 +257,77 @@ class DashboardView(APIView):
     permission_classes = [IsAuthenticated]
     
     def get(self, request):
+        return cached_user_response('dashboard', request.user, lambda: self.build(request))
+    
+    def build(self, request):
         try:
-            profile = request.user.userprofile
+            profile = UserProfile.objects.get(user=request.user)
             submissions = ContentSubmission.objects.filter(user=request.user)
-            referrals = Referral.objects.filter(referrer=request.user)
             transactions = Transaction.objects.filter(user=request.user)
             
             # Import serializers here to avoid circular imports
-            from .serializers import (
-                PackageSerializer, TransactionSerializer, 
-                ContentSubmissionSerializer
-            )
-            
-            # Calculate platform-specific earnings from APPROVED/PAID submissions
-            platform_earnings = {
-                'tiktok': Decimal('0'),
-                'instagram': Decimal('0'),
-                'facebook': Decimal('0')
-            }
+            from .serializers import TransactionSerializer, ContentSubmissionSerializer
             
-            approved_submissions = submissions.filter(status__in=['approved', 'paid'])
-            total_platform_earnings = Decimal('0')
+            platforms = [choice[0] for choice in ContentSubmission.PLATFORM_CHOICES]
             
-            for submission in approved_submissions:
-                platform = submission.platform.lower()
-                if platform in platform_earnings:
-                    platform_earnings[platform] += submission.earnings
-                    total_platform_earnings += submission.earnings
-            
-            print(f"💰 Platform earnings - TikTok: {platform_earnings['tiktok']}, Instagram: {platform_earnings['instagram']}, Facebook: {platform_earnings['facebook']}, Total: {total_platform_earnings}")
-            print(f"💰 Profile total_earnings: {profile.total_earnings}")
-            
-            # Calculate earnings breakdown from transactions (only positive amounts)
-            earnings_breakdown = {
-                'content': Decimal('0'),
-                'referrals': Decimal('0'),
-                'games': Decimal('0'),
-                'daily_login': Decimal('0')
+            # Platform stats, earnings breakdown and referral totals come from
+            # the incrementally maintained summary row (one primary key lookup)
+            summary = UserEarningsSummary.objects.for_user(request.user)
+            platform_stats = {platform: summary.platform_stats(platform) for platform in platforms}
+            platform_earnings = {
+                platform: stats['earnings'] for platform, stats in platform_stats.items()
             }
+            total_platform_earnings = sum(platform_earnings.values(), Decimal('0'))
             
-            for transaction in transactions.filter(amount__gt=0):
-                if transaction.transaction_type in earnings_breakdown:
-                    earnings_breakdown[transaction.transaction_type] += transaction.amount
+            logger.debug('Dashboard earnings', extra={
+                'user_id': request.user.id, 'platform_earnings': platform_earnings,
+                'total_platform_earnings': total_platform_earnings, 'total_earnings': profile.total_earnings,
+            })
             
             # Use profile.total_earnings as the source of truth
             total_balance = profile.total_earnings
             
-            # Safe referral total calculation
-            try:
-                referral_total = float(sum([r.reward_earned for r in referrals]))
-            except Exception as e:
-                print(f"⚠️ Error calculating referral total: {e}")
-                referral_total = float(earnings_breakdown['referrals'])
+            referral_count = summary.referral_count
+            referral_total = float(summary.referral_total)
             
-            recent_submissions = submissions.order_by('-submission_date')[:10]
+            recent_submissions = submissions.select_related('user').order_by('-submission_date')[:10]
             
             data = {
                 'wallet_balance': float(profile.wallet_balance),
                 'total_earnings': float(total_balance),
                 'total_balance': float(total_balance),
-                'package': PackageSerializer(profile.package).data if profile.package else None,
-                'submission_count': submissions.count(),
-                'referral_count': referrals.count(),
+                'package': package_catalog.get(profile.package_id),
+                'submission_count': summary.submission_count,
+                'referral_count': referral_count,
                 'recent_transactions': TransactionSerializer(
-                    transactions.order_by('-date')[:5],
+                    transactions.select_related('user').order_by('-date')[:5],
                     many=True
                 ).data,
                 'recent_submissions': ContentSubmissionSerializer(
                     recent_submissions, many=True
                 ).data,
                 'referral_stats': {
-                    'total_referrals': referrals.count(),
+                    'total_referrals': referral_count,
                     'total_earned': referral_total
                 },
                 'earnings_breakdown': {
                     'content': float(total_platform_earnings),  # Use actual platform earnings
-                    'referrals': float(earnings_breakdown['referrals']),
-                    'games': float(earnings_breakdown['games']),
-                    'daily_login': float(earnings_breakdown['daily_login'])
+                    'referrals': float(summary.referral_earnings),
+                    'games': float(summary.game_earnings),
+                    'daily_login': float(summary.daily_login_earnings)
                 },
                 'platform_stats': {
-                    'tiktok': {
-                        'earnings': float(platform_earnings['tiktok']),
-                        'submissions': submissions.filter(platform='tiktok').count(),
-                        'approved': submissions.filter(platform='tiktok', status__in=['approved', 'paid']).count()
-                    },
-                    'instagram': {
-                        'earnings': float(platform_earnings['instagram']),
-                        'submissions': submissions.filter(platform='instagram').count(),
-                        'approved': submissions.filter(platform='instagram', status__in=['approved', 'paid']).count()
-                    },
-                    'facebook': {
-                        'earnings': float(platform_earnings['facebook']),
-                        'submissions': submissions.filter(platform='facebook').count(),
-                        'approved': submissions.filter(platform='facebook', status__in=['approved', 'paid']).count()
+                    platform: {
+                        'earnings': float(platform_earnings[platform]),
+                        'submissions': platform_stats[platform]['submissions'],
+                        'approved': platform_stats[platform]['approved']
                     }
+                    for platform in platforms
                 }
             }
             return Response(data)
         except Exception as e:
-            print(f"❌ Dashboard error: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception('Dashboard failed')
             return Response(
                 {"error": f"Failed to load dashboard data: {str(e)}"}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -404,9 +336,11 @@ class DashboardView(APIView):
 class DailyLoginView(APIView):
     permission_classes = [IsAuthenticated]
     
+    @idempotent
     def post(self, request):
         user = request.user
-        profile = user.userprofile
+        # Fresh row: request.user's profile may come from the auth cache
+        profile = UserProfile.objects.select_related('package').get(user=user)
         
         # Check if user already claimed today
         today = timezone.now().date()
@@ -444,34 +378,43 @@ class DailyLoginView(APIView):
         # NO streak bonus multiplier - use exact base amounts
         final_bonus = base_bonus  # Remove streak multiplier
         
-        # Update user profile - add to BOTH wallet_balance AND total_earnings
-        profile.wallet_balance += final_bonus
-        profile.total_earnings += final_bonus
-        profile.last_daily_login = timezone.now()
-        profile.login_streak = current_streak
-        profile.save()
-        
-        # Create transaction
-        Transaction.objects.create(
-            user=user,
-            amount=final_bonus,
-            transaction_type='daily_login',
-            description=f'Daily login bonus - {profile.package.name if profile.package else "Basic"}'
-        )
+        # Only claims if last_daily_login is still what we read, so two
+        # concurrent requests can't both collect today's bonus
+        if profile.last_daily_login:
+            unclaimed = Q(last_daily_login=profile.last_daily_login)
+        else:
+            unclaimed = Q(last_daily_login__isnull=True)
         
-        # Create game participation record
-        game = GameParticipation.objects.create(
-            user=user,
-            game_type='daily_login',
-            reward_earned=final_bonus,
-            game_data={
-                'type': 'daily_login', 
-                'base_bonus': float(base_bonus),
-                'final_bonus': float(final_bonus),
-                'streak_count': current_streak,
-                'package_type': profile.package.package_type if profile.package else 'none'
-            }
-        )
+        with transaction.atomic():
+            # Add to BOTH wallet_balance AND total_earnings
+            try:
+                ledger.post(
+                    user,
+                    final_bonus,
+                    'daily_login',
+                    f'Daily login bonus - {profile.package.name if profile.package else "Basic"}',
+                    condition=unclaimed,
+                    last_daily_login=timezone.now(),
+                    login_streak=current_streak
+                )
+            except ledger.ConditionFailed:
+                return Response({
+                    'error': 'Daily login bonus already claimed today'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
+            # Create game participation record
+            game = GameParticipation.objects.create(
+                user=user,
+                game_type='daily_login',
+                reward_earned=final_bonus,
+                game_data={
+                    'type': 'daily_login', 
+                    'base_bonus': float(base_bonus),
+                    'final_bonus': float(final_bonus),
+                    'streak_count': current_streak,
+                    'package_type': profile.package.package_type if profile.package else 'none'
+                }
+            )
         
         return Response({
             'success': True,
@@ -488,15 +431,18 @@ class CouponViewSet(viewsets.ModelViewSet):
     queryset = Coupon.objects.all()
     serializer_class = CouponSerializer
     permission_classes = [IsAuthenticated]
+    cursor_ordering = ('-created_at', '-id')
 
     @action(detail=False, methods=['post'], permission_classes=[AllowAny])
     def validate(self, request):
         coupon_code = request.data.get('coupon_code')
         try:
+            if not coupons.coupon_filter.might_contain(coupon_code):
+                raise Coupon.DoesNotExist()
             coupon = Coupon.objects.get(coupon_code=coupon_code, is_used=False)
             return Response({
                 'valid': True,
-                'package': PackageSerializer(coupon.package).data
+                'package': package_catalog.get(coupon.package_id)
             })
         except Coupon.DoesNotExist:
             return Response({
@@ -504,17 +450,34 @@ class CouponViewSet(viewsets.ModelViewSet):
                 'error': 'Invalid or used coupon code'
             }, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=['post'], permission_classes=[IsAdminUser])
+    def mint(self, request):
+        """Mint a batch of coupons for a package and stream them back as CSV"""
+        serializer = CouponMintSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        batch = coupons.mint(
+            serializer.validated_data['package'], serializer.validated_data['quantity'], operator=request.user
+        )
+        logger.info('Coupon batch minted', extra={
+            'batch_id': batch.pk, 'package': batch.package.package_type, 'quantity': batch.quantity, **AUDIT,
+        })
+        response = coupons.coupon_csv_response(batch)
+        response.status_code = status.HTTP_201_CREATED
+        return response
+
 class PackageViewSet(viewsets.ModelViewSet):
     queryset = Package.objects.all()
     serializer_class = PackageSerializer
     permission_classes = [AllowAny]
+    cursor_ordering = ('id',)
 
 class UserProfileViewSet(viewsets.ModelViewSet):
     serializer_class = UserProfileSerializer
     permission_classes = [IsAuthenticated]
+    cursor_ordering = ('id',)
 
     def get_queryset(self):
-        return UserProfile.objects.filter(user=self.request.user)
+        return UserProfile.objects.filter(user=self.request.user).select_related('user')
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -523,23 +486,17 @@ class ContentSubmissionViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     serializer_class = ContentSubmissionSerializer
     queryset = ContentSubmission.objects.all()
+    cursor_ordering = ('-submission_date', '-id')
     
     def get_queryset(self):
-        return ContentSubmission.objects.filter(user=self.request.user)
+        return ContentSubmission.objects.filter(user=self.request.user).select_related('user')
     
     def perform_create(self, serializer):
         try:
-            # Save the submission with the current user
-            submission = serializer.save(user=self.request.user)
-            
-            # Set initial status and earnings
-            submission.status = 'pending'
-            submission.earnings = 0
-            submission.save()
-            
-            return submission
+            # Save the submission with the current user, initial status and earnings
+            return serializer.save(user=self.request.user, status='pending', earnings=0)
         except Exception as e:
-            print(f"Error creating submission: {e}")
+            logger.exception('Content submission failed', extra={'user_id': self.request.user.id})
             raise
     
     def create(self, request, *args, **kwargs):
@@ -555,17 +512,19 @@ class ContentSubmissionViewSet(viewsets.ModelViewSet):
 class ReferralViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = [IsAuthenticated]
     serializer_class = ReferralSerializer
+    cursor_ordering = ('-referral_date', '-id')
     
     def get_queryset(self):
-        return Referral.objects.filter(referrer=self.request.user)
+        return Referral.objects.filter(referrer=self.request.user).select_related('referrer', 'referee')
     
     @action(detail=False, methods=['get'])
     def stats(self, request):
         user = request.user
         referrals = Referral.objects.filter(referrer=user)
+        summary = UserEarningsSummary.objects.for_user(user)
         
-        total_referrals = referrals.count()
-        total_earned = referrals.aggregate(total=Sum('reward_earned'))['total'] or 0
+        total_referrals = summary.referral_count
+        total_earned = summary.referral_total
         pending_earnings = referrals.filter(is_paid=False).aggregate(total=Sum('reward_earned'))['total'] or 0
         
         return Response({
@@ -574,18 +533,74 @@ class ReferralViewSet(viewsets.ReadOnlyModelViewSet):
             'pending_earnings': float(pending_earnings)
         })
     
+class TransactionViewSet(viewsets.ReadOnlyModelViewSet):
+    """Transaction history, newest first.
+
+    Filters: ?transaction_type=game&date_from=2025-01-01&date_to=2025-01-31
+    """
+    permission_classes = [IsAuthenticated]
+    serializer_class = TransactionSerializer
+    cursor_ordering = ('-date', '-id')
+    
+    def get_queryset(self):
+        queryset = Transaction.objects.filter(user=self.request.user).select_related('user')
+        params = self.request.query_params
+        
+        transaction_type = params.get('transaction_type')
+        if transaction_type:
+            if transaction_type not in dict(Transaction.TRANSACTION_TYPES):
+                raise ValidationError({'transaction_type': f'Unknown transaction type: {transaction_type}'})
+            queryset = queryset.filter(transaction_type=transaction_type)
+        
+        date_from = self._parse_date_param('date_from')
+        if date_from:
+            queryset = queryset.filter(date__gte=date_from)
+        
+        date_to = self._parse_date_param('date_to', end_of_day=True)
+        if date_to:
+            queryset = queryset.filter(date__lt=date_to)
+        
+        return queryset
+    
+    def _parse_date_param(self, name, end_of_day=False):
+        """Accept a date (whole day) or an ISO datetime; returns an aware datetime"""
+        value = self.request.query_params.get(name)
+        if not value:
+            return None
+        
+        day = parse_date(value)
+        if day is not None:
+            if end_of_day:
+                day += timedelta(days=1)
+            parsed = datetime.combine(day, time.min)
+        else:
+            parsed = parse_datetime(value)
+            if parsed is None:
+                raise ValidationError({name: 'Use YYYY-MM-DD or an ISO 8601 datetime'})
+            if end_of_day:
+                # date_to is exclusive for datetimes, so include the instant itself
+                parsed += timedelta(microseconds=1)
+        
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        return parsed
+
 class ProfileView(APIView):
     permission_classes = [IsAuthenticated]
     
     def get(self, request):
+        return cached_user_response('profile', request.user, lambda: self.build(request))
+    
+    def build(self, request):
         try:
-            profile = request.user.userprofile
+            # Not request.user.userprofile: that comes from the auth cache, which balance updates don't drop
+            profile = UserProfile.objects.select_related('user').get(user=request.user)
             serializer = UserProfileSerializer(profile)
             return Response(serializer.data)
         except UserProfile.DoesNotExist:
             return Response({"error": "Profile not found"}, status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
-            print(f"❌ Profile fetch error: {str(e)}")
+            logger.exception('Profile fetch failed')
             return Response({"error": "Failed to fetch profile"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
 
@@ -593,31 +608,59 @@ class WalletView(APIView):
     permission_classes = [IsAuthenticated]
     
     def get(self, request):
-        profile = request.user.userprofile
+        return cached_user_response('wallet', request.user, lambda: self.build(request))
+    
+    def build(self, request):
+        profile = UserProfile.objects.get(user=request.user)
         return Response({
             'balance': float(profile.wallet_balance),
             'total_earnings': float(profile.total_earnings)
         })
 
+class CacheStatsView(APIView):
+    permission_classes = [IsAdminUser]
+    
+    def get(self, request):
+        return Response(get_stats())
+
+class PaystackWebhookView(APIView):
+    # Paystack authenticates with the body signature, not a user token (and sends no CSRF token)
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def post(self, request):
+        # Verify against the raw bytes: re-serialised JSON wouldn't match the signature
+        body = request.body
+        if not webhooks.valid_signature(body, request.headers.get('X-Paystack-Signature', '')):
+            return Response({'error': 'Invalid signature'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Store and acknowledge; process_paystack_events applies the event
+        if webhooks.record(body) is None:
+            return Response({'error': 'Invalid payload'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'status': 'received'})
+
 class WithdrawalViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
+    # Created by the user, then moved only by the payout flow: no PUT/PATCH/DELETE
+    http_method_names = ['get', 'post', 'head', 'options']
+    cursor_ordering = ('-created_at', '-id')
     
     def get_queryset(self):
-        return WithdrawalRequest.objects.filter(user=self.request.user)
+        return WithdrawalRequest.objects.filter(user=self.request.user).select_related('user__userprofile__package')
     
     def get_serializer_class(self):
         if self.action == 'create':
             return WithdrawalRequestCreateSerializer
         return WithdrawalRequestSerializer
     
+    @idempotent
     def create(self, request, *args, **kwargs):
         try:
             user = request.user
             password = request.data.get('password')
             amount = Decimal(request.data.get('amount', 0))
             
-            print(f"🔍 Withdrawal request received - User: {user.username}, Amount: {amount}")
-            print(f"🔍 Request data: {request.data}")
+            logger.info('Withdrawal request received', extra={'user_id': user.id, 'amount': amount})
             
             # Verify password
             if not password:
@@ -626,22 +669,14 @@ class WithdrawalViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
-            if not user.check_password(password):
+            # Under ASGI, api/async_views.py has already checked it off the event loop
+            if not getattr(request, 'password_checked', False) and not user.check_password(password):
                 return Response(
                     {"error": "Invalid password. Please check your password and try again."}, 
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
-            print("✅ Password verified")
-            
-            # Check if user has sufficient balance
-            profile = user.userprofile
-            if amount > profile.wallet_balance:
-                return Response(
-                    {"error": f"Insufficient balance. Available: ₦{profile.wallet_balance}"}, 
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            
+            # Sufficient balance is enforced by the ledger's conditional UPDATE below
             if amount < Decimal('1000'):
                 return Response(
                     {"error": "Minimum withdrawal amount is ₦1,000"}, 
@@ -669,39 +704,43 @@ class WithdrawalViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
-            print("✅ Serializer is valid")
-            
-            # DEDUCT FROM BOTH WALLET BALANCE AND TOTAL EARNINGS
-            profile.wallet_balance -= amount
-            profile.total_earnings -= amount  # ADD THIS LINE - deduct from total balance too
-            profile.save()
-            print(f"✅ Wallet and total earnings updated. New wallet balance: {profile.wallet_balance}, New total earnings: {profile.total_earnings}")
-            
-            # Create withdrawal with user explicitly set
-            withdrawal = serializer.save(user=user)
-            print(f"✅ Withdrawal created successfully: {withdrawal.id}")
+            try:
+                with transaction.atomic():
+                    # DEDUCT FROM BOTH WALLET BALANCE AND TOTAL EARNINGS, only if the
+                    # wallet still covers it at the moment of the UPDATE
+                    ledger.post(
+                        user,
+                        -amount,
+                        'payout',
+                        f'Withdrawal to {request.data.get("bank_name")} - {request.data.get("account_number")}',
+                        require_funds=True
+                    )
+                    
+                    # Create withdrawal with user explicitly set
+                    withdrawal = serializer.save(user=user)
+            except ledger.InsufficientFunds as exc:
+                # The balance the guard checked, not a fresh ledger sum that might disagree with it
+                return Response(
+                    {"error": f"Insufficient balance. Available: ₦{exc.available}"}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
             
-            # Create transaction record
-            Transaction.objects.create(
-                user=user,
-                amount=-amount,
-                transaction_type='payout',
-                description=f'Withdrawal to {request.data.get("bank_name")} - {request.data.get("account_number")}'
-            )
-            print("✅ Transaction record created")
+            wallet_balance, total_earnings = ledger.balances(user)
+            logger.info('Withdrawal created', extra={
+                'user_id': user.id, 'withdrawal_id': withdrawal.id, 'amount': amount, 'wallet_balance': wallet_balance,
+                **AUDIT,
+            })
             
             return Response({
                 'success': True,
                 'message': f'Withdrawal request of ₦{amount} submitted successfully!',
                 'withdrawal_id': withdrawal.id,
-                'new_balance': float(profile.wallet_balance),
-                'new_total_earnings': float(profile.total_earnings)  # Include this in response
+                'new_balance': float(wallet_balance),
+                'new_total_earnings': float(total_earnings)  # Include this in response
             }, status=status.HTTP_201_CREATED)
             
         except Exception as e:
-            print(f"❌ Withdrawal error: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception('Withdrawal failed', extra={'user_id': request.user.id})
             error_message = str(e)
             if 'NOT NULL constraint' in error_message:
                 error_message = "System error: Could not process withdrawal. Please try again."
@@ -715,23 +754,27 @@ class GameViewSet(viewsets.ViewSet):
     permission_classes = [IsAuthenticated]
     
     @action(detail=False, methods=['post'])
+    @idempotent
     def play(self, request):
         game_type = request.data.get('game_type')
         user = request.user
-        profile = user.userprofile
+        # Fresh row: request.user's profile may come from the auth cache
+        profile = UserProfile.objects.select_related('package').get(user=user)
         
         if not game_type:
             return Response({'error': 'Game type is required'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Check if user already played this game today
-        today = timezone.now().date()
-        last_game = GameParticipation.objects.filter(
+        # Check if user already played this game today (a range on the raw
+        # column, so game_user_type_date_idx covers the whole lookup)
+        today_start = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+        played_today = GameParticipation.objects.filter(
             user=user, 
             game_type=game_type,
-            participation_date__date=today
-        ).first()
+            participation_date__gte=today_start,
+            participation_date__lt=today_start + timedelta(days=1)
+        ).exists()
         
-        if last_game:
+        if played_today:
             return Response({
                 'error': f'You have already played {self.get_game_name(game_type)} today'
             }, status=status.HTTP_400_BAD_REQUEST)
@@ -756,31 +799,27 @@ class GameViewSet(viewsets.ViewSet):
         reward_variation = random.uniform(0.8, 1.5)
         reward = round(base_reward * Decimal(reward_variation), 2)
         
-        # Create game participation
-        game = GameParticipation.objects.create(
-            user=user,
-            game_type=game_type,
-            reward_earned=reward,
-            game_data={
-                'base_reward': float(base_reward), 
-                'multiplier': reward_variation,
-                'game_type': game_type
-            }
-        )
-        
-        # Update user wallet
-        profile.wallet_balance += reward
-        profile.total_earnings += reward
-        profile.last_daily_game = timezone.now()
-        profile.save()
-        
-        # Create transaction
-        Transaction.objects.create(
-            user=user,
-            amount=reward,
-            transaction_type='game',
-            description=f'{self.get_game_name(game_type)} reward'
-        )
+        with transaction.atomic():
+            # Create game participation
+            game = GameParticipation.objects.create(
+                user=user,
+                game_type=game_type,
+                reward_earned=reward,
+                game_data={
+                    'base_reward': float(base_reward), 
+                    'multiplier': reward_variation,
+                    'game_type': game_type
+                }
+            )
+            
+            # Update user wallet
+            ledger.post(
+                user,
+                reward,
+                'game',
+                f'{self.get_game_name(game_type)} reward',
+                last_daily_game=timezone.now()
+            )
         
         return Response({
             'success': True,
@@ -791,7 +830,7 @@ class GameViewSet(viewsets.ViewSet):
     
     @action(detail=False, methods=['get'])
     def history(self, request):
-        games = GameParticipation.objects.filter(user=request.user).order_by('-participation_date')[:20]
+        games = GameParticipation.objects.filter(user=request.user).select_related('user').order_by('-participation_date')[:20]
         serializer = GameParticipationSerializer(games, many=True)
         return Response(serializer.data)
     
@@ -811,14 +850,12 @@ class GameHistoryView(APIView):
     def get(self, request):
         try:
             # Get game participation history for the user
-            games = GameParticipation.objects.filter(user=request.user).order_by('-participation_date')[:20]
+            games = GameParticipation.objects.filter(user=request.user).select_related('user').order_by('-participation_date')[:20]
             from .serializers import GameParticipationSerializer
             serializer = GameParticipationSerializer(games, many=True)
             return Response(serializer.data)
         except Exception as e:
-            print(f"❌ Game history error: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception('Game history failed')
             return Response(
                 {"error": f"Failed to fetch game history: {str(e)}"}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
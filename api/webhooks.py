@@ -0,0 +1,115 @@
+"""Paystack webhook ingestion.
+
+The endpoint only verifies the signature and stores the raw event (one
+INSERT, duplicates ignored), so it answers in constant time however many
+events Paystack sends at once. process_pending() applies them later, from
+the process_paystack_events worker.
+"""
+import hashlib
+import hmac
+import json
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import PaystackEvent, WithdrawalRequest
+from .payouts import withdrawal_id_from_reference
+
+# Transfer events and the withdrawal status each one moves to
+TRANSFER_OUTCOMES = {
+    'transfer.success': 'completed',
+    'transfer.failed': 'failed',
+    'transfer.reversed': 'failed',
+}
+
+# Give up on an event after this many failed processing attempts
+MAX_ATTEMPTS = 5
+
+
+def valid_signature(body, signature):
+    """Paystack signs the raw body with HMAC-SHA512 keyed by the secret key"""
+    if not settings.PAYSTACK_SECRET_KEY or not signature:
+        return False
+    expected = hmac.new(settings.PAYSTACK_SECRET_KEY.encode(), body, hashlib.sha512).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+def event_id(payload, body):
+    data = payload.get('data') or {}
+    subject = data.get('id') or data.get('reference') or hashlib.sha256(body).hexdigest()
+    return f'{payload.get("event", "unknown")}:{subject}'[:100]
+
+
+def record(body):
+    """Store a verified webhook body; redeliveries of the same event are dropped by the unique key.
+
+    Returns the parsed payload, or None if the body isn't a JSON object.
+    """
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return None
+    if not isinstance(payload, dict):
+        return None
+    PaystackEvent.objects.bulk_create([
+        PaystackEvent(event_id=event_id(payload, body), event=str(payload.get('event', ''))[:50], payload=payload)
+    ], ignore_conflicts=True)
+    return payload
+
+
+def apply(event):
+    """Move the event's withdrawal to completed/failed. Safe to run more than once."""
+    status = TRANSFER_OUTCOMES.get(event.event)
+    if status is None:
+        return 'ignored'
+
+    data = event.payload.get('data') or {}
+    withdrawal_id = withdrawal_id_from_reference(data.get('reference'))
+    withdrawal = WithdrawalRequest.objects.select_for_update().filter(pk=withdrawal_id).first()
+    if withdrawal is None:
+        return 'unknown reference'
+    if withdrawal.status == status:
+        return 'already applied'
+    if not WithdrawalRequest.status_machine.allows(withdrawal.status, status):
+        raise ValueError(f'Withdrawal {withdrawal.pk} is {withdrawal.status}; {event.event} needs manual review')
+
+    withdrawal.status = status
+    if data.get('transfer_code'):
+        withdrawal.transfer_code = data['transfer_code']
+    if status == 'failed':
+        withdrawal.failure_reason = f'Paystack {event.event}: {data.get("reason") or data.get("status") or "no reason given"}'
+    # enter_failed refunds the wallet through the ledger
+    withdrawal.save()
+    return status
+
+
+def process_pending(batch_size=100):
+    """Apply queued events oldest first; each event and its withdrawal change commit together.
+
+    Events are claimed with SKIP LOCKED where supported, so several workers
+    can run side by side. Returns {outcome: count}.
+    """
+    outcomes, last_id = {}, 0
+    while True:
+        with transaction.atomic():
+            # Events that error stay queued for the next run; last_id stops this one retrying them in a loop
+            events = list(
+                PaystackEvent.objects.filter(processed_at__isnull=True, attempts__lt=MAX_ATTEMPTS, id__gt=last_id)
+                .order_by('id').select_for_update(skip_locked=True)[:batch_size]
+            )
+            if not events:
+                return outcomes
+            last_id = events[-1].id
+            for event in events:
+                try:
+                    with transaction.atomic():
+                        outcome = apply(event)
+                    event.processed_at = timezone.now()
+                    event.error = ''
+                except Exception as exc:
+                    outcome = 'error'
+                    event.error = str(exc)
+                event.attempts += 1
+                outcomes[outcome] = outcomes.get(outcome, 0) + 1
+            PaystackEvent.objects.bulk_update(events, ['processed_at', 'error', 'attempts'])
@@ -3,6 +3,10 @@ ASGI config for backend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Served with e.g. ``gunicorn backend.asgi:application -k uvicorn.workers.UvicornWorker``.
+Routes come from backend/urls_asgi.py, which hashes passwords off the event
+loop (api/async_views.py).
+
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 """
@@ -12,5 +16,6 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+os.environ.setdefault("ROOT_URLCONF", "backend.urls_asgi")
 
 application = get_asgi_application()
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 
 
 import os
+import sys
 from pathlib import Path
 from datetime import timedelta
 from dotenv import load_dotenv
@@ -83,11 +84,12 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'api.middleware.WhiteNoiseMiddleware',
 
 ]
 
-ROOT_URLCONF = 'backend.urls'
+# backend/asgi.py switches this to backend.urls_asgi
+ROOT_URLCONF = config('ROOT_URLCONF', default='backend.urls')
 
 TEMPLATES = [
     {
@@ -122,6 +124,10 @@ else:
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': BASE_DIR / 'db.sqlite3',
+            # Wait for concurrent writers instead of failing with "database is locked"
+            'OPTIONS': {'timeout': 20},
+            # File-backed so threaded tests get real separate connections
+            'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
         }
     }
 
@@ -138,9 +144,42 @@ DATABASES = {
     }
 }"""
 
+# Locmem by default; point CACHE_BACKEND/CACHE_LOCATION at a shared cache
+# (e.g. django.core.cache.backends.redis.RedisCache) when running several workers
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='meta-shark'),
+    }
+}
+
+# Seconds a cached dashboard/wallet/profile payload may live without a write
+USER_CACHE_TIMEOUT = config('USER_CACHE_TIMEOUT', default=300, cast=int)
+
+# Seconds CachedJWTAuthentication keeps a resolved user + profile + package
+AUTH_USER_CACHE_TIMEOUT = config('AUTH_USER_CACHE_TIMEOUT', default=60, cast=int)
+
+# Coupon code filter in front of the public validate endpoints (api/coupons.py): codes it
+# is sized for before false positives pass 1%, and seconds before a forced rebuild
+COUPON_FILTER_CAPACITY = config('COUPON_FILTER_CAPACITY', default=1000000, cast=int)
+COUPON_FILTER_MAX_AGE = config('COUPON_FILTER_MAX_AGE', default=300, cast=int)
+
+# Run outbox messages right after their transaction commits instead of in the
+# process_outbox worker (development without a worker running)
+OUTBOX_EAGER = config('OUTBOX_EAGER', default=False, cast=bool)
+
+# Seconds a stored Idempotency-Key response stays in the cache (the database copy is kept)
+IDEMPOTENCY_KEY_TIMEOUT = config('IDEMPOTENCY_KEY_TIMEOUT', default=86400, cast=int)
+
+# Paystack transfers for withdrawal payouts; leave the key empty to pay out by hand (CSV export)
+PAYSTACK_SECRET_KEY = config('PAYSTACK_SECRET_KEY', default='')
+PAYSTACK_BASE_URL = config('PAYSTACK_BASE_URL', default='https://api.paystack.co')
+PAYSTACK_TIMEOUT = config('PAYSTACK_TIMEOUT', default=10, cast=float)
+PAYSTACK_MAX_RETRIES = config('PAYSTACK_MAX_RETRIES', default=3, cast=int)
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'api.authentication.JWTAuthentication',
+        'api.authentication.CachedJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.TokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
@@ -149,6 +188,8 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.KeysetPagination',
+    'PAGE_SIZE': 20,
 }
 
 SIMPLE_JWT = {
@@ -179,6 +220,24 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Preferred password hasher. Passwords stored with any other hasher in
+# PASSWORD_HASHERS (or an older work factor) are re-hashed on next login
+PASSWORD_HASHER = config('PASSWORD_HASHER', default='django.contrib.auth.hashers.PBKDF2PasswordHasher')
+PASSWORD_HASHERS = [PASSWORD_HASHER] + [
+    hasher for hasher in [
+        'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+        'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+        'django.contrib.auth.hashers.Argon2PasswordHasher',
+        'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+        'django.contrib.auth.hashers.ScryptPasswordHasher',
+    ] if hasher != PASSWORD_HASHER
+]
+
+# Threads hashing passwords for the async login/withdrawal views (api/hashing.py), and how
+# many more checks may wait for one before requests are shed with a 503
+HASHING_POOL_WORKERS = config('HASHING_POOL_WORKERS', default=os.cpu_count() or 1, cast=int)
+HASHING_POOL_QUEUE = config('HASHING_POOL_QUEUE', default=16, cast=int)
+
 # Internationalization
 LANGUAGE_CODE = 'en-us'
 TIME_ZONE = 'Africa/Lagos'
@@ -206,3 +265,45 @@ CORS_ALLOWED_ORIGINS = [
 
 CORS_ALLOW_ALL_ORIGINS = config('CORS_ALLOW_ALL_ORIGINS', default=DEBUG, cast=bool)
 CORS_ALLOW_CREDENTIALS = True
+
+
+# Logging: api/log.py. JSON lines written from a background thread, with
+# sensitive fields redacted and chatty loggers sampled. Log the ids and
+# amounts a record needs, never a whole request body
+LOG_LEVEL = config('LOG_LEVEL', default='INFO')
+
+# manage.py test: keep app logs out of the test output (tests that check logging attach their own handler)
+TESTING = len(sys.argv) > 1 and sys.argv[1] == 'test'
+
+# Fraction of INFO/DEBUG records kept per logger. Warnings, errors and audit
+# records (money movements, sign-ups, logins) are always kept
+LOG_SAMPLE_RATES = {
+    'api': config('LOG_SAMPLE_RATE', default=1.0, cast=float),
+    'api.views': config('LOG_SAMPLE_RATE_VIEWS', default=1.0, cast=float),
+}
+
+LOG_REDACT_FIELDS = [
+    'password', 'confirm_password', 'old_password', 'new_password', 'token', 'access', 'refresh',
+    'authorization', 'account_number', 'secret_key',
+]
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'sample': {'()': 'api.log.SamplingFilter', 'rates': LOG_SAMPLE_RATES},
+        'redact': {'()': 'api.log.RedactingFilter', 'fields': LOG_REDACT_FIELDS},
+    },
+    'handlers': {
+        'queue': {
+            '()': 'api.log.QueueLogHandler',
+            'stream': 'ext://sys.stdout',
+            'filters': ['sample', 'redact'],
+        },
+        'null': {'class': 'logging.NullHandler'},
+    },
+    'loggers': {
+        'api': {'handlers': ['null' if TESTING else 'queue'], 'level': LOG_LEVEL, 'propagate': False},
+        'payments': {'handlers': ['null' if TESTING else 'queue'], 'level': LOG_LEVEL, 'propagate': False},
+    },
+}
@@ -62,11 +62,11 @@ X_FRAME_OPTIONS = 'DENY'
 # SESSION_COOKIE_SECURE = True
 # CSRF_COOKIE_SECURE = True
 
-# Logging
+# Logging: the app's structured queue logging from settings.py, plus Django's errors to a file
 LOGGING = {
-    'version': 1,
-    'disable_existing_loggers': False,
+    **LOGGING,
     'handlers': {
+        **LOGGING['handlers'],
         'file': {
             'level': 'ERROR',
             'class': 'logging.FileHandler',
@@ -74,6 +74,7 @@ LOGGING = {
         },
     },
     'loggers': {
+        **LOGGING['loggers'],
         'django': {
             'handlers': ['file'],
             'level': 'ERROR',
@@ -0,0 +1,15 @@
+"""
+URL configuration for the ASGI entry point (backend/asgi.py).
+
+The same routes as backend/urls.py, with the endpoints that check a
+password swapped for their async versions in api/async_views.py.
+"""
+
+from django.urls import path, re_path
+from api import async_views
+from .urls import urlpatterns as wsgi_urlpatterns
+
+urlpatterns = [
+    path('api/auth/login/', async_views.LoginView.as_view(), name='login'),
+    re_path(r'^api/withdrawals/$', async_views.WithdrawalView.as_view(), name='withdrawal-list'),
+] + wsgi_urlpatterns
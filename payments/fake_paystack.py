@@ -0,0 +1,199 @@
+"""A local stand-in for the Paystack Transfers API, for tests and throughput benchmarks.
+
+    server = FakePaystack(secret_key='sk_test_local').start()
+    client = PaystackClient('sk_test_local', base_url=server.url)
+    ...
+    server.stop()
+
+or run it standalone: ``python -m payments.fake_paystack --port 8765``.
+It speaks HTTP/1.1 keep-alive like the real API, de-duplicates transfers by
+reference and can inject latency and transient failures.
+"""
+import argparse
+import itertools
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BANKS = [
+    {'name': 'Access Bank', 'code': '044'},
+    {'name': 'GTBank', 'code': '058'},
+    {'name': 'Guaranty Trust Bank', 'code': '058'},
+    {'name': 'Opay', 'code': '999992'},
+    {'name': 'Zenith Bank', 'code': '057'},
+    {'name': 'First Bank of Nigeria', 'code': '011'},
+    {'name': 'United Bank For Africa', 'code': '033'},
+]
+
+
+class FakePaystack:
+    def __init__(self, secret_key='sk_test_local', host='127.0.0.1', port=0, latency=0.0):
+        self.secret_key = secret_key
+        self.latency = latency
+        self.transfers = {}
+        self.request_count = 0
+        self.connections = 0
+        self._failures = []
+        self._lock = threading.Lock()
+        self._codes = itertools.count(1)
+        self._thread = None
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def fail_next(self, count=1, status=500, retry_after=None):
+        """Answer the next ``count`` API calls with ``status`` instead of handling them"""
+        with self._lock:
+            self._failures.extend([(status, retry_after)] * count)
+
+    def set_transfer_status(self, reference, status):
+        self.transfers[reference]['status'] = status
+
+    def _next_code(self, prefix):
+        with self._lock:
+            return f'{prefix}_{next(self._codes):010d}'
+
+    def _transfer(self, item):
+        """Create (or return the existing) transfer for item['reference']"""
+        with self._lock:
+            existing = self.transfers.get(item['reference'])
+        if existing:
+            return existing
+        transfer = {
+            'reference': item['reference'],
+            'recipient': item['recipient'],
+            'amount': item['amount'],
+            'currency': 'NGN',
+            'reason': item.get('reason', ''),
+            'transfer_code': self._next_code('TRF'),
+            'status': 'received' if item['amount'] > 0 else 'failed',
+        }
+        with self._lock:
+            return self.transfers.setdefault(item['reference'], transfer)
+
+    def handle(self, method, path, body):
+        """Returns (status, payload) for one API call"""
+        if method == 'GET' and path == '/bank':
+            return 200, {'status': True, 'message': 'Banks retrieved', 'data': BANKS}
+
+        if method == 'POST' and path == '/transferrecipient/bulk':
+            success = [
+                {
+                    'recipient_code': self._next_code('RCP'),
+                    'name': recipient['name'],
+                    'details': {'account_number': recipient['account_number'], 'bank_code': recipient['bank_code']},
+                }
+                for recipient in body['batch']
+            ]
+            return 200, {'status': True, 'message': 'Recipients added', 'data': {'success': success, 'errors': []}}
+
+        if method == 'POST' and path == '/transfer/bulk':
+            data = [self._transfer(item) for item in body['transfers']]
+            return 200, {'status': True, 'message': f'{len(data)} transfers queued', 'data': data}
+
+        if method == 'POST' and path == '/transfer':
+            return 200, {'status': True, 'message': 'Transfer has been queued', 'data': self._transfer(body)}
+
+        match = re.fullmatch(r'/transfer/verify/([\w-]+)', path)
+        if method == 'GET' and match:
+            transfer = self.transfers.get(match.group(1))
+            if transfer is None:
+                return 404, {'status': False, 'message': 'Transfer not found'}
+            return 200, {'status': True, 'message': 'Transfer retrieved', 'data': transfer}
+
+        return 404, {'status': False, 'message': f'No route for {method} {path}'}
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body go out as separate writes; don't let Nagle hold the body back
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with fake._lock:
+                    fake.connections += 1
+
+            def log_message(self, format, *args):
+                pass
+
+            def _respond(self, status, payload, headers=None):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _dispatch(self, method):
+                length = int(self.headers.get('Content-Length') or 0)
+                raw = self.rfile.read(length) if length else b''
+                with fake._lock:
+                    fake.request_count += 1
+                    failure = fake._failures.pop(0) if fake._failures else None
+                if fake.latency:
+                    time.sleep(fake.latency)
+
+                if self.headers.get('Authorization') != f'Bearer {fake.secret_key}':
+                    return self._respond(401, {'status': False, 'message': 'Invalid key'})
+                if failure:
+                    status, retry_after = failure
+                    headers = {'Retry-After': str(retry_after)} if retry_after is not None else None
+                    return self._respond(status, {'status': False, 'message': 'Injected failure'}, headers)
+
+                path = self.path.split('?', 1)[0]
+                try:
+                    body = json.loads(raw) if raw else {}
+                    status, payload = fake.handle(method, path, body)
+                except (KeyError, TypeError, ValueError) as exc:
+                    status, payload = 400, {'status': False, 'message': f'Bad request: {exc}'}
+                self._respond(status, payload)
+
+            def do_GET(self):
+                self._dispatch('GET')
+
+            def do_POST(self):
+                self._dispatch('POST')
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--secret-key', default='sk_test_local')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every response')
+    args = parser.parse_args()
+
+    server = FakePaystack(args.secret_key, args.host, args.port, args.latency)
+    print(f'Fake Paystack listening on {server.url} (secret key {args.secret_key})')
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == '__main__':
+    main()
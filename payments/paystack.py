@@ -0,0 +1,180 @@
+"""Paystack Transfers API client.
+
+One PaystackClient holds a pooled requests.Session, so consecutive calls
+reuse warm TLS connections instead of handshaking every time. Calls that
+fail with a connection error, a timeout, 429 or a 5xx are retried with
+exponential backoff (honouring Retry-After). Retrying transfer POSTs is
+safe because Paystack de-duplicates transfers by ``reference``.
+"""
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_BASE_URL = 'https://api.paystack.co'
+
+# Paystack accepts at most this many items per bulk call
+BULK_LIMIT = 100
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class PaystackError(Exception):
+    def __init__(self, message, status_code=None, payload=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.payload = payload
+
+
+def to_kobo(amount):
+    """Naira (Decimal) to the integer kobo Paystack expects"""
+    return int((amount * 100).to_integral_value())
+
+
+class PaystackClient:
+    def __init__(self, secret_key, base_url=DEFAULT_BASE_URL, timeout=10, max_retries=3, backoff=0.5,
+                 pool_size=10, session=None):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.session = session or self._build_session(pool_size)
+        self.session.headers.update({
+            'Authorization': f'Bearer {secret_key}',
+            'Content-Type': 'application/json',
+        })
+        self._bank_codes = None
+
+    @staticmethod
+    def _build_session(pool_size):
+        session = requests.Session()
+        # Retries are ours (they need to understand Paystack's responses), not urllib3's
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def close(self):
+        self.session.close()
+
+    def _sleep_before_retry(self, attempt, response=None):
+        delay = self.backoff * (2 ** attempt) * (1 + random.random() / 2)
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, int(retry_after))
+        time.sleep(delay)
+
+    def request(self, method, path, payload=None, params=None):
+        """Send one API call and return its ``data``, retrying transient failures"""
+        url = f'{self.base_url}/{path.lstrip("/")}'
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            try:
+                response = self.session.request(method, url, json=payload, params=params, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as exc:
+                if last_attempt:
+                    raise PaystackError(f'{method} {path} failed: {exc}') from exc
+                self._sleep_before_retry(attempt)
+                continue
+
+            if response.status_code in RETRY_STATUSES and not last_attempt:
+                self._sleep_before_retry(attempt, response)
+                continue
+
+            try:
+                body = response.json()
+            except ValueError:
+                body = {'message': response.text[:200]}
+            if response.status_code >= 400 or not body.get('status', False):
+                raise PaystackError(
+                    f'{method} {path} returned {response.status_code}: {body.get("message", "")}',
+                    status_code=response.status_code,
+                    payload=body
+                )
+            return body.get('data')
+
+    # Banks and recipients
+
+    def bank_codes(self):
+        """{lowercased bank name: bank code} for Nigerian banks, fetched once per client"""
+        if self._bank_codes is None:
+            banks = self.request('GET', '/bank', params={'country': 'nigeria', 'perPage': 500})
+            self._bank_codes = {bank['name'].strip().lower(): bank['code'] for bank in banks}
+        return self._bank_codes
+
+    def bank_code(self, bank_name):
+        return self.bank_codes().get(bank_name.strip().lower())
+
+    def create_recipients(self, recipients):
+        """Bulk-create NUBAN transfer recipients.
+
+        ``recipients`` is a list of dicts with name, account_number and
+        bank_code. Returns {(account_number, bank_code): recipient_code} for
+        the ones Paystack accepted.
+        """
+        codes = {}
+        for start in range(0, len(recipients), BULK_LIMIT):
+            chunk = recipients[start:start + BULK_LIMIT]
+            data = self.request('POST', '/transferrecipient/bulk', {
+                'batch': [{'type': 'nuban', 'currency': 'NGN', **recipient} for recipient in chunk],
+            })
+            for created in data.get('success', []):
+                details = created.get('details', {})
+                codes[(details.get('account_number'), details.get('bank_code'))] = created['recipient_code']
+        return codes
+
+    # Transfers
+
+    def bulk_transfer(self, transfers):
+        """Initiate many transfers from the Paystack balance, BULK_LIMIT per call.
+
+        ``transfers`` is a list of dicts with amount (kobo), recipient,
+        reference and reason. Returns Paystack's per-transfer results (each
+        with reference, transfer_code and status).
+        """
+        results = []
+        for start in range(0, len(transfers), BULK_LIMIT):
+            chunk = transfers[start:start + BULK_LIMIT]
+            results.extend(self.request('POST', '/transfer/bulk', {
+                'currency': 'NGN',
+                'source': 'balance',
+                'transfers': chunk,
+            }))
+        return results
+
+    def transfer(self, amount, recipient, reference, reason=''):
+        return self.request('POST', '/transfer', {
+            'source': 'balance',
+            'amount': amount,
+            'recipient': recipient,
+            'reference': reference,
+            'reason': reason,
+        })
+
+    def verify_transfer(self, reference):
+        return self.request('GET', f'/transfer/verify/{reference}')
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Process-wide client built from settings, so every caller shares one connection pool"""
+    global _client
+    if _client is None:
+        from django.conf import settings
+
+        if not settings.PAYSTACK_SECRET_KEY:
+            raise PaystackError('PAYSTACK_SECRET_KEY is not configured')
+        with _client_lock:
+            if _client is None:
+                _client = PaystackClient(
+                    settings.PAYSTACK_SECRET_KEY,
+                    base_url=settings.PAYSTACK_BASE_URL,
+                    timeout=settings.PAYSTACK_TIMEOUT,
+                    max_retries=settings.PAYSTACK_MAX_RETRIES,
+                )
+    return _client